@@ -1,11 +1,8 @@
-import requests
 import pandas as pd
-import json
-import time
 from tqdm import tqdm
-import os
 
-NPPES_API_URL = "https://npiregistry.cms.hhs.gov/api/"
+from src.ingestion.nppes import NPPESClient
+
 OUTLIER_NPIS = [
     1669411377, 1700809829, 1689892473, 1396023164, 1699707968, 
     1790021517, 1376939678, 1811925308, 1285685578, 1093864589, 
@@ -14,64 +11,32 @@ OUTLIER_NPIS = [
     1609061969, 1134178999, 1396134185, 1346504172
 ]
 
-def get_npi_details(npi):
-    params = {
-        "version": "2.1",
-        "number": npi
-    }
-    try:
-        response = requests.get(NPPES_API_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        results = data.get("results", [])
-        if not results:
-            return None
-            
-        res = results[0]
-        basic = res.get("basic", {})
-        
-        # Determine Name (Org vs Individual)
-        name = basic.get("organization_name")
-        if not name:
-            fname = basic.get("first_name", "")
-            lname = basic.get("last_name", "")
-            name = f"{fname} {lname}".strip()
-            
-        # Extract Taxonomy
-        taxonomies = res.get("taxonomies", [])
-        primary_tax = next((t for t in taxonomies if t.get("primary")), taxonomies[0] if taxonomies else {})
-        specialty = primary_tax.get("desc", "Unknown")
-        
-        # Extract Address
-        addresses = res.get("addresses", [])
-        practice_addr = next((a for a in addresses if a.get("address_purpose") == "LOCATION"), addresses[0] if addresses else {})
-        city = practice_addr.get("city", "Unknown")
-        state = practice_addr.get("state", "Unknown")
-        postal = practice_addr.get("postal_code", "Unknown")
-        
-        return {
-            "NPI": npi,
-            "Name": name,
-            "Specialty": specialty,
-            "City": city,
-            "State": state,
-            "PostalCode": postal,
-            "OrgType": res.get("enumeration_type", "Unknown")
-        }
-    except Exception as e:
-        print(f"Error fetching NPI {npi}: {e}")
+def get_npi_details(npi, client):
+    details = client.lookup_npi(npi)
+    if not details:
         return None
+    return {
+        "NPI": npi,
+        "Name": details["name"],
+        "Specialty": details["taxonomy_desc"],
+        "City": details["city"],
+        "State": details["state"],
+        "PostalCode": details["postal_code"],
+        "OrgType": details["org_type"]
+    }
 
 def main():
     print(f"Enriching {len(OUTLIER_NPIS)} outlier NPIs...")
     enriched_data = []
+    client = NPPESClient()
     
+    # Cached and rate limited by the shared client
     for npi in tqdm(OUTLIER_NPIS):
-        details = get_npi_details(npi)
+        details = get_npi_details(npi, client)
         if details:
             enriched_data.append(details)
-        time.sleep(0.5)
+    print(client.stats_summary())
+    client.close()
         
     df = pd.DataFrame(enriched_data)
     output_path = "data/processed/outlier_entity_details.csv"
@@ -1,90 +1,82 @@
-import requests
 import duckdb
-import time
+import pandas as pd
 from tqdm import tqdm
 
-NPPES_API_URL = "https://npiregistry.cms.hhs.gov/api/"
 from src.config import settings
+from src.api.cache import publish_generation
+from src.analysis.rollup import refresh_provider_details
+from src.ingestion.nppes import NPPESClient
 
-def get_npi_details(npi):
-    params = {"version": "2.1", "number": npi}
-    try:
-        response = requests.get(NPPES_API_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        results = data.get("results", [])
-        if not results: return None
-        res = results[0]
-        basic = res.get("basic", {})
-        name = basic.get("organization_name") or f"{basic.get('first_name', '')} {basic.get('last_name', '')}".strip()
-        taxonomies = res.get("taxonomies", [])
-        primary_tax = next((t for t in taxonomies if t.get("primary")), taxonomies[0] if taxonomies else {})
-        practice_addr = next((a for a in res.get("addresses", []) if a.get("address_purpose") == "LOCATION"), res.get("addresses", [{}])[0])
-        mailing_addr = next((a for a in res.get("addresses", []) if a.get("address_purpose") == "MAILING"), res.get("addresses", [{}])[0])
-        
-        # Authorized Official Details (Inside basic object with prefix)
-        basic = res.get("basic", {})
-        auth_name = f"{basic.get('authorized_official_first_name', '')} {basic.get('authorized_official_last_name', '')}".strip()
-        
-        return {
-            "npi": npi,
-            "name": name,
-            "taxonomy_desc": primary_tax.get("desc", "Unknown"),
-            "org_type": res.get("enumeration_type", "Unknown"),
-            "city": practice_addr.get("city", "Unknown"),
-            "state": practice_addr.get("state", "Unknown"),
-            "postal_code": practice_addr.get("postal_code", "Unknown"),
-            "auth_official_name": auth_name or None,
-            "auth_official_title": basic.get("authorized_official_title_or_position"),
-            "auth_official_phone": basic.get("authorized_official_telephone_number"),
-            "mailing_address": mailing_addr.get("address_1"),
-            "mailing_city": mailing_addr.get("city"),
-            "mailing_state": mailing_addr.get("state"),
-            "mailing_zip": mailing_addr.get("postal_code")
-        }
-    except Exception:
-        return None
+DETAIL_COLUMNS = [
+    "npi", "name", "taxonomy_desc", "org_type", "city", "state", "postal_code",
+    "auth_official_name", "auth_official_title", "auth_official_phone",
+    "mailing_address", "mailing_city", "mailing_state", "mailing_zip", "practice_address"
+]
 
-def main(batch_size=100):
+def apply_provider_details(conn, details):
+    """Write a batch of enrichment results back with one set-based UPDATE."""
+    if not details:
+        return 0
+    staged_details = pd.DataFrame(details, columns=DETAIL_COLUMNS).astype(object)
+    staged_details["npi"] = staged_details["npi"].astype(str)
+    assignments = ", ".join(f"{col} = s.{col}" for col in DETAIL_COLUMNS if col != "npi")
+    conn.execute(f"""
+        UPDATE providers
+        SET {assignments}, last_updated = CURRENT_TIMESTAMP
+        FROM staged_details s
+        WHERE providers.npi = s.npi
+    """)
+    return len(details)
+
+def main(batch_size=100, client=None):
     conn = duckdb.connect(settings.DB_PATH)
-    
-    # Find NPIs that need enrichment (missing official data)
+
+    # Find NPIs that need enrichment (missing official data, or older than the cache TTL)
     # Prioritize flagged providers
     query = """
-        SELECT p.npi FROM providers p 
+        SELECT p.npi FROM providers p
         LEFT JOIN risk_flags f ON p.npi = f.npi
-        WHERE p.auth_official_name IS NULL 
-        GROUP BY 1 
-        ORDER BY COUNT(f.flag_type) DESC 
+        WHERE p.auth_official_name IS NULL
+           OR p.last_updated < CAST(now() AS TIMESTAMP) - to_seconds(CAST(? AS DOUBLE))
+        GROUP BY 1
+        ORDER BY COUNT(f.flag_type) DESC
         LIMIT ?
     """
-    unnamed_npis = [r[0] for r in conn.execute(query, [batch_size]).fetchall()]
-    
+    ttl_seconds = settings.NPPES_CACHE_TTL_DAYS * 86400
+    unnamed_npis = [r[0] for r in conn.execute(query, [ttl_seconds, batch_size]).fetchall()]
+
     if not unnamed_npis:
         print("All providers already enriched.")
+        conn.close()
         return
 
-    print(f"Enriching {len(unnamed_npis)} providers...")
-    for npi in tqdm(unnamed_npis):
-        details = get_npi_details(npi)
+    owns_client = client is None
+    client = client or NPPESClient()
+    print(f"Enriching {len(unnamed_npis)} providers "
+          f"({client.concurrency} workers, {client.bucket.rate:g} req/s)...")
+
+    # Lookups run concurrently; results are flushed in set-based batches as they arrive.
+    # Stale cache entries are refetched: rows written here are stamped last_updated = now.
+    pending, updated = [], []
+    for npi, details in tqdm(client.lookup_many(unnamed_npis, allow_stale=False), total=len(unnamed_npis)):
         if details:
-            conn.execute("""
-                UPDATE providers 
-                SET name = ?, taxonomy_desc = ?, org_type = ?, city = ?, state = ?, postal_code = ?, 
-                    auth_official_name = ?, auth_official_title = ?, auth_official_phone = ?,
-                    mailing_address = ?, mailing_city = ?, mailing_state = ?, mailing_zip = ?,
-                    last_updated = CURRENT_TIMESTAMP
-                WHERE npi = ?
-            """, [
-                details["name"], details["taxonomy_desc"], details["org_type"], details["city"], details["state"], details["postal_code"],
-                details["auth_official_name"], details["auth_official_title"], details["auth_official_phone"],
-                details["mailing_address"], details["mailing_city"], details["mailing_state"], details["mailing_zip"],
-                npi
-            ])
-        time.sleep(0.2) # Faster rate since we have many
+            pending.append(details)
+            updated.append(npi)
+        if len(pending) >= settings.NPPES_WRITE_BATCH_SIZE:
+            apply_provider_details(conn, pending)
+            pending = []
+    apply_provider_details(conn, pending)
 
+    print(client.stats_summary())
+    if owns_client:
+        client.close()
+    if updated:
+        refresh_provider_details(conn, updated)
     conn.close()
-    print("Batch enrichment complete.")
+    print(f"Batch enrichment complete. Updated {len(updated)} providers.")
+    if updated:
+        # The API switches to the new snapshot and reindexes the updated providers for search
+        print(f"Published database generation {publish_generation()}.")
 
 if __name__ == "__main__":
     import sys
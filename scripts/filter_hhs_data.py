@@ -1,51 +1,252 @@
-import duckdb
+import argparse
 import os
 from src.config import settings
+from src.instrumentation import connect
+from src.ingestion.hhs_mirror import sync_hhs_mirror, mirror_relation
+from src.ingestion.ledger import latest_ingest_run_id, loaded_periods
+from src.ingestion.scopes import load_county_scopes, scope_map_frame
 
-def filter_hhs_spend():
+def hhs_source_relation(conn, months=None, manifest=None):
     """
-    Leverage DuckDB to stream and filter HHS data directly from the remote zip file.
-    This eliminates the need to download and extract the 3GB+ file locally.
+    Table expression for the HHS spend source plus a release identifier: the local
+    Parquet mirror when enabled (converted once per release), otherwise the remote CSV stream.
+    With `months` ('YYYY-MM'), only those months' mirror partitions are read.
     """
-    conn = duckdb.connect(settings.DB_PATH)
-    
-    print(f"Streaming and filtering HHS data for {settings.TARGET_COUNTY}, {settings.TARGET_STATE}...")
-    
-    # CMS/HHS data has a specific schema. 
+    if settings.USE_HHS_MIRROR:
+        manifest = manifest or sync_hhs_mirror()
+        release = manifest.get("etag") or manifest.get("last_modified") or manifest["url"]
+        present = None if months is None else [m for m in months if m in manifest["months"]]
+        # No partition to read: the month filter in the staging query leaves the scan empty
+        return mirror_relation(present or None), f"{manifest['url']}@{release}"
+
     # Note: DuckDB's httpfs extension allows reading directly from URLs.
     conn.execute("INSTALL httpfs; LOAD httpfs;")
+    return f"read_csv('{settings.HHS_SOURCE_URL}', header=True)", settings.HHS_SOURCE_URL
+
+def months_to_refresh(conn, manifest):
+    """
+    Months worth rescanning for the counties in TEMP scope_fingerprints: mirror
+    months not yet compared for a county under its current NPI set and source
+    checksum (see hhs_source_months), plus loaded months gone from the mirror.
+    """
+    changed = {r[0] for r in conn.execute("""
+        SELECT sm.month
+        FROM source_months sm
+        CROSS JOIN scope_fingerprints k
+        LEFT JOIN hhs_source_months h ON h.state = k.state AND h.county = k.county AND h.month = sm.month
+        WHERE h.source_checksum IS DISTINCT FROM sm.checksum
+           OR h.scope_fingerprint IS DISTINCT FROM k.fingerprint
+    """).fetchall()}
+    scope_keys = set(conn.execute("SELECT state, county FROM scope_fingerprints").fetchall())
+    gone = {period.strftime("%Y-%m") for state, county, period, *_ in loaded_periods(conn)
+            if (state, county) in scope_keys} - manifest["month_checksums"].keys()
+    return sorted(changed | gone)
+
+def record_source_months(conn):
+    """Record the mirror months just compared (TEMP scan_months, empty = all) for every county in scope."""
+    conn.execute("""
+        DELETE FROM hhs_source_months
+        WHERE (state, county) IN (SELECT (state, county) FROM scope_fingerprints)
+          AND (month NOT IN (SELECT month FROM source_months)
+               OR NOT EXISTS (SELECT 1 FROM scan_months) OR month IN (SELECT month FROM scan_months))
+    """)
+    conn.execute("""
+        INSERT INTO hhs_source_months (state, county, month, source_checksum, scope_fingerprint)
+        SELECT k.state, k.county, sm.month, sm.checksum, k.fingerprint
+        FROM source_months sm
+        CROSS JOIN scope_fingerprints k
+        WHERE NOT EXISTS (SELECT 1 FROM scan_months) OR sm.month IN (SELECT month FROM scan_months)
+    """)
+
+def filter_hhs_spend(scopes=None, months=None):
+    """
+    Incrementally load the HHS data for our provider scopes with DuckDB.
+
+    `scopes` is a list of CountyScope; all of them are served by a single pass
+    over the source, with each row routed to every county whose NPI set holds it.
+    Rows are staged and checksummed per (county, period); only periods that are
+    new, changed or gone since the last load are rewritten in medicaid_spend and
+    logged in the ingestion ledger. `months` ('YYYY-MM') limits the run to
+    those months: only their partitions are read and only their periods are
+    compared. Without it, a mirror run reads only the months whose source
+    checksum or county NPI set changed since they were last compared. A run
+    that changes no period records no ingestion run. Returns the latest
+    ingest_run_id.
+    """
+    conn = connect(settings.DB_PATH)
+    scopes = scopes if scopes is not None else load_county_scopes(conn)
+    if months is not None and not months:
+        print("No months requested.")
+        run_id = latest_ingest_run_id(conn)
+        conn.close()
+        return run_id
+    if not scopes:
+        print("No county scopes to ingest.")
+        conn.close()
+        return None
+    
+    print(f"Filtering HHS data for {', '.join(f'{s.county}, {s.state}' for s in scopes)}...")
+    manifest = sync_hhs_mirror() if settings.USE_HHS_MIRROR else None
+    
+    # NPI -> (state, county) routing table, restricted to providers we know about
+    scope_map_df = scope_map_frame(scopes)
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE scope_map AS
+        SELECT CAST(m.npi AS VARCHAR) AS npi, CAST(m.state AS VARCHAR) AS state, CAST(m.county AS VARCHAR) AS county
+        FROM scope_map_df m
+        JOIN providers p ON CAST(m.npi AS VARCHAR) = p.npi
+    """)
+    conn.execute("CREATE OR REPLACE TEMP TABLE scope_keys (state VARCHAR, county VARCHAR)")
+    conn.executemany("INSERT INTO scope_keys VALUES (?, ?)", [[s.state, s.county] for s in scopes])
+    scope_fingerprint = str(conn.execute(
+        "SELECT COUNT(*) || ':' || COALESCE(SUM(hash(npi, state, county)), 0) FROM scope_map"
+    ).fetchone()[0])
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE scope_fingerprints AS
+        SELECT k.state, k.county, COUNT(m.npi) || ':' || COALESCE(SUM(hash(m.npi)), 0) AS fingerprint
+        FROM scope_keys k
+        LEFT JOIN scope_map m ON m.state = k.state AND m.county = k.county
+        GROUP BY 1, 2
+    """)
+    # Whole-month source checksums of the mirror
+    conn.execute("CREATE OR REPLACE TEMP TABLE source_months (month VARCHAR, checksum VARCHAR)")
+    if manifest is not None:
+        conn.executemany("INSERT INTO source_months VALUES (?, ?)", list(manifest["month_checksums"].items()))
+    
+    last_run = conn.execute("""
+        SELECT source_release, scope_fingerprint FROM hhs_ingestion_runs
+        ORDER BY ingest_run_id DESC LIMIT 1
+    """).fetchone()
+    if months is None and manifest is not None:
+        # A month already compared under the same checksum and NPI set can't change what we loaded
+        months = months_to_refresh(conn, manifest)
+        if not months:
+            print("Source months and scope unchanged since last ingestion; nothing to do.")
+            run_id = latest_ingest_run_id(conn)
+            conn.close()
+            return run_id
+        print(f"Source months to compare: {', '.join(months)}")
+    source, release = hhs_source_relation(conn, months, manifest)
+    if months is None and last_run == (release, scope_fingerprint):
+        print("Source release and scope unchanged since last ingestion; nothing to do.")
+        run_id = latest_ingest_run_id(conn)
+        conn.close()
+        return run_id
+    
+    # Months this run reads and compares (empty = all of them)
+    conn.execute("CREATE OR REPLACE TEMP TABLE scan_months (month VARCHAR)")
+    if months is not None:
+        conn.executemany("INSERT INTO scan_months VALUES (?)", [[m] for m in sorted(set(months))])
+    month_filter = "" if months is None else "WHERE src.CLAIM_FROM_MONTH IN (SELECT month FROM scan_months)"
     
-    # We join with our local providers table to only keep relevant data
     # Note: New headers for 2026 release are UPPERCASE.
-    # State/County no longer in CSV, we use our local provider scope.
-    query = f"""
-        INSERT INTO medicaid_spend (billing_npi, state, county, period, hcpcs_code, total_paid, total_claims, unique_beneficiaries)
+    # State/County are not in the CSV; they come from the scope map.
+    print("Staging scoped rows (single pass over source)...")
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE staged_spend AS
         SELECT 
-            BILLING_PROVIDER_NPI_NUM as billing_npi,
-            '{settings.TARGET_STATE}' as state,
-            '{settings.TARGET_COUNTY}' as county,
+            m.npi as billing_npi,
+            m.state,
+            m.county,
             CAST(CLAIM_FROM_MONTH || '-01' AS DATE) as period,
             HCPCS_CODE as hcpcs_code,
             CAST(TOTAL_PAID AS DOUBLE) as total_paid,
             CAST(TOTAL_CLAIMS AS INTEGER) as total_claims,
             CAST(TOTAL_UNIQUE_BENEFICIARIES AS INTEGER) as unique_beneficiaries
-        FROM read_csv('{settings.HHS_SOURCE_URL}', 
-                      header=True)
-        WHERE BILLING_PROVIDER_NPI_NUM IN (SELECT npi FROM providers)
-    """
+        FROM {source} src
+        JOIN scope_map m ON CAST(src.BILLING_PROVIDER_NPI_NUM AS VARCHAR) = m.npi
+        {month_filter}
+    """)
     
-    # Clear existing spend to avoid duplicates if re-running
-    conn.execute("DELETE FROM medicaid_spend")
+    # Per-period fingerprints of the staged rows vs. what the ledger says is loaded
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE period_changes AS
+        WITH staged AS (
+            SELECT state, county, period, COUNT(*) AS row_count,
+                   SUM(hash(billing_npi, hcpcs_code, total_paid, total_claims, unique_beneficiaries))::HUGEINT AS checksum
+            FROM staged_spend
+            GROUP BY 1, 2, 3
+        ),
+        loaded AS (
+            SELECT l.* FROM hhs_ingestion_ledger l
+            JOIN scope_keys k ON l.state = k.state AND l.county = k.county
+            WHERE NOT EXISTS (SELECT 1 FROM scan_months)
+               OR strftime(l.period, '%Y-%m') IN (SELECT month FROM scan_months)
+        )
+        SELECT 
+            COALESCE(s.state, l.state) AS state,
+            COALESCE(s.county, l.county) AS county,
+            COALESCE(s.period, l.period) AS period,
+            CASE WHEN l.period IS NULL THEN 'NEW'
+                 WHEN s.period IS NULL THEN 'REMOVED'
+                 ELSE 'CHANGED' END AS change_type,
+            COALESCE(s.row_count, 0) AS row_count,
+            s.checksum
+        FROM staged s
+        FULL OUTER JOIN loaded l ON s.state = l.state AND s.county = l.county AND s.period = l.period
+        WHERE l.period IS NULL OR s.period IS NULL
+           OR s.row_count != l.row_count OR s.checksum != l.checksum
+    """)
+    periods_changed = conn.execute("SELECT COUNT(*) FROM period_changes").fetchone()[0]
+    if not periods_changed and manifest is not None:
+        # Nothing to rewrite: remember the months were compared, without a new run for downstream stages
+        conn.execute("BEGIN TRANSACTION")
+        record_source_months(conn)
+        conn.execute("COMMIT")
+        print("No (county, period) slice changed.")
+        run_id = latest_ingest_run_id(conn)
+        conn.close()
+        return run_id
+    run_id = latest_ingest_run_id(conn) + 1
     
-    print("Executing remote stream & filter...")
-    conn.execute(query)
+    print(f"Rewriting {periods_changed} changed (county, period) slices...")
+    conn.execute("BEGIN TRANSACTION")
+    conn.execute("""
+        DELETE FROM medicaid_spend
+        WHERE (state, county, period) IN (SELECT state, county, period FROM period_changes)
+    """)
+    conn.execute("""
+        INSERT INTO medicaid_spend (billing_npi, state, county, period, hcpcs_code, total_paid, total_claims, unique_beneficiaries)
+        SELECT s.billing_npi, s.state, s.county, s.period, s.hcpcs_code, s.total_paid, s.total_claims, s.unique_beneficiaries
+        FROM staged_spend s
+        JOIN period_changes c ON s.state = c.state AND s.county = c.county AND s.period = c.period
+    """)
+    conn.execute("""
+        DELETE FROM hhs_ingestion_ledger
+        WHERE (state, county, period) IN (SELECT state, county, period FROM period_changes)
+    """)
+    conn.execute("""
+        INSERT INTO hhs_ingestion_ledger (state, county, period, source_release, row_count, checksum, ingest_run_id)
+        SELECT state, county, period, ?, row_count, checksum, ?
+        FROM period_changes WHERE change_type != 'REMOVED'
+    """, [release, run_id])
+    conn.execute("""
+        INSERT INTO hhs_ingestion_changes (ingest_run_id, state, county, period, change_type, row_count)
+        SELECT ?, state, county, period, change_type, row_count FROM period_changes
+    """, [run_id])
+    rows_written = conn.execute("SELECT COALESCE(SUM(row_count), 0) FROM period_changes").fetchone()[0]
+    conn.execute("""
+        INSERT INTO hhs_ingestion_runs (ingest_run_id, source_release, scope_fingerprint, periods_changed, rows_written)
+        VALUES (?, ?, ?, ?, ?)
+    """, [run_id, release, scope_fingerprint, periods_changed, rows_written])
+    record_source_months(conn)
+    conn.execute("COMMIT")
     
-    count = conn.execute("SELECT COUNT(*) FROM medicaid_spend").fetchone()[0]
-    print(f"Ingestion complete. {count} rows added to medicaid_spend table.")
+    for state, county, count in conn.execute("""
+        SELECT s.state, s.county, COUNT(*) FROM medicaid_spend s
+        JOIN scope_keys k ON s.state = k.state AND s.county = k.county
+        GROUP BY 1, 2 ORDER BY 1, 2
+    """).fetchall():
+        print(f"Ingestion complete. {count} rows in medicaid_spend for {county}, {state}.")
+    print(f"Ingestion run {run_id}: {periods_changed} periods changed, {rows_written} rows written.")
     
     conn.close()
+    return run_id
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load HHS spend for the monitored counties.")
+    parser.add_argument("--months", nargs="+", metavar="YYYY-MM", help="only read and compare these months")
+    args = parser.parse_args()
     # Ensure DuckDB directory exists
     os.makedirs(os.path.dirname(settings.DB_PATH), exist_ok=True)
-    filter_hhs_spend()
+    filter_hhs_spend(months=args.months)
@@ -1,35 +1,34 @@
-import requests
+import duckdb
 import json
-import time
+import os
 from tqdm import tqdm
 
 from src.config import settings
+from src.ingestion.crosswalk import crosswalk_available, zips_for_county
+from src.ingestion.nppes import NPPESClient
+from src.ingestion.scopes import scope_npi_path
 
-# For portability, we should eventually move this to a zip lookup by County/State
+# Fallback when no zip -> county crosswalk has been loaded (see src/ingestion/crosswalk.py)
 CLARK_COUNTY_ZIPS = [
     "98601", "98604", "98606", "98607", "98622", "98629", "98642", "98660",
     "98661", "98662", "98663", "98664", "98665", "98666", "98667", "98668",
     "98671", "98674", "98675", "98682", "98683", "98684", "98685", "98686", "98687"
 ]
 
-NPPES_API_URL = "https://npiregistry.cms.hhs.gov/api/"
-
-def get_npis_for_zip(zip_code):
+def get_npis_for_zip(zip_code, client):
     npis = set()
     skip = 0
     limit = 200
     
     while True:
         params = {
-            "version": "2.1",
             "postal_code": zip_code,
             "limit": limit,
             "skip": skip
         }
         try:
-            response = requests.get(NPPES_API_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
+            # Pages are cached and rate limited by the shared client
+            data = client.query(params)
             
             results = data.get("results", [])
             if not results:
@@ -42,22 +41,37 @@ def get_npis_for_zip(zip_code):
                 break
                 
             skip += limit
-            time.sleep(0.5)  # Respectful rate limiting
         except Exception as e:
             print(f"Error fetching zip {zip_code}: {e}")
             break
             
     return npis
 
+def target_zips(state=None, county=None):
+    """Zip codes for a county from the crosswalk, or the hardcoded Clark list without one."""
+    state = state or settings.TARGET_STATE
+    county = county or settings.TARGET_COUNTY
+    conn = duckdb.connect(settings.DB_PATH)
+    zips = zips_for_county(conn, state, county) if crosswalk_available(conn) else []
+    conn.close()
+    if not zips and (state, county) == ("WA", "CLARK"):
+        zips = CLARK_COUNTY_ZIPS
+    return zips
+
 def main():
     all_npis = set()
-    print(f"Fetching NPIs for {len(CLARK_COUNTY_ZIPS)} zip codes in Clark County...")
+    client = NPPESClient()
+    zips = target_zips()
+    print(f"Fetching NPIs for {len(zips)} zip codes in {settings.TARGET_COUNTY}, {settings.TARGET_STATE}...")
     
-    for zip_code in tqdm(CLARK_COUNTY_ZIPS):
-        zip_npis = get_npis_for_zip(zip_code)
+    for zip_code in tqdm(zips):
+        zip_npis = get_npis_for_zip(zip_code, client)
         all_npis.update(zip_npis)
+    print(client.stats_summary())
+    client.close()
         
-    output_path = "data/raw/clark_county_npis.json"
+    output_path = scope_npi_path(settings.TARGET_COUNTY)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
     with open(output_path, "w") as f:
         json.dump(list(all_npis), f)
         
@@ -15,14 +15,12 @@ def main():
             p.auth_official_name,
             p.auth_official_title,
             p.mailing_address,
-            COUNT(f.flag_type) as flag_count,
-            SUM(s.total_paid) as total_spend
-        FROM providers p
-        JOIN risk_flags f ON p.npi = f.npi
-        LEFT JOIN medicaid_spend s ON p.npi = s.billing_npi
-        GROUP BY 1, 2, 3, 4, 5
-        ORDER BY flag_count DESC, total_spend DESC
-        LIMIT 20
+            r.flag_count,
+            COALESCE(r.total_spend, 0) as total_spend
+        FROM provider_rollup r
+        JOIN providers p ON r.npi = p.npi
+        WHERE r.dashboard_rank <= 20 AND r.flag_count > 0
+        ORDER BY r.dashboard_rank
     """
     df = conn.execute(query).df()
     
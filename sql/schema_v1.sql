@@ -18,8 +18,10 @@ CREATE TABLE IF NOT EXISTS providers (
     mailing_city VARCHAR,
     mailing_state VARCHAR,
     mailing_zip VARCHAR,
-    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    practice_address VARCHAR
 );
+ALTER TABLE providers ADD COLUMN IF NOT EXISTS practice_address VARCHAR;
 
 -- Medicaid Spending Records
 -- Storing at the grain of Provider x HCPCS x Period
@@ -36,8 +38,21 @@ CREATE TABLE IF NOT EXISTS medicaid_spend (
     FOREIGN KEY (billing_npi) REFERENCES providers(npi)
 );
 
--- Risk Flags and Explanations
-CREATE TABLE IF NOT EXISTS risk_flags (
+-- Screening Runs
+-- Flags are written under a run and become visible when the run is published
+CREATE TABLE IF NOT EXISTS flag_runs (
+    run_id INTEGER PRIMARY KEY,
+    status VARCHAR, -- 'building', 'published', 'archived' (flags pruned, diff kept)
+    ingest_run_id INTEGER, -- latest HHS ingestion run the flags were computed from
+    flag_types VARCHAR[], -- flag types recomputed by this run, the rest are carried forward
+    config VARCHAR, -- JSON thresholds and model settings in effect
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    published_at TIMESTAMP
+);
+
+-- Risk Flags and Explanations (every run)
+CREATE TABLE IF NOT EXISTS risk_flag_history (
+    run_id INTEGER,
     npi VARCHAR,
     flag_type VARCHAR, -- e.g., 'PRICE_OUTLIER', 'TEMPORAL_SPIKE', 'LEIE_MATCH'
     flag_score DOUBLE,
@@ -46,8 +61,26 @@ CREATE TABLE IF NOT EXISTS risk_flags (
     FOREIGN KEY (npi) REFERENCES providers(npi)
 );
 
--- OIG LEIE Exclusions List (Full Database)
+-- Per (npi, flag_type) changes of each published run against the previous one
+CREATE TABLE IF NOT EXISTS flag_run_diffs (
+    run_id INTEGER,
+    previous_run_id INTEGER,
+    npi VARCHAR,
+    flag_type VARCHAR,
+    change_type VARCHAR, -- 'NEW', 'RESOLVED', 'SCORE_CHANGED'
+    previous_score DOUBLE, -- highest score of that flag type for the NPI
+    current_score DOUBLE
+);
+
+-- Risk flags of the latest published run
+CREATE VIEW IF NOT EXISTS risk_flags AS
+SELECT npi, flag_type, flag_score, reason, detected_at
+FROM risk_flag_history
+WHERE run_id = (SELECT MAX(run_id) FROM flag_runs WHERE status = 'published');
+
+-- OIG LEIE Exclusions List (Full Database), one row per listed exclusion
 CREATE TABLE IF NOT EXISTS leie_exclusions (
+    leie_key VARCHAR PRIMARY KEY, -- md5 of the row's identifying fields
     last_name VARCHAR,
     first_name VARCHAR,
     mid_name VARCHAR,
@@ -55,7 +88,7 @@ CREATE TABLE IF NOT EXISTS leie_exclusions (
     general_specialty VARCHAR,
     specialty VARCHAR,
     upin VARCHAR,
-    npi VARCHAR,
+    npi VARCHAR, -- NULL when the list has none (0000000000)
     dob VARCHAR,
     address VARCHAR,
     city VARCHAR,
@@ -63,9 +96,234 @@ CREATE TABLE IF NOT EXISTS leie_exclusions (
     zip VARCHAR,
     excl_type VARCHAR,
     excl_date VARCHAR,
-    rein_date VARCHAR,
+    rein_date VARCHAR, -- set by reinstatement supplements
     waiver_date VARCHAR,
-    wvr_state VARCHAR
+    wvr_state VARCHAR,
+    source_url VARCHAR, -- file that last wrote the row
+    loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- LEIE files applied (full list and monthly supplements) with their HTTP validators
+CREATE TABLE IF NOT EXISTS leie_sources (
+    url VARCHAR PRIMARY KEY,
+    kind VARCHAR, -- 'full' or 'supplement'
+    etag VARCHAR,
+    last_modified VARCHAR,
+    row_count BIGINT,
+    applied_at TIMESTAMP, -- last time the file's content was applied
+    checked_at TIMESTAMP -- last revalidation
+);
+
+-- Providers resembling active LEIE exclusions (blocked fuzzy matching, rebuilt each run)
+CREATE TABLE IF NOT EXISTS leie_matches (
+    npi VARCHAR,
+    leie_key VARCHAR, -- md5 of the LEIE row's identifying fields
+    match_type VARCHAR, -- 'NPI', 'INDIVIDUAL', 'AUTH_OFFICIAL', 'BUSINESS'
+    score DOUBLE, -- 0-1 (1 = same NPI)
+    match_rank INTEGER, -- 1 = provider's best candidate
+    evidence VARCHAR, -- JSON: blocks, per-field similarities, LEIE zip/city/DOB
+    leie_name VARCHAR,
+    excl_type VARCHAR,
+    excl_date VARCHAR,
+    matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Zip -> County Crosswalk (reference data loaded from a local file)
+-- A zip can straddle counties, ratio is the share of its addresses in that county
+CREATE TABLE IF NOT EXISTS zip_county_crosswalk (
+    zip VARCHAR,
+    state VARCHAR,
+    county VARCHAR,
+    ratio DOUBLE
+);
+
+-- HHS Ingestion Ledger
+-- One row per loaded (county, period) with the release it came from and a content checksum
+CREATE TABLE IF NOT EXISTS hhs_ingestion_ledger (
+    state VARCHAR,
+    county VARCHAR,
+    period DATE,
+    source_release VARCHAR,
+    row_count BIGINT,
+    checksum HUGEINT, -- order-independent sum of row hashes
+    ingest_run_id INTEGER, -- run that last rewrote this period
+    loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (state, county, period)
+);
+
+-- Mirror months last compared for each county, with or without rows in scope
+CREATE TABLE IF NOT EXISTS hhs_source_months (
+    state VARCHAR,
+    county VARCHAR,
+    month VARCHAR, -- 'YYYY-MM'
+    source_checksum VARCHAR, -- mirror checksum of the whole source month
+    scope_fingerprint VARCHAR, -- the county's NPI set at the time
+    compared_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (state, county, month)
+);
+
+-- One row per ingestion run
+CREATE TABLE IF NOT EXISTS hhs_ingestion_runs (
+    ingest_run_id INTEGER PRIMARY KEY,
+    source_release VARCHAR,
+    scope_fingerprint VARCHAR,
+    periods_changed INTEGER,
+    rows_written BIGINT,
+    finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Periods touched by each run, so downstream stages can ask what changed
+CREATE TABLE IF NOT EXISTS hhs_ingestion_changes (
+    ingest_run_id INTEGER,
+    state VARCHAR,
+    county VARCHAR,
+    period DATE,
+    change_type VARCHAR, -- 'NEW', 'CHANGED', 'REMOVED'
+    row_count BIGINT
+);
+
+-- Last ingestion run each analysis stage has consumed
+CREATE TABLE IF NOT EXISTS analysis_watermarks (
+    stage VARCHAR PRIMARY KEY,
+    ingest_run_id INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Peer Group Sufficient Statistics (Specialty x Month x Code)
+-- Mergeable per group (count, mean, M2 combine pairwise), the benchmarks view derives averages and deviations from them
+CREATE TABLE IF NOT EXISTS benchmark_stats (
+    taxonomy_desc VARCHAR,
+    period DATE,
+    hcpcs_code VARCHAR,
+    n_prices BIGINT, -- rows with a defined price per claim
+    mean_price DOUBLE,
+    m2_price DOUBLE, -- sum of squared deviations from mean_price
+    total_peer_claims HUGEINT,
+    peer_npis VARCHAR[], -- distinct billing NPIs in the group
+    refresh_run_id INTEGER, -- ingestion run the group was last recomputed for
+    PRIMARY KEY (taxonomy_desc, period, hcpcs_code)
+);
+
+-- Peer Group Quantile Sketches (src/analysis/sketches.py), mergeable across periods
+CREATE TABLE IF NOT EXISTS benchmark_sketches (
+    taxonomy_desc VARCHAR,
+    period DATE,
+    hcpcs_code VARCHAR,
+    paid_sketch BLOB, -- total_paid per spend row
+    price_sketch BLOB, -- price per claim
+    paid_rank_floor DOUBLE, -- total_paid above this is in the group's top 1% (PERCENT_RANK >= 0.99)
+    price_median DOUBLE,
+    price_mad DOUBLE,
+    PRIMARY KEY (taxonomy_desc, period, hcpcs_code)
+);
+
+-- Taxonomy each provider was benchmarked under, to detect re-enrichment
+CREATE TABLE IF NOT EXISTS benchmark_provider_taxonomy (
+    npi VARCHAR PRIMARY KEY,
+    taxonomy_desc VARCHAR
+);
+
+-- Fitted anomaly models, artifacts are joblib files under ML_MODEL_DIR
+CREATE TABLE IF NOT EXISTS model_registry (
+    model_name VARCHAR,
+    version INTEGER,
+    artifact_path VARCHAR,
+    feature_schema VARCHAR, -- JSON list of feature columns, in training order
+    training_fingerprint VARCHAR, -- row count and order-independent hash of the training matrix
+    training_rows BIGINT,
+    params VARCHAR, -- JSON estimator parameters
+    trained_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model_name, version)
+);
+
+-- Latest anomaly score per provider, with the hash of the features it was scored on
+CREATE TABLE IF NOT EXISTS ml_scores (
+    npi VARCHAR PRIMARY KEY,
+    model_name VARCHAR,
+    model_version INTEGER,
+    feature_hash UBIGINT,
+    score DOUBLE, -- IsolationForest score_samples (lower is more anomalous)
+    is_outlier BOOLEAN,
+    scored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per provider for list views, stored in dashboard order
+-- (rebuilt whenever a flag run is published)
+CREATE TABLE IF NOT EXISTS provider_rollup (
+    dashboard_rank INTEGER, -- 1 = most flags, ties broken by spend
+    npi VARCHAR PRIMARY KEY,
+    name VARCHAR,
+    taxonomy_desc VARCHAR,
+    city VARCHAR,
+    state VARCHAR,
+    is_excluded BOOLEAN,
+    risk_score DOUBLE,
+    total_spend DOUBLE,
+    total_claims BIGINT,
+    first_period DATE,
+    last_period DATE,
+    flag_count INTEGER, -- risk_flags rows
+    flag_type_counts MAP(VARCHAR, INTEGER),
+    max_flag_score DOUBLE,
+    flag_run_id INTEGER, -- published run the flag columns come from
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Prebuilt detail view (JSON) of every flagged provider
+CREATE TABLE IF NOT EXISTS provider_dossiers (
+    npi VARCHAR PRIMARY KEY,
+    flag_run_id INTEGER,
+    dossier VARCHAR, -- details, flags, features, spend_trend, top_codes
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Input fingerprint of each pipeline stage's last successful run (src.dag)
+CREATE TABLE IF NOT EXISTS pipeline_stages (
+    stage VARCHAR PRIMARY KEY,
+    fingerprint VARCHAR, -- sha256 of the inputs below
+    inputs VARCHAR, -- JSON: table versions, settings and file versions the stage read
+    seconds DOUBLE,
+    finished_at TIMESTAMP
+);
+
+-- Pipeline run ledger: one row per pipeline invocation
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+    run_id INTEGER PRIMARY KEY,
+    status VARCHAR, -- 'running', 'succeeded', 'failed'
+    args VARCHAR, -- JSON: stage targeting, force, workers
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    wall_seconds DOUBLE
+);
+
+-- Measurements of each stage of a pipeline run (src.instrumentation)
+CREATE TABLE IF NOT EXISTS pipeline_run_stages (
+    run_id INTEGER,
+    stage VARCHAR,
+    status VARCHAR, -- 'ran', 'skipped', 'failed'
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    wall_seconds DOUBLE,
+    cpu_seconds DOUBLE, -- process CPU while the stage ran
+    duckdb_cpu_seconds DOUBLE, -- CPU of the stage's own queries
+    peak_rss_mb DOUBLE, -- process peak while the stage ran
+    rows_read BIGINT,
+    rows_written BIGINT,
+    queries INTEGER,
+    PRIMARY KEY (run_id, stage)
+);
+
+-- DuckDB profile of every statement a stage ran
+CREATE TABLE IF NOT EXISTS pipeline_query_profiles (
+    run_id INTEGER,
+    stage VARCHAR,
+    seq INTEGER, -- statement order within the stage
+    query VARCHAR,
+    latency_seconds DOUBLE,
+    cpu_seconds DOUBLE,
+    rows_read BIGINT,
+    rows_written BIGINT,
+    profile VARCHAR -- JSON operator tree, as EXPLAIN ANALYZE reports it
 );
 
 -- Indices for analytical speed
@@ -73,3 +331,9 @@ CREATE INDEX IF NOT EXISTS idx_spend_npi ON medicaid_spend(billing_npi);
 CREATE INDEX IF NOT EXISTS idx_spend_hcpcs ON medicaid_spend(hcpcs_code);
 CREATE INDEX IF NOT EXISTS idx_spend_period ON medicaid_spend(period);
 CREATE INDEX IF NOT EXISTS idx_leie_npi ON leie_exclusions(npi);
+CREATE INDEX IF NOT EXISTS idx_leie_matches_npi ON leie_matches(npi);
+CREATE INDEX IF NOT EXISTS idx_flag_history_npi ON risk_flag_history(npi);
+CREATE INDEX IF NOT EXISTS idx_flag_diffs_run ON flag_run_diffs(run_id);
+CREATE INDEX IF NOT EXISTS idx_crosswalk_county ON zip_county_crosswalk(state, county);
+CREATE INDEX IF NOT EXISTS idx_crosswalk_zip ON zip_county_crosswalk(zip);
+CREATE INDEX IF NOT EXISTS idx_query_profiles_run ON pipeline_query_profiles(run_id, stage);
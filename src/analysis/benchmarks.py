@@ -1,33 +1,193 @@
-import duckdb
 import pandas as pd
 
 from src.config import settings
+from src.instrumentation import connect
+from src.ingestion.ledger import changed_periods, latest_ingest_run_id, set_stage_watermark, stage_watermark
+from src.analysis.sketches import QuantileSketch
+
+STAGE = "benchmarks"
+
+# PERCENTILE_OUTLIER cutoff, precomputed per group as paid_rank_floor
+PERCENTILE_CUTOFF = 0.99
+
+# Averages and sample deviations derived from the per-group count, mean and M2,
+# plus the quantile summaries kept next to them
+BENCHMARKS_VIEW_SQL = """
+    CREATE OR REPLACE VIEW benchmarks AS
+    SELECT
+        b.taxonomy_desc,
+        b.period,
+        b.hcpcs_code,
+        b.mean_price AS avg_price_per_claim,
+        CASE WHEN b.n_prices > 1 THEN SQRT(b.m2_price / (b.n_prices - 1)) END AS stddev_price_per_claim,
+        b.total_peer_claims,
+        len(b.peer_npis) AS peer_count,
+        k.paid_rank_floor,
+        k.price_median,
+        k.price_mad
+    FROM benchmark_stats b
+    LEFT JOIN benchmark_sketches k
+        ON b.taxonomy_desc = k.taxonomy_desc AND b.period = k.period AND b.hcpcs_code = k.hcpcs_code
+"""
+
+def ensure_benchmarks_view(conn):
+    # Older databases hold benchmarks as a fully rebuilt table
+    legacy = conn.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_name = 'benchmarks' AND table_type = 'BASE TABLE'
+    """).fetchone()[0]
+    if legacy:
+        conn.execute("DROP TABLE benchmarks")
+    conn.execute(BENCHMARKS_VIEW_SQL)
+
+def _stage_affected_groups(conn, periods, full):
+    """
+    Collect the (taxonomy_desc, period, hcpcs_code) groups to recompute into
+    TEMP affected_groups: every group of a changed period (including groups
+    that no longer have rows), plus the old and new groups of providers whose
+    taxonomy changed since the last refresh.
+    """
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE retaxonomied_npis AS
+        SELECT COALESCE(p.npi, t.npi) AS npi, t.taxonomy_desc AS old_taxonomy, p.taxonomy_desc AS new_taxonomy
+        FROM providers p
+        FULL OUTER JOIN benchmark_provider_taxonomy t ON p.npi = t.npi
+        WHERE p.taxonomy_desc IS DISTINCT FROM t.taxonomy_desc
+    """)
+    if full:
+        conn.execute("""
+            CREATE OR REPLACE TEMP TABLE affected_groups AS
+            SELECT DISTINCT p.taxonomy_desc, s.period, s.hcpcs_code
+            FROM medicaid_spend s
+            JOIN providers p ON s.billing_npi = p.npi
+            WHERE p.taxonomy_desc IS NOT NULL
+            UNION
+            SELECT taxonomy_desc, period, hcpcs_code FROM benchmark_stats
+        """)
+        return
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE affected_groups AS
+        SELECT DISTINCT p.taxonomy_desc, s.period, s.hcpcs_code
+        FROM medicaid_spend s
+        JOIN providers p ON s.billing_npi = p.npi
+        WHERE s.period IN (SELECT UNNEST(?)) AND p.taxonomy_desc IS NOT NULL
+        UNION
+        SELECT taxonomy_desc, period, hcpcs_code FROM benchmark_stats
+        WHERE period IN (SELECT UNNEST(?))
+        UNION
+        SELECT taxonomy, s.period, s.hcpcs_code
+        FROM medicaid_spend s
+        JOIN (
+            SELECT npi, old_taxonomy AS taxonomy FROM retaxonomied_npis
+            UNION
+            SELECT npi, new_taxonomy FROM retaxonomied_npis
+        ) r ON s.billing_npi = r.npi
+        WHERE taxonomy IS NOT NULL
+    """, [periods, periods])
+
+def _refresh_sketches(conn):
+    """Rebuild the quantile sketches of every group in affected_groups."""
+    conn.execute("""
+        DELETE FROM benchmark_sketches
+        WHERE (taxonomy_desc, period, hcpcs_code) IN (SELECT (taxonomy_desc, period, hcpcs_code) FROM affected_groups)
+    """)
+    groups = conn.execute("""
+        SELECT
+            p.taxonomy_desc,
+            s.period,
+            s.hcpcs_code,
+            LIST(s.total_paid) FILTER (WHERE s.total_paid IS NOT NULL),
+            LIST(s.total_paid / s.total_claims) FILTER (WHERE s.total_claims <> 0)
+        FROM medicaid_spend s
+        JOIN providers p ON s.billing_npi = p.npi
+        SEMI JOIN affected_groups g
+            ON p.taxonomy_desc = g.taxonomy_desc AND s.period = g.period AND s.hcpcs_code = g.hcpcs_code
+        GROUP BY 1, 2, 3
+    """).fetchall()
+
+    rows = []
+    for taxonomy_desc, period, hcpcs_code, paid, prices in groups:
+        paid = QuantileSketch().update(paid or [])
+        price = QuantileSketch().update(prices or [])
+        rows.append((taxonomy_desc, period, hcpcs_code, paid.to_bytes(), price.to_bytes(),
+                     paid.rank_floor(PERCENTILE_CUTOFF), price.median(), price.mad()))
+    sketches = pd.DataFrame(rows, columns=["taxonomy_desc", "period", "hcpcs_code", "paid_sketch", "price_sketch",
+                                           "paid_rank_floor", "price_median", "price_mad"])
+    conn.register("new_sketches", sketches)
+    conn.execute("""
+        INSERT INTO benchmark_sketches
+        SELECT CAST(taxonomy_desc AS VARCHAR), CAST(period AS DATE), CAST(hcpcs_code AS VARCHAR),
+               CAST(paid_sketch AS BLOB), CAST(price_sketch AS BLOB),
+               CAST(paid_rank_floor AS DOUBLE), CAST(price_median AS DOUBLE), CAST(price_mad AS DOUBLE)
+        FROM new_sketches
+    """)
+    conn.unregister("new_sketches")
+
+def calculate_benchmarks(full=False):
+    """
+    Maintain peer group benchmarks (Specialty x Month x Code) incrementally.
+
+    Each group is stored as sufficient statistics (price count, mean and sum of
+    squared deviations, claim total and the distinct peer NPIs). Only groups
+    touched since the last refresh are recomputed: periods the ingestion ledger reports as
+    changed, and groups gaining or losing a provider through re-enrichment.
+    Each recomputed group also gets quantile sketches of total_paid and price
+    per claim, with the percentile cutoff, median and MAD read off them.
+    The first run, or `full=True`, rebuilds every group.
+    """
+    conn = connect(settings.DB_PATH)
+    ensure_benchmarks_view(conn)
+
+    watermark = stage_watermark(conn, STAGE)
+    run_id = latest_ingest_run_id(conn)
+    full = full or watermark is None
+    periods = [] if full else changed_periods(conn, watermark)
 
-def calculate_benchmarks():
-    conn = duckdb.connect(settings.DB_PATH)
-    
     print("Calculating peer group benchmarks (Specialty x Month)...")
-    
-    # We join spend and providers to get taxonomy
-    # Then calculate avg price, stddev, and count for each (taxonomy_desc, period, hcpcs_code)
+    _stage_affected_groups(conn, periods, full)
+    affected = conn.execute("SELECT COUNT(*) FROM affected_groups").fetchone()[0]
+    if not affected:
+        set_stage_watermark(conn, STAGE, run_id)
+        print("Benchmarks are up to date.")
+        conn.close()
+        return 0
+
+    conn.execute("BEGIN TRANSACTION")
     conn.execute("""
-        CREATE OR REPLACE TABLE benchmarks AS
-        SELECT 
+        DELETE FROM benchmark_stats
+        WHERE (taxonomy_desc, period, hcpcs_code) IN (SELECT (taxonomy_desc, period, hcpcs_code) FROM affected_groups)
+    """)
+    # VAR_POP accumulates with Welford's update, so M2 doesn't cancel on large, tightly clustered prices
+    conn.execute("""
+        INSERT INTO benchmark_stats
+        SELECT
             p.taxonomy_desc,
             s.period,
             s.hcpcs_code,
-            AVG(s.total_paid / NULLIF(s.total_claims, 0)) AS avg_price_per_claim,
-            STDDEV_SAMP(s.total_paid / NULLIF(s.total_claims, 0)) AS stddev_price_per_claim,
-            SUM(s.total_claims) AS total_peer_claims,
-            COUNT(DISTINCT s.billing_npi) AS peer_count
+            COUNT(s.total_paid / NULLIF(s.total_claims, 0)),
+            AVG(s.total_paid / NULLIF(s.total_claims, 0)),
+            VAR_POP(s.total_paid / NULLIF(s.total_claims, 0)) * COUNT(s.total_paid / NULLIF(s.total_claims, 0)),
+            SUM(s.total_claims),
+            LIST(DISTINCT s.billing_npi),
+            ?
         FROM medicaid_spend s
         JOIN providers p ON s.billing_npi = p.npi
-        WHERE p.taxonomy_desc IS NOT NULL
+        SEMI JOIN affected_groups g
+            ON p.taxonomy_desc = g.taxonomy_desc AND s.period = g.period AND s.hcpcs_code = g.hcpcs_code
         GROUP BY 1, 2, 3
+    """, [run_id])
+    _refresh_sketches(conn)
+    conn.execute("DELETE FROM benchmark_provider_taxonomy WHERE npi IN (SELECT npi FROM retaxonomied_npis)")
+    conn.execute("""
+        INSERT INTO benchmark_provider_taxonomy
+        SELECT npi, new_taxonomy FROM retaxonomied_npis WHERE new_taxonomy IS NOT NULL
     """)
-    
-    print("Benchmarks table created in DuckDB.")
+    set_stage_watermark(conn, STAGE, run_id)
+    conn.execute("COMMIT")
+
+    print(f"Benchmarks refreshed: {affected} peer groups recomputed{' (full rebuild)' if full else ''}.")
     conn.close()
+    return affected
 
 if __name__ == "__main__":
     calculate_benchmarks()
@@ -0,0 +1,121 @@
+import duckdb
+
+from src.config import settings
+
+# Provider dossiers: the whole detail view of a provider (registry details,
+# current flags, features, monthly spend and top HCPCS codes against peers) as
+# one JSON document. Prebuilt for flagged providers when a flag run is
+# published, assembled live by the same SQL for anyone else.
+
+def dossier_sql(npi_match):
+    """
+    SELECT npi, dossier for the providers whose npi satisfies `<column> {npi_match}`
+    (e.g. "= $npi" or "IN (SELECT npi FROM provider_rollup WHERE flag_count > 0)").
+    """
+    return f"""
+        WITH spend AS (
+            SELECT * FROM medicaid_spend WHERE billing_npi {npi_match}
+        ),
+        flags AS (
+            SELECT
+                npi,
+                LIST({{'npi': npi, 'flag_type': flag_type, 'flag_score': flag_score, 'reason': reason, 'detected_at': detected_at}}
+                     ORDER BY flag_score DESC, flag_type) AS flags
+            FROM risk_flags
+            WHERE npi {npi_match}
+            GROUP BY 1
+        ),
+        features AS (
+            SELECT npi, struct_pack(*COLUMNS(* EXCLUDE (npi, periods))) AS features
+            FROM provider_features
+            WHERE npi {npi_match}
+        ),
+        trend AS (
+            SELECT billing_npi AS npi, LIST({{'period': period, 'spend': spend}} ORDER BY period) AS spend_trend
+            FROM (SELECT billing_npi, period, SUM(total_paid) AS spend FROM spend GROUP BY 1, 2)
+            GROUP BY 1
+        ),
+        codes AS (
+            SELECT
+                s.billing_npi,
+                s.hcpcs_code,
+                SUM(s.total_paid) AS total_paid,
+                SUM(s.total_claims) AS total_claims,
+                SUM(s.total_paid) / NULLIF(SUM(s.total_claims), 0) AS avg_price_per_claim,
+                -- claim-weighted price against the peer average, over months with a benchmark
+                SUM(s.total_paid) FILTER (b.avg_price_per_claim IS NOT NULL)
+                    / NULLIF(SUM(s.total_claims * b.avg_price_per_claim), 0) AS peer_price_ratio
+            FROM spend s
+            LEFT JOIN providers p ON s.billing_npi = p.npi
+            LEFT JOIN benchmarks b ON p.taxonomy_desc = b.taxonomy_desc AND s.period = b.period AND s.hcpcs_code = b.hcpcs_code
+            GROUP BY 1, 2
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY s.billing_npi ORDER BY SUM(s.total_paid) DESC, s.hcpcs_code) <= $top_codes
+        ),
+        top_codes AS (
+            SELECT
+                billing_npi AS npi,
+                LIST({{'hcpcs_code': hcpcs_code, 'total_paid': total_paid, 'total_claims': total_claims,
+                       'avg_price_per_claim': avg_price_per_claim, 'peer_price_ratio': peer_price_ratio}}
+                     ORDER BY total_paid DESC, hcpcs_code) AS top_codes
+            FROM codes
+            GROUP BY 1
+        )
+        SELECT
+            p.npi,
+            to_json({{
+                'details': p,
+                'flags': COALESCE(fl.flags, []),
+                'features': fe.features,
+                'spend_trend': COALESCE(tr.spend_trend, []),
+                'top_codes': COALESCE(tc.top_codes, [])
+            }})::VARCHAR AS dossier
+        FROM providers p
+        LEFT JOIN flags fl ON p.npi = fl.npi
+        LEFT JOIN features fe ON p.npi = fe.npi
+        LEFT JOIN trend tr ON p.npi = tr.npi
+        LEFT JOIN top_codes tc ON p.npi = tc.npi
+        WHERE p.npi {npi_match}
+    """
+
+def write_provider_dossiers(conn, npis=None):
+    """
+    Replace provider_dossiers' rows inside the caller's transaction: all of
+    them, or only those of `npis` (e.g. providers whose details were updated).
+    """
+    if npis is None:
+        conn.execute("DELETE FROM provider_dossiers")
+        flagged, params = "IN (SELECT npi FROM provider_rollup WHERE flag_count > 0)", {}
+    else:
+        conn.execute("DELETE FROM provider_dossiers WHERE list_contains(?, npi)", [list(npis)])
+        flagged = "IN (SELECT npi FROM provider_rollup WHERE flag_count > 0 AND list_contains($npis, npi))"
+        params = {"npis": list(npis)}
+    conn.execute(f"""
+        INSERT INTO provider_dossiers (npi, flag_run_id, dossier)
+        SELECT d.npi, (SELECT MAX(run_id) FROM flag_runs WHERE status = 'published'), d.dossier
+        FROM ({dossier_sql(flagged)}) d
+    """, {"top_codes": settings.DOSSIER_TOP_CODES, **params})
+
+def build_provider_dossiers(conn=None):
+    """Rebuild provider_dossiers for every flagged provider in provider_rollup."""
+    own = conn is None
+    if own:
+        conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("BEGIN TRANSACTION")
+    write_provider_dossiers(conn)
+    conn.execute("COMMIT")
+    built = conn.execute("SELECT COUNT(*) FROM provider_dossiers").fetchone()[0]
+    print(f"Provider dossiers rebuilt for {built} flagged providers.")
+    if own:
+        conn.close()
+    return built
+
+def provider_dossier(conn, npi):
+    """The provider's dossier as a JSON string: prebuilt when flagged, assembled live otherwise. None if unknown."""
+    row = conn.execute("SELECT dossier FROM provider_dossiers WHERE npi = ?", [npi]).fetchone()
+    if row is None:
+        row = conn.execute(f"SELECT dossier FROM ({dossier_sql('= $npi')})",
+                           {"npi": npi, "top_codes": settings.DOSSIER_TOP_CODES}).fetchone()
+    return row[0] if row else None
+
+if __name__ == "__main__":
+    build_provider_dossiers()
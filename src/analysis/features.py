@@ -0,0 +1,174 @@
+from dataclasses import dataclass
+
+from src.config import settings
+from src.instrumentation import connect
+from src.ingestion.ledger import changed_periods, latest_ingest_run_id, set_stage_watermark, stage_watermark
+
+STAGE = "provider_features"
+
+@dataclass
+class Feature:
+    """
+    One provider-level feature. `sql` is an aggregate over the provider's spend
+    rows (level 'row') or over its per-month totals (level 'monthly', columns
+    monthly_paid, monthly_claims, monthly_beneficiaries).
+    """
+    name: str
+    sql: str
+    dtype: str
+    description: str
+    level: str = "row"
+
+# Feature catalog: each entry becomes a provider_features column
+FEATURE_CATALOG = [
+    Feature("total_paid", "SUM(total_paid)", "DOUBLE", "Total paid across all periods and codes"),
+    Feature("total_claims", "SUM(total_claims)", "BIGINT", "Total claims across all periods and codes"),
+    Feature("active_months", "COUNT(DISTINCT period)", "BIGINT", "Months with any billing"),
+    Feature("unique_codes", "COUNT(DISTINCT hcpcs_code)", "BIGINT", "Distinct HCPCS codes billed"),
+    Feature("first_period", "MIN(period)", "DATE", "First month with billing"),
+    Feature("last_period", "MAX(period)", "DATE", "Latest month with billing"),
+    Feature("avg_price_per_claim", "SUM(total_paid) / NULLIF(SUM(total_claims), 0)", "DOUBLE",
+            "Paid per claim over all billing"),
+    Feature("avg_peer_price_ratio", "AVG(peer_price_ratio)", "DOUBLE",
+            "Mean ratio of price per claim to the peer group average"),
+    Feature("beneficiary_ratio", "SUM(total_claims) / NULLIF(SUM(unique_beneficiaries), 0)", "DOUBLE",
+            "Claims per unique beneficiary (patient density)"),
+    Feature("spend_volatility", "STDDEV(monthly_paid)", "DOUBLE",
+            "Standard deviation of monthly payments", level="monthly"),
+]
+
+def ensure_feature_table(conn):
+    """
+    Create provider_features from the catalog, adding columns for new catalog
+    entries. Returns True when columns were added (existing rows need a refill).
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS provider_features (
+            npi VARCHAR PRIMARY KEY,
+            taxonomy_desc VARCHAR, -- taxonomy the peer ratios were computed under
+            periods DATE[], -- months the features cover
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    existing = {r[0] for r in conn.execute("""
+        SELECT column_name FROM information_schema.columns WHERE table_name = 'provider_features'
+    """).fetchall()}
+    added = False
+    for f in FEATURE_CATALOG:
+        if f.name not in existing:
+            conn.execute(f"ALTER TABLE provider_features ADD COLUMN {f.name} {f.dtype}")
+            added = True
+
+    conn.execute("CREATE OR REPLACE TABLE feature_catalog (name VARCHAR, level VARCHAR, dtype VARCHAR, expression VARCHAR, description VARCHAR)")
+    conn.executemany("INSERT INTO feature_catalog VALUES (?, ?, ?, ?, ?)",
+                     [[f.name, f.level, f.dtype, f.sql, f.description] for f in FEATURE_CATALOG])
+    return added
+
+def _stage_affected_npis(conn, periods, full):
+    """
+    NPIs whose features must be recomputed, into TEMP affected_npis: providers
+    billing in (or previously covering) a changed period, providers whose
+    taxonomy changed, and the peers sharing a benchmark group with them.
+    """
+    if full:
+        conn.execute("""
+            CREATE OR REPLACE TEMP TABLE affected_npis AS
+            SELECT DISTINCT billing_npi AS npi FROM medicaid_spend
+            UNION
+            SELECT npi FROM provider_features
+        """)
+        return
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE affected_npis AS
+        WITH retaxonomied AS (
+            SELECT f.npi, f.taxonomy_desc AS old_taxonomy, p.taxonomy_desc AS new_taxonomy
+            FROM provider_features f
+            LEFT JOIN providers p ON f.npi = p.npi
+            WHERE f.taxonomy_desc IS DISTINCT FROM p.taxonomy_desc
+        )
+        SELECT DISTINCT billing_npi AS npi FROM medicaid_spend WHERE period IN (SELECT UNNEST($periods))
+        UNION
+        SELECT npi FROM provider_features WHERE list_has_any(periods, $periods)
+        UNION
+        SELECT npi FROM retaxonomied
+        UNION
+        SELECT DISTINCT UNNEST(b.peer_npis)
+        FROM retaxonomied r
+        JOIN medicaid_spend s ON s.billing_npi = r.npi
+        JOIN benchmark_stats b
+            ON b.period = s.period AND b.hcpcs_code = s.hcpcs_code
+           AND (b.taxonomy_desc = r.old_taxonomy OR b.taxonomy_desc = r.new_taxonomy)
+    """, {"periods": periods})
+
+def refresh_provider_features(full=False):
+    """
+    Maintain provider_features incrementally: one aggregation over the spend
+    rows of affected NPIs computes every catalog feature. Run after
+    calculate_benchmarks (peer ratios read the refreshed benchmarks).
+    """
+    conn = connect(settings.DB_PATH)
+    full = ensure_feature_table(conn) or full
+
+    watermark = stage_watermark(conn, STAGE)
+    run_id = latest_ingest_run_id(conn)
+    full = full or watermark is None
+    periods = [] if full else changed_periods(conn, watermark)
+
+    print("Refreshing provider feature store...")
+    _stage_affected_npis(conn, periods, full)
+    affected = conn.execute("SELECT COUNT(*) FROM affected_npis").fetchone()[0]
+
+    if affected:
+        row_features = ",\n".join(f"{f.sql} AS {f.name}" for f in FEATURE_CATALOG if f.level == "row")
+        monthly_features = ",\n".join(f"{f.sql} AS {f.name}" for f in FEATURE_CATALOG if f.level == "monthly")
+        columns = ", ".join(f.name for f in FEATURE_CATALOG)
+
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute("DELETE FROM provider_features WHERE npi IN (SELECT npi FROM affected_npis)")
+        conn.execute(f"""
+            INSERT INTO provider_features (npi, taxonomy_desc, periods, {columns})
+            WITH feature_rows AS (
+                SELECT
+                    s.billing_npi, s.period, s.hcpcs_code, s.total_paid, s.total_claims, s.unique_beneficiaries,
+                    (s.total_paid / NULLIF(s.total_claims, 0)) / NULLIF(b.avg_price_per_claim, 0) AS peer_price_ratio
+                FROM medicaid_spend s
+                SEMI JOIN affected_npis a ON s.billing_npi = a.npi
+                LEFT JOIN providers p ON s.billing_npi = p.npi
+                LEFT JOIN benchmarks b ON p.taxonomy_desc = b.taxonomy_desc AND s.period = b.period AND s.hcpcs_code = b.hcpcs_code
+            ),
+            monthly AS (
+                SELECT
+                    billing_npi,
+                    period,
+                    SUM(total_paid) AS monthly_paid,
+                    SUM(total_claims) AS monthly_claims,
+                    SUM(unique_beneficiaries) AS monthly_beneficiaries
+                FROM feature_rows
+                GROUP BY 1, 2
+            ),
+            by_row AS (
+                SELECT billing_npi, LIST(DISTINCT period) AS periods, {row_features}
+                FROM feature_rows
+                GROUP BY 1
+            ),
+            by_month AS (
+                SELECT billing_npi, {monthly_features}
+                FROM monthly
+                GROUP BY 1
+            )
+            SELECT r.billing_npi, p.taxonomy_desc, r.periods, {columns}
+            FROM by_row r
+            LEFT JOIN by_month m ON r.billing_npi = m.billing_npi
+            LEFT JOIN providers p ON r.billing_npi = p.npi
+        """)
+        set_stage_watermark(conn, STAGE, run_id)
+        conn.execute("COMMIT")
+    else:
+        set_stage_watermark(conn, STAGE, run_id)
+
+    print(f"Provider features refreshed for {affected} providers{' (full rebuild)' if full else ''}.")
+    conn.close()
+    return affected
+
+if __name__ == "__main__":
+    refresh_provider_features()
@@ -0,0 +1,182 @@
+import json
+import threading
+
+from src.config import settings
+from src.ingestion.ledger import latest_ingest_run_id
+from src.analysis.rollup import write_provider_rollup
+from src.analysis.dossiers import write_provider_dossiers
+
+# Screening runs. Each stage writes its flags into risk_flag_history under the
+# current run_id and claims the flag types it recomputed; publishing carries the
+# unclaimed types forward from the previous run, records the diff, flips the
+# risk_flags view to the new run and rebuilds the rollup and dossiers read from
+# it in one transaction. Runs older than the last FLAG_RUNS_KEPT are archived:
+# their flags are dropped from risk_flag_history, their diffs are kept.
+
+RISK_FLAGS_VIEW_SQL = """
+    CREATE OR REPLACE VIEW risk_flags AS
+    SELECT npi, flag_type, flag_score, reason, detected_at
+    FROM risk_flag_history
+    WHERE run_id = (SELECT MAX(run_id) FROM flag_runs WHERE status = 'published')
+"""
+
+# Per (npi, flag_type) comparison of two runs ($previous vs $current)
+DIFF_SQL = """
+    WITH previous AS (
+        SELECT npi, flag_type, MAX(flag_score) AS score
+        FROM risk_flag_history WHERE run_id = $previous GROUP BY 1, 2
+    ),
+    current AS (
+        SELECT npi, flag_type, MAX(flag_score) AS score
+        FROM risk_flag_history WHERE run_id = $current GROUP BY 1, 2
+    )
+    SELECT
+        $current AS run_id,
+        $previous AS previous_run_id,
+        COALESCE(c.npi, p.npi) AS npi,
+        COALESCE(c.flag_type, p.flag_type) AS flag_type,
+        CASE
+            WHEN p.npi IS NULL THEN 'NEW'
+            WHEN c.npi IS NULL THEN 'RESOLVED'
+            ELSE 'SCORE_CHANGED'
+        END AS change_type,
+        p.score AS previous_score,
+        c.score AS current_score
+    FROM current c
+    FULL OUTER JOIN previous p ON c.npi = p.npi AND c.flag_type = p.flag_type
+    WHERE p.npi IS NULL OR c.npi IS NULL
+       OR (c.score IS DISTINCT FROM p.score
+           AND NOT COALESCE(abs(c.score - p.score) <= 1e-9 * greatest(abs(p.score), 1), FALSE))
+"""
+
+def run_config():
+    """Thresholds and model settings recorded with each run."""
+    keys = [
+        "Z_SCORE_THRESHOLD", "ROBUST_Z_THRESHOLD", "MIN_PEER_COUNT", "SUDDEN_UTILIZATION_LIMIT",
+        "EXTREME_CONCENTRATION_THRESHOLD", "MIN_CONCENTRATION_SPEND", "VOLUME_OUTLIER_MULTIPLIER",
+        "MIN_VOLUME_CLAIMS", "ML_MODE", "ML_CONTAMINATION",
+    ]
+    return {k: getattr(settings, k) for k in keys}
+
+def ensure_risk_flags_view(conn):
+    """
+    Replace a legacy risk_flags table with the view, keeping its rows as the
+    first published run so the next run has something to diff against.
+    """
+    legacy = conn.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_name = 'risk_flags' AND table_type = 'BASE TABLE'
+    """).fetchone()[0]
+    if not legacy:
+        return
+    conn.execute("BEGIN TRANSACTION")
+    if conn.execute("SELECT COUNT(*) FROM risk_flags").fetchone()[0]:
+        run_id = conn.execute("SELECT COALESCE(MAX(run_id), 0) + 1 FROM flag_runs").fetchone()[0]
+        conn.execute("""
+            INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason, detected_at)
+            SELECT ?, npi, flag_type, flag_score, reason, detected_at FROM risk_flags
+        """, [run_id])
+        conn.execute("""
+            INSERT INTO flag_runs (run_id, status, flag_types, config, published_at)
+            SELECT ?, 'published', LIST(DISTINCT flag_type), '{"migrated": true}', now() FROM risk_flags
+        """, [run_id])
+    conn.execute("DROP TABLE risk_flags")
+    conn.execute(RISK_FLAGS_VIEW_SQL)
+    conn.execute("COMMIT")
+
+def latest_published_run_id(conn):
+    return conn.execute("SELECT MAX(run_id) FROM flag_runs WHERE status = 'published'").fetchone()[0]
+
+def start_flag_run(conn):
+    """Open a new screening run and return its run_id. Abandoned unpublished runs are discarded."""
+    ensure_risk_flags_view(conn)
+    conn.execute("DELETE FROM risk_flag_history WHERE run_id IN (SELECT run_id FROM flag_runs WHERE status = 'building')")
+    conn.execute("DELETE FROM flag_runs WHERE status = 'building'")
+    run_id = conn.execute("SELECT COALESCE(MAX(run_id), 0) + 1 FROM flag_runs").fetchone()[0]
+    conn.execute("""
+        INSERT INTO flag_runs (run_id, status, ingest_run_id, flag_types, config)
+        VALUES (?, 'building', ?, [], ?)
+    """, [run_id, latest_ingest_run_id(conn), json.dumps(run_config())])
+    return run_id
+
+# Screening stages running side by side all update their run's flag_runs row
+_claim_lock = threading.Lock()
+
+def claim_flag_types(conn, run_id, flag_types):
+    """Mark `flag_types` as recomputed by this run (not carried forward on publish)."""
+    with _claim_lock:
+        conn.execute("""
+            UPDATE flag_runs SET flag_types = list_distinct(list_concat(flag_types, ?))
+            WHERE run_id = ?
+        """, [list(flag_types), run_id])
+
+def publish_flag_run(conn, run_id):
+    """
+    Carry forward the flag types this run did not recompute, store its diff
+    against the previous published run and make it the visible run, rebuilding
+    provider_rollup and the flagged providers' dossiers in the same transaction.
+    Published runs past FLAG_RUNS_KEPT are archived. Returns {change_type: count}.
+    """
+    previous = latest_published_run_id(conn)
+
+    conn.execute("BEGIN TRANSACTION")
+    if previous is not None:
+        conn.execute("""
+            INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason, detected_at)
+            SELECT ?, npi, flag_type, flag_score, reason, detected_at
+            FROM risk_flag_history
+            WHERE run_id = ?
+              AND NOT list_contains((SELECT flag_types FROM flag_runs WHERE run_id = ?), flag_type)
+        """, [run_id, previous, run_id])
+    conn.execute(f"INSERT INTO flag_run_diffs {DIFF_SQL}", {"previous": previous, "current": run_id})
+    conn.execute("UPDATE flag_runs SET status = 'published', published_at = now() WHERE run_id = ?", [run_id])
+    archived = archive_flag_runs(conn)
+    write_provider_rollup(conn)
+    write_provider_dossiers(conn)
+    conn.execute("COMMIT")
+
+    counts = dict(conn.execute(
+        "SELECT change_type, COUNT(*) FROM flag_run_diffs WHERE run_id = ? GROUP BY 1", [run_id]
+    ).fetchall())
+    print(f"Published flag run {run_id}: " + (", ".join(f"{n} {t.lower()}" for t, n in sorted(counts.items())) or "no changes"))
+    if archived:
+        print(f"Archived {len(archived)} old flag runs: {', '.join(map(str, archived))}")
+    rows, flagged = conn.execute("SELECT COUNT(*), COUNT(*) FILTER (flag_count > 0) FROM provider_rollup").fetchone()
+    print(f"Provider rollup and dossiers rebuilt: {rows} providers, {flagged} flagged.")
+    return counts
+
+def archive_flag_runs(conn):
+    """Drop the flags of published runs older than the last FLAG_RUNS_KEPT; returns their run_ids."""
+    if not settings.FLAG_RUNS_KEPT:
+        return []
+    archived = [r for (r,) in conn.execute("""
+        SELECT run_id FROM flag_runs WHERE status = 'published'
+        ORDER BY run_id DESC OFFSET ?
+    """, [settings.FLAG_RUNS_KEPT]).fetchall()]
+    if archived:
+        conn.execute("DELETE FROM risk_flag_history WHERE list_contains(?, run_id)", [archived])
+        conn.execute("UPDATE flag_runs SET status = 'archived' WHERE list_contains(?, run_id)", [archived])
+    return sorted(archived)
+
+def changes_since(conn, since_run_id=None):
+    """
+    Flag changes between `since_run_id` and the latest published run (default:
+    the changes the latest run introduced), as flag_run_diffs rows plus the
+    provider name. Raises ValueError when `since_run_id` is not a published
+    run still holding its flags.
+    """
+    current = latest_published_run_id(conn)
+    if since_run_id is not None:
+        status = conn.execute("SELECT status FROM flag_runs WHERE run_id = ?", [since_run_id]).fetchone()
+        if status is None or status[0] != "published":
+            raise ValueError(f"Flag run {since_run_id} is not a published run with its flags kept")
+    if since_run_id is None:
+        diff, params = "SELECT * FROM flag_run_diffs WHERE run_id = $current", {"current": current}
+    else:
+        diff, params = DIFF_SQL, {"previous": since_run_id, "current": current}
+    return conn.execute(f"""
+        SELECT d.*, p.name
+        FROM ({diff}) d
+        LEFT JOIN providers p ON d.npi = p.npi
+        ORDER BY d.npi, d.flag_type
+    """, params).df()
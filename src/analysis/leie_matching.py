@@ -0,0 +1,270 @@
+import functools
+
+from src.config import settings
+from src.instrumentation import connect
+from src.analysis.flag_runs import claim_flag_types, publish_flag_run, start_flag_run
+from src.ingestion.ingest_leie import ACTIVE_SQL
+
+# Matching the provider roster against the OIG LEIE beyond exact NPIs (most
+# LEIE rows have NPI 0). Both sides are normalized into entities (individual
+# providers, organizations' authorized officials, organizations), candidate
+# pairs are generated only inside blocks that share a key, and every pair is
+# scored in one vectorized pass:
+#
+#   individuals   soundex(last) + zip3, or soundex(last) + soundex(first) + state
+#   businesses    first name token + zip3, or the full normalized name
+#
+# Each block join is an equi-join, so cost grows with roster size plus the
+# size of the blocks, not roster x LEIE. Providers carry no date of birth, so
+# the LEIE DOB is reported as evidence but cannot be used as a key.
+#
+# A shared name and neighbourhood alone is what namesakes have in common, so
+# an individual's score stays just under LEIE_MATCH_FLAG_SCORE unless a second
+# signal agrees: the street address or the middle initial.
+
+# Street addresses at least this similar corroborate an individual's name match
+ADDRESS_AGREES = 0.9
+
+FLAG_TYPE = "LEIE_MATCH"
+
+BUSINESS_STOPWORDS = "LLC|L L C|INC|INCORPORATED|CORP|CORPORATION|CO|COMPANY|PC|PLLC|PS|LTD|LLP|LP|THE|DBA|OF|AND"
+# Titles before and generational suffixes / credentials after a person's name ('DR JOHN SMITH JR MD')
+NAME_PREFIXES = "DR|MR|MRS|MS|MISS"
+NAME_SUFFIXES = ("JR|SR|II|III|IV|MD|M D|DO|D O|PHD|PH D|PSYD|DDS|DMD|DPM|DC|OD|PHARMD|RPH|NP|FNP|ARNP|APRN|CRNA|"
+                 "PA|PAC|RN|LPN|BSN|MSN|CNA|LCSW|LICSW|MSW|LMHC|LMFT|LPC|PT|DPT|OT|OTR|MPH|MBA")
+
+def _norm(expr):
+    return f"trim(regexp_replace(regexp_replace(upper(COALESCE({expr}, '')), '[^A-Z0-9]+', ' ', 'g'), '\\s+', ' ', 'g'))"
+
+def _business(expr):
+    return f"trim(regexp_replace(regexp_replace({_norm(expr)}, '\\b({BUSINESS_STOPWORDS})\\b', '', 'g'), '\\s+', ' ', 'g'))"
+
+def _person(expr):
+    # Affixes are only dropped while a first and last name remain ('ANH DO' keeps its surname)
+    stripped = f"regexp_replace(regexp_replace({_norm(expr)}, '^(({NAME_PREFIXES}) )+', ''), '( ({NAME_SUFFIXES}))+$', '')"
+    return f"(CASE WHEN contains({stripped}, ' ') THEN {stripped} ELSE {_norm(expr)} END)"
+
+def _zip5(expr):
+    return f"NULLIF(LEFT(regexp_replace(COALESCE({expr}, ''), '[^0-9]', '', 'g'), 5), '')"
+
+@functools.lru_cache(maxsize=None)
+def soundex(name):
+    """American Soundex code of a name (None for names without letters)."""
+    letters = [c for c in (name or "").upper() if "A" <= c <= "Z"]
+    if not letters:
+        return None
+    codes = {c: d for d, group in enumerate(["AEIOUY", "BFPV", "CGJKQSXZ", "DT", "L", "MN", "R"]) for c in group}
+    result, previous = letters[0], codes.get(letters[0])
+    for c in letters[1:]:
+        if c in "HW":
+            continue  # H and W do not separate letters with the same code
+        code = codes[c]
+        if code and code != previous:
+            result += str(code)
+        previous = code
+    return (result + "000")[:4]
+
+def register_matching_functions(conn):
+    conn.create_function("soundex", soundex, ["VARCHAR"], "VARCHAR", null_handling="special")
+
+def _stage_entities(conn):
+    """TEMP leie_entities (active exclusions) and roster_entities (providers as individuals/businesses)."""
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE leie_entities AS
+        WITH base AS (
+            SELECT
+                leie_key,
+                NULLIF(regexp_replace(COALESCE(npi, ''), '^0*$', ''), '') AS npi,
+                {_norm('last_name')} AS last, {_norm('first_name')} AS first,
+                {_business('bus_name')} AS business,
+                {_zip5('zip')} AS zip5, {_norm('city')} AS city, upper(state) AS state, {_norm('address')} AS address,
+                NULLIF(LEFT({_norm('mid_name')}, 1), '') AS mid_initial,
+                COALESCE(NULLIF(trim(bus_name), ''), trim(concat_ws(' ', first_name, mid_name, last_name))) AS leie_name,
+                NULLIF(dob, '') AS dob, excl_type, excl_date
+            FROM leie_exclusions
+            -- active exclusions only
+            WHERE {ACTIVE_SQL}
+        )
+        SELECT
+            *,
+            CASE WHEN last <> '' THEN 'individual' ELSE 'business' END AS kind,
+            soundex(last) AS sx_last, soundex(first) AS sx_first,
+            split_part(business, ' ', 1) AS business_token,
+            LEFT(zip5, 3) AS zip3
+        FROM base
+    """)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE roster_entities AS
+        WITH entities AS (
+            -- Individual providers: name is '[TITLE] FIRST [MIDDLE] LAST [SUFFIX] [CREDENTIALS]'
+            SELECT npi, 'INDIVIDUAL' AS match_type, 'individual' AS kind, name AS matched_name, {_person('name')} AS full_name,
+                   postal_code AS zip, city, state, practice_address AS address
+            FROM providers WHERE org_type IS DISTINCT FROM 'NPI-2'
+            UNION ALL
+            -- People running organizations
+            SELECT npi, 'AUTH_OFFICIAL', 'individual', auth_official_name, {_person('auth_official_name')},
+                   COALESCE(mailing_zip, postal_code), COALESCE(mailing_city, city), COALESCE(mailing_state, state), mailing_address
+            FROM providers WHERE org_type IS DISTINCT FROM 'NPI-1' AND auth_official_name IS NOT NULL
+            UNION ALL
+            SELECT npi, 'BUSINESS', 'business', name, {_business('name')},
+                   postal_code, city, state, practice_address
+            FROM providers WHERE org_type IS DISTINCT FROM 'NPI-1'
+        )
+        SELECT
+            *,
+            soundex(last) AS sx_last, soundex(first) AS sx_first,
+            split_part(business, ' ', 1) AS business_token
+        FROM (
+            SELECT
+                ROW_NUMBER() OVER () AS rid,
+                npi, match_type, kind, matched_name,
+                CASE WHEN kind = 'individual' THEN split_part(full_name, ' ', -1) END AS last,
+                CASE WHEN kind = 'individual' THEN split_part(full_name, ' ', 1) END AS first,
+                CASE WHEN kind = 'individual' AND full_name LIKE '% % %' THEN LEFT(split_part(full_name, ' ', 2), 1) END AS mid_initial,
+                CASE WHEN kind = 'business' THEN full_name END AS business,
+                {_zip5('zip')} AS zip5, LEFT({_zip5('zip')}, 3) AS zip3,
+                {_norm('city')} AS city, upper(state) AS state, {_norm('address')} AS address
+            FROM entities
+            WHERE full_name <> ''
+        )
+    """)
+
+def _stage_candidates(conn):
+    """TEMP leie_candidates: distinct (rid, leie_key) pairs sharing at least one blocking key."""
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE leie_candidates AS
+        SELECT r.rid, l.leie_key, 'npi' AS block
+        FROM roster_entities r JOIN leie_entities l ON r.npi = l.npi
+        WHERE r.match_type IN ('INDIVIDUAL', 'BUSINESS')
+        UNION
+        SELECT r.rid, l.leie_key, 'surname_zip3'
+        FROM roster_entities r JOIN leie_entities l
+            ON r.kind = 'individual' AND l.kind = 'individual' AND r.sx_last = l.sx_last AND r.zip3 = l.zip3
+        UNION
+        SELECT r.rid, l.leie_key, 'surname_first_state'
+        FROM roster_entities r JOIN leie_entities l
+            ON r.kind = 'individual' AND l.kind = 'individual'
+           AND r.sx_last = l.sx_last AND r.sx_first = l.sx_first AND r.state = l.state
+        UNION
+        SELECT r.rid, l.leie_key, 'business_token_zip3'
+        FROM roster_entities r JOIN leie_entities l
+            ON r.kind = 'business' AND l.kind = 'business' AND r.business_token = l.business_token AND r.zip3 = l.zip3
+        UNION
+        SELECT r.rid, l.leie_key, 'business_name'
+        FROM roster_entities r JOIN leie_entities l
+            ON r.kind = 'business' AND l.kind = 'business' AND r.business = l.business
+    """)
+
+SCORE_SQL = """
+    WITH pairs AS (
+        SELECT
+            r.npi, r.match_type, r.matched_name, l.kind, l.leie_key, l.leie_name,
+            l.zip5 AS leie_zip, l.city AS leie_city, l.dob, l.excl_type, l.excl_date,
+            LIST(DISTINCT c.block ORDER BY c.block) AS blocks,
+            r.npi = l.npi AS npi_match,
+            jaro_winkler_similarity(r.last, l.last) AS last_sim,
+            jaro_winkler_similarity(r.first, l.first) AS first_sim,
+            jaro_winkler_similarity(r.business, l.business) AS business_sim,
+            CASE WHEN r.address <> '' AND l.address <> '' THEN jaro_winkler_similarity(r.address, l.address) END AS address_sim,
+            r.mid_initial = l.mid_initial AS middle_initial_match,
+            CASE
+                WHEN r.zip5 = l.zip5 THEN 1.0
+                WHEN r.zip3 = l.zip3 THEN 0.6
+                WHEN r.city = l.city AND r.state = l.state THEN 0.5
+                WHEN r.state = l.state THEN 0.2
+                ELSE 0.0
+            END AS geo_sim,
+            r.zip5 AS provider_zip
+        FROM leie_candidates c
+        JOIN roster_entities r ON c.rid = r.rid
+        JOIN leie_entities l ON c.leie_key = l.leie_key
+        GROUP BY ALL
+    ),
+    corroborated AS (
+        SELECT *, COALESCE(address_sim >= $address_agrees, FALSE) OR COALESCE(middle_initial_match, FALSE) AS corroborated
+        FROM pairs
+    ),
+    scored AS (
+        SELECT
+            *,
+            CASE
+                WHEN npi_match THEN 1.0
+                -- Without a second signal, capped just under the flag threshold
+                WHEN kind = 'individual' THEN least(
+                    0.5 * last_sim + 0.3 * first_sim + 0.2 * greatest(geo_sim, COALESCE(address_sim, 0)),
+                    CASE WHEN corroborated THEN 1.0 ELSE $flag_score - 0.0001 END
+                )
+                ELSE 0.7 * business_sim + 0.3 * greatest(geo_sim, COALESCE(address_sim, 0))
+            END AS score
+        FROM corroborated
+    )
+    SELECT
+        npi, leie_key, CASE WHEN npi_match THEN 'NPI' ELSE match_type END AS match_type,
+        round(score, 4) AS score,
+        ROW_NUMBER() OVER (PARTITION BY npi ORDER BY score DESC, leie_key)::INTEGER AS match_rank,
+        to_json({
+            'matched_name': matched_name, 'leie_name': leie_name, 'blocks': blocks,
+            'last_name_similarity': round(last_sim, 3), 'first_name_similarity': round(first_sim, 3),
+            'business_name_similarity': round(business_sim, 3), 'address_similarity': round(address_sim, 3),
+            'middle_initial_match': middle_initial_match, 'corroborated': corroborated,
+            'provider_zip': provider_zip, 'leie_zip': leie_zip, 'leie_city': leie_city, 'leie_dob': dob
+        })::VARCHAR AS evidence,
+        leie_name, excl_type, excl_date
+    FROM scored
+    WHERE score >= $min_score
+"""
+
+def match_leie_exclusions(run_id=None):
+    """
+    Rebuild leie_matches from blocked candidate pairs and flag each provider
+    whose best match scores at least LEIE_MATCH_FLAG_SCORE under flag run
+    `run_id` (or its own published run).
+    """
+    conn = connect(settings.DB_PATH)
+    standalone = run_id is None
+    if standalone:
+        run_id = start_flag_run(conn)
+
+    print("Matching providers against the OIG LEIE...")
+    register_matching_functions(conn)
+    _stage_entities(conn)
+    _stage_candidates(conn)
+    pairs = conn.execute("SELECT COUNT(*) FROM leie_candidates").fetchone()[0]
+
+    conn.execute("BEGIN TRANSACTION")
+    conn.execute("DELETE FROM leie_matches")
+    conn.execute(f"""
+        INSERT INTO leie_matches (npi, leie_key, match_type, score, match_rank, evidence, leie_name, excl_type, excl_date)
+        {SCORE_SQL}
+    """, {"min_score": settings.LEIE_MATCH_MIN_SCORE, "flag_score": settings.LEIE_MATCH_FLAG_SCORE,
+          "address_agrees": ADDRESS_AGREES})
+    conn.execute("COMMIT")
+
+    conn.execute("DELETE FROM risk_flag_history WHERE run_id = ? AND flag_type = ?", [run_id, FLAG_TYPE])
+    conn.execute("""
+        INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason)
+        SELECT ?, npi, ?, score,
+            CASE match_type
+                WHEN 'NPI' THEN 'NPI listed on the OIG exclusion list'
+                WHEN 'AUTH_OFFICIAL' THEN 'Authorized official resembles excluded individual '
+                WHEN 'BUSINESS' THEN 'Organization name resembles excluded entity '
+                ELSE 'Provider resembles excluded individual '
+            END || CASE WHEN match_type = 'NPI' THEN '' ELSE leie_name END
+            || ' (excluded ' || COALESCE(excl_date, '?') || ', ' || COALESCE(excl_type, '?') || ', match score ' || round(score, 2) || ')'
+        FROM leie_matches
+        WHERE match_rank = 1 AND score >= ?
+    """, [run_id, FLAG_TYPE, settings.LEIE_MATCH_FLAG_SCORE])
+    claim_flag_types(conn, run_id, [FLAG_TYPE])
+
+    matches, flagged = conn.execute("""
+        SELECT COUNT(*), COUNT(*) FILTER (match_rank = 1 AND score >= ?) FROM leie_matches
+    """, [settings.LEIE_MATCH_FLAG_SCORE]).fetchone()
+    print(f"LEIE matching complete: {pairs} candidate pairs, {matches} matches kept, {flagged} providers flagged.")
+
+    if standalone:
+        publish_flag_run(conn, run_id)
+    conn.close()
+    return flagged
+
+if __name__ == "__main__":
+    match_leie_exclusions()
@@ -0,0 +1,56 @@
+import json
+import os
+from dataclasses import dataclass
+
+import joblib
+
+from src.config import settings
+
+@dataclass
+class RegisteredModel:
+    name: str
+    version: int
+    model: object
+    features: list
+    fingerprint: str
+    params: dict
+    age_days: int = 0
+    training_hashes: object = None
+
+def register_model(conn, name, model, features, fingerprint, training_rows, params, training_hashes=None):
+    """
+    Save a fitted estimator as the next version of `name` and record it in
+    model_registry. `training_hashes` (per-row feature hashes) are kept with the
+    artifact so later runs can measure how far the features drifted.
+    """
+    version = conn.execute(
+        "SELECT COALESCE(MAX(version), 0) + 1 FROM model_registry WHERE model_name = ?", [name]
+    ).fetchone()[0]
+    os.makedirs(settings.ML_MODEL_DIR, exist_ok=True)
+    path = os.path.join(str(settings.ML_MODEL_DIR), f"{name}_v{version}.joblib")
+    joblib.dump({"model": model, "features": list(features), "fingerprint": fingerprint, "version": version,
+                 "training_hashes": training_hashes}, path)
+
+    conn.execute("""
+        INSERT INTO model_registry (model_name, version, artifact_path, feature_schema, training_fingerprint, training_rows, params)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [name, version, path, json.dumps(list(features)), fingerprint, training_rows, json.dumps(params, default=str)])
+    print(f"Registered {name} v{version} at {path}")
+    return RegisteredModel(name, version, model, list(features), fingerprint, dict(params), 0, training_hashes)
+
+def load_active_model(conn, name):
+    """Latest registered version of `name` whose artifact is still on disk, or None."""
+    rows = conn.execute("""
+        SELECT version, artifact_path, training_fingerprint, params,
+               date_diff('day', trained_at, CAST(current_timestamp AS TIMESTAMP)) AS age_days
+        FROM model_registry
+        WHERE model_name = ?
+        ORDER BY version DESC
+    """, [name]).fetchall()
+    for version, path, fingerprint, params, age_days in rows:
+        if os.path.exists(path):
+            saved = joblib.load(path)
+            return RegisteredModel(name, version, saved["model"], saved["features"], fingerprint,
+                                   json.loads(params or "{}"), age_days, saved.get("training_hashes"))
+        print(f"Warning: artifact for {name} v{version} is missing at {path}.")
+    return None
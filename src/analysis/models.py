@@ -1,84 +1,167 @@
-import duckdb
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 import numpy as np
 
 from src.config import settings
+from src.instrumentation import connect
+from src.analysis.model_registry import load_active_model, register_model
+from src.analysis.flag_runs import claim_flag_types, publish_flag_run, start_flag_run
 
-def run_ml_analysis():
-    conn = duckdb.connect(settings.DB_PATH)
+MODEL_NAME = "isolation_forest"
+FLAG_TYPE = "ML_ISOLATION_FOREST"
+
+FEATURES = [
+    'total_paid', 
+    'active_months', 
+    'unique_codes', 
+    'avg_price_per_claim', 
+    'avg_peer_price_ratio',
+    'spend_volatility',
+    'beneficiary_ratio'
+]
+
+# Feature Engineering at Provider level (Theme 2: Analytical Depth)
+# Features come from the provider feature store (src/analysis/features.py), which
+# includes spend_volatility (fluctuation in monthly payments) and
+# beneficiary_ratio (patient density). Providers without a specialty have no
+# peer benchmarks and are left out, as before.
+# feature_hash identifies the exact feature values a provider was last scored on.
+FEATURE_SQL = f"""
+    SELECT
+        npi,
+        {', '.join(f'COALESCE({f}, 0) AS {f}' for f in FEATURES)},
+        hash({', '.join(f'COALESCE({f}, 0)' for f in FEATURES)}) AS feature_hash
+    FROM provider_features
+    WHERE taxonomy_desc IS NOT NULL
+"""
+
+def training_params():
+    """Estimator parameters that change the fitted model; a registered model trained with others is refitted."""
+    return {"contamination": settings.ML_CONTAMINATION, "random_state": 42}
+
+def training_fingerprint(conn):
+    """Order-independent fingerprint of the feature values in ml_features."""
+    return conn.execute("SELECT COUNT(*) || ':' || SUM(feature_hash)::HUGEINT FROM ml_features").fetchone()[0]
+
+def train_model(conn):
+    """Fit a new Isolation Forest on every provider in ml_features and register it."""
+    df = conn.execute("SELECT * FROM ml_features").df()
+    fingerprint = training_fingerprint(conn)
+
+    print(f"Training Isolation Forest on {len(df)} providers with enhanced temporal features...")
+    model = IsolationForest(**training_params(), n_jobs=settings.ML_N_JOBS)
+    model.fit(df[FEATURES])
+    return register_model(conn, MODEL_NAME, model, FEATURES, fingerprint, len(df), model.get_params(),
+                          df['feature_hash'].to_numpy())
+
+def feature_drift(conn, active):
+    """
+    Share of providers whose feature values are not among those `active` was
+    trained on (new, changed or dropped providers), or None when the model did
+    not keep its training hashes.
+    """
+    if active.fingerprint == training_fingerprint(conn):
+        return 0.0
+    if active.training_hashes is None:
+        return None
+    current = conn.execute("SELECT feature_hash FROM ml_features").df()['feature_hash'].to_numpy()
+    trained = np.asarray(active.training_hashes)
+    matched = np.isin(current, trained).sum()
+    return 1 - matched / max(len(current), len(trained))
+
+def retrain_reason(conn, active):
+    """Why auto mode should refit instead of scoring with `active`, or None to keep it."""
+    params = training_params()
+    if {k: active.params.get(k) for k in params} != params:
+        return "was trained with different parameters"
+    if settings.ML_MAX_MODEL_AGE_DAYS and active.age_days >= settings.ML_MAX_MODEL_AGE_DAYS:
+        return f"is {active.age_days} days old"
+    drift = feature_drift(conn, active)
+    if drift is not None and drift > settings.ML_RETRAIN_DRIFT:
+        return f"was trained before {drift:.0%} of providers' features changed"
+    return None
+
+def run_ml_analysis(mode=None, run_id=None):
+    """
+    Score providers with the registered Isolation Forest.
+
+    Only providers whose features changed since they were last scored (or that
+    were scored by another model version) are run through the model. A model is
+    fitted when `mode` (default ML_MODE) is "train", or in "auto" mode when no
+    registered model matches the current feature schema, it was trained with
+    other parameters, or it is past ML_MAX_MODEL_AGE_DAYS or ML_RETRAIN_DRIFT
+    (see retrain_reason). Outliers are written
+    under flag run `run_id`, or under a new flag run that is published here.
+    """
+    mode = mode or settings.ML_MODE
+    conn = connect(settings.DB_PATH)
+    standalone = run_id is None
     
     print("Preparing feature matrix for ML Anomaly Detection...")
-    
-    # Feature Engineering at Provider level (Theme 2: Analytical Depth)
-    # We now add:
-    # - spend_volatility: fluctuation in monthly payments
-    # - beneficiary_ratio: patient density (claims per unique beneficiary)
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE ml_features AS {FEATURE_SQL}")
+    if not conn.execute("SELECT COUNT(*) FROM ml_features").fetchone()[0]:
+        print("No providers with benchmarked spend to score.")
+        conn.close()
+        return
+    if standalone:
+        run_id = start_flag_run(conn)
+
+    active = None if mode == "train" else load_active_model(conn, MODEL_NAME)
+    if active is not None and active.features != FEATURES:
+        print(f"Registered {MODEL_NAME} v{active.version} was trained on a different feature schema.")
+        active = None
+    if active is not None and mode == "auto":
+        reason = retrain_reason(conn, active)
+        if reason:
+            print(f"Registered {MODEL_NAME} v{active.version} {reason}; retraining.")
+            active = None
+    if active is None:
+        if mode == "score":
+            conn.close()
+            raise RuntimeError(f"ML_MODE=score but no usable {MODEL_NAME} model is registered; run with ML_MODE=train first.")
+        active = train_model(conn)
+
     df = conn.execute("""
-        WITH provider_monthly AS (
-            SELECT 
-                billing_npi,
-                period,
-                SUM(total_paid) as monthly_paid,
-                SUM(total_claims) as monthly_claims,
-                SUM(unique_beneficiaries) as monthly_beneficiaries
-            FROM medicaid_spend
-            GROUP BY 1, 2
-        ),
-        provider_stats AS (
-            SELECT 
-                billing_npi,
-                STDDEV(monthly_paid) as spend_volatility,
-                SUM(monthly_claims) / NULLIF(SUM(monthly_beneficiaries), 0) as beneficiary_ratio
-            FROM provider_monthly
-            GROUP BY 1
-        )
-        SELECT 
-            s.billing_npi,
-            SUM(s.total_paid) as total_paid,
-            COUNT(DISTINCT s.period) as active_months,
-            COUNT(DISTINCT s.hcpcs_code) as unique_codes,
-            SUM(s.total_paid) / NULLIF(SUM(s.total_claims), 0) as avg_price_per_claim,
-            AVG((s.total_paid / NULLIF(s.total_claims, 0)) / NULLIF(b.avg_price_per_claim, 0)) as avg_peer_price_ratio,
-            MAX(st.spend_volatility) as spend_volatility,
-            MAX(st.beneficiary_ratio) as beneficiary_ratio
-        FROM medicaid_spend s
-        JOIN providers p ON s.billing_npi = p.npi
-        JOIN benchmarks b ON p.taxonomy_desc = b.taxonomy_desc AND s.period = b.period AND s.hcpcs_code = b.hcpcs_code
-        LEFT JOIN provider_stats st ON s.billing_npi = st.billing_npi
-        GROUP BY 1
-    """).df()
-    
-    # Clean data (remove NaN)
-    df = df.fillna(0)
-    
-    features = [
-        'total_paid', 
-        'active_months', 
-        'unique_codes', 
-        'avg_price_per_claim', 
-        'avg_peer_price_ratio',
-        'spend_volatility',
-        'beneficiary_ratio'
-    ]
-    X = df[features]
-    
-    print(f"Training Isolation Forest on {len(df)} providers with enhanced temporal features...")
-    model = IsolationForest(contamination=0.03, random_state=42) # Increased to 3% for deeper signals
-    df['anomaly_score'] = model.fit_predict(X)
-    
-    # IsolationForest returns -1 for outliers
-    outliers = df[df['anomaly_score'] == -1]
-    
-    print(f"ML analysis complete. Found {len(outliers)} refined ML anomalies.")
-    
-    # Insert into risk_flags
-    for _, row in outliers.iterrows():
+        SELECT f.* FROM ml_features f
+        LEFT JOIN ml_scores m
+            ON f.npi = m.npi AND m.model_name = ? AND m.model_version = ? AND m.feature_hash = f.feature_hash
+        WHERE m.npi IS NULL
+    """, [active.name, active.version]).df()
+    print(f"Scoring {len(df)} new or changed providers with {active.name} v{active.version}...")
+
+    if len(df):
+        # score_samples is lower for anomalies; IsolationForest.predict flags scores below offset_
+        df['score'] = active.model.score_samples(df[FEATURES])
+        df['is_outlier'] = df['score'] < active.model.offset_
+        df['model_name'] = active.name
+        df['model_version'] = active.version
+        conn.register("new_scores", df[['npi', 'model_name', 'model_version', 'feature_hash', 'score', 'is_outlier']])
         conn.execute("""
-            INSERT INTO risk_flags (npi, flag_type, flag_score, reason)
-            VALUES (?, 'ML_ISOLATION_FOREST', 1.0, 'Global multivariate outlier (High spend/High price/High volume pattern)')
-        """, [str(row['billing_npi'])])
-        
+            INSERT INTO ml_scores (npi, model_name, model_version, feature_hash, score, is_outlier)
+            SELECT npi, model_name, CAST(model_version AS INTEGER), CAST(feature_hash AS UBIGINT), score, is_outlier
+            FROM new_scores
+            ON CONFLICT (npi) DO UPDATE SET
+                model_name = excluded.model_name, model_version = excluded.model_version,
+                feature_hash = excluded.feature_hash, score = excluded.score,
+                is_outlier = excluded.is_outlier, scored_at = now()
+        """)
+        conn.unregister("new_scores")
+    conn.execute("DELETE FROM ml_scores WHERE npi NOT IN (SELECT npi FROM ml_features)")
+
+    # Insert into risk_flags (flag_score is the negated score_samples: higher is more anomalous)
+    conn.execute("DELETE FROM risk_flag_history WHERE run_id = ? AND flag_type = ?", [run_id, FLAG_TYPE])
+    conn.execute("""
+        INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason)
+        SELECT ?, npi, ?, -score, 'Global multivariate outlier (High spend/High price/High volume pattern)'
+        FROM ml_scores
+        WHERE is_outlier
+    """, [run_id, FLAG_TYPE])
+    claim_flag_types(conn, run_id, [FLAG_TYPE])
+    outliers = conn.execute("SELECT COUNT(*) FROM ml_scores WHERE is_outlier").fetchone()[0]
+    print(f"ML analysis complete. Found {outliers} refined ML anomalies.")
+
+    if standalone:
+        publish_flag_run(conn, run_id)
     conn.close()
 
 if __name__ == "__main__":
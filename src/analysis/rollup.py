@@ -0,0 +1,89 @@
+import duckdb
+
+from src.config import settings
+from src.analysis.benchmarks import ensure_benchmarks_view
+from src.analysis.dossiers import write_provider_dossiers
+
+# provider_rollup is small (one row per provider) and built from other rollups
+# (provider_features, the published risk_flags), so it is rebuilt in full.
+# Rows are inserted in dashboard order: a top-N read by dashboard_rank only
+# touches the first row groups.
+
+ROLLUP_SQL = """
+    WITH flag_types AS (
+        SELECT npi, flag_type, COUNT(*) AS n, MAX(flag_score) AS max_score
+        FROM risk_flags
+        GROUP BY 1, 2
+    ),
+    flags AS (
+        SELECT
+            npi,
+            SUM(n)::INTEGER AS flag_count,
+            map_from_entries(LIST((flag_type, n::INTEGER) ORDER BY flag_type)) AS flag_type_counts,
+            MAX(max_score) AS max_flag_score
+        FROM flag_types
+        GROUP BY 1
+    )
+    SELECT
+        ROW_NUMBER() OVER (
+            ORDER BY COALESCE(fl.flag_count, 0) DESC, COALESCE(pf.total_paid, 0) DESC, p.npi
+        )::INTEGER AS dashboard_rank,
+        p.npi, p.name, p.taxonomy_desc, p.city, p.state,
+        COALESCE(p.is_excluded, FALSE) AS is_excluded,
+        p.risk_score,
+        pf.total_paid AS total_spend,
+        pf.total_claims,
+        pf.first_period,
+        pf.last_period,
+        COALESCE(fl.flag_count, 0) AS flag_count,
+        fl.flag_type_counts,
+        fl.max_flag_score,
+        (SELECT MAX(run_id) FROM flag_runs WHERE status = 'published') AS flag_run_id
+    FROM providers p
+    LEFT JOIN provider_features pf ON p.npi = pf.npi
+    LEFT JOIN flags fl ON p.npi = fl.npi
+    ORDER BY dashboard_rank
+"""
+
+def write_provider_rollup(conn):
+    """Replace provider_rollup's rows inside the caller's transaction."""
+    conn.execute("DELETE FROM provider_rollup")
+    conn.execute(f"""
+        INSERT INTO provider_rollup (
+            dashboard_rank, npi, name, taxonomy_desc, city, state, is_excluded, risk_score,
+            total_spend, total_claims, first_period, last_period,
+            flag_count, flag_type_counts, max_flag_score, flag_run_id
+        )
+        {ROLLUP_SQL}
+    """)
+
+def build_provider_rollup(conn=None):
+    """Rebuild provider_rollup from providers, provider_features and the published flags."""
+    own = conn is None
+    if own:
+        conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("BEGIN TRANSACTION")
+    write_provider_rollup(conn)
+    conn.execute("COMMIT")
+    rows, flagged = conn.execute("SELECT COUNT(*), COUNT(*) FILTER (flag_count > 0) FROM provider_rollup").fetchone()
+    print(f"Provider rollup rebuilt: {rows} providers, {flagged} flagged.")
+    if own:
+        conn.close()
+    return rows
+
+def refresh_provider_details(conn, npis):
+    """
+    Rebuild provider_rollup and the dossiers of `npis` after their providers
+    rows changed outside a flag run (enrichment, roster loads), so the
+    dashboard shows the new details once published.
+    """
+    # Dossiers read peer prices from the benchmarks view, which may predate the first benchmark run
+    ensure_benchmarks_view(conn)
+    conn.execute("BEGIN TRANSACTION")
+    write_provider_rollup(conn)
+    write_provider_dossiers(conn, npis)
+    conn.execute("COMMIT")
+    print(f"Provider rollup and dossiers refreshed for {len(npis)} updated providers.")
+
+if __name__ == "__main__":
+    build_provider_rollup()
@@ -1,137 +1,280 @@
-import duckdb
-import pandas as pd
+import re
+from dataclasses import dataclass
 
 from src.config import settings
+from src.instrumentation import connect
+from src.analysis.benchmarks import PERCENTILE_CUTOFF
+from src.analysis.sketches import register_sketch_functions
+from src.analysis.flag_runs import claim_flag_types, publish_flag_run, start_flag_run
 
-def screen_providers():
-    conn = duckdb.connect(settings.DB_PATH)
-    
-    print("Screening providers against simple rules...")
-    conn.execute("DELETE FROM risk_flags")
-    
+@dataclass
+class Rule:
+    """
+    One screen in the rule registry.
+
+    `grain` picks the row set the rule is evaluated over: 'spend' is one
+    medicaid_spend row enriched with its provider, peer benchmark and provider
+    totals; 'provider' is one provider_features row (every catalog feature). `predicate`, `score`
+    and `evidence` are SQL expressions over that row set and may reference
+    settings as $parameters (see rule_params).
+    """
+    flag_type: str
+    grain: str
+    predicate: str
+    score: str
+    evidence: str
+
+# Providers whose business model legitimately concentrates on one code
+CONCENTRATION_EXEMPT_TAXONOMIES = (
+    "'Ambulance', 'Clinical Medical Laboratory', 'End‑Stage Renal Disease (ESRD) Treatment Facility', "
+    "'Interpreter', 'Transportation Broker', 'Non-emergency Medical Transport (NEMT)'"
+)
+
+RULES = [
     # 1. Price Outlier Screen (Z-score based)
-    conn.execute("""
-        INSERT INTO risk_flags (npi, flag_type, flag_score, reason)
-        SELECT 
-            s.billing_npi,
-            'PRICE_Z_SCORE_OUTLIER',
-            ((s.total_paid / NULLIF(s.total_claims, 0)) - b.avg_price_per_claim) / NULLIF(b.stddev_price_per_claim, 0),
-            'High Price Evidence: Billed avg $' || ROUND(s.total_paid / s.total_claims, 2) || 
-            ' for code ' || s.hcpcs_code || ' which is ' || 
-            ROUND(((s.total_paid / s.total_claims) - b.avg_price_per_claim) / NULLIF(b.stddev_price_per_claim, 0), 1) || 
-            ' std devs above the peer average of $' || ROUND(b.avg_price_per_claim, 2)
-        FROM medicaid_spend s
-        JOIN providers p ON s.billing_npi = p.npi
-        JOIN benchmarks b ON p.taxonomy_desc = b.taxonomy_desc AND s.period = b.period AND s.hcpcs_code = b.hcpcs_code
-        WHERE ((s.total_paid / NULLIF(s.total_claims, 0)) - b.avg_price_per_claim) > ? * b.stddev_price_per_claim
-          AND s.total_paid > 20000 
-          AND b.peer_count >= ?
-    """, [settings.Z_SCORE_THRESHOLD, settings.MIN_PEER_COUNT])
-    
+    Rule(
+        flag_type="PRICE_Z_SCORE_OUTLIER",
+        grain="spend",
+        predicate="""
+            (price_per_claim - avg_price_per_claim) > $z_score_threshold * stddev_price_per_claim
+            AND total_paid > 20000
+            AND peer_count >= $min_peer_count
+        """,
+        score="(price_per_claim - avg_price_per_claim) / NULLIF(stddev_price_per_claim, 0)",
+        evidence="""
+            'High Price Evidence: Billed avg $' || ROUND(total_paid / total_claims, 2) ||
+            ' for code ' || hcpcs_code || ' which is ' ||
+            ROUND(((total_paid / total_claims) - avg_price_per_claim) / NULLIF(stddev_price_per_claim, 0), 1) ||
+            ' std devs above the peer average of $' || ROUND(avg_price_per_claim, 2)
+        """,
+    ),
     # 2. Extreme Concentration Screen
-    conn.execute("""
-        INSERT INTO risk_flags (npi, flag_type, flag_score, reason)
-        WITH provider_totals AS (
-            SELECT billing_npi, SUM(total_paid) as sum_paid FROM medicaid_spend GROUP BY 1
-        )
-        SELECT 
-            s.billing_npi,
-            'EXTREME_CONCENTRATION',
-            (s.total_paid / pt.sum_paid),
-            'Concentration Evidence: A single code (' || s.hcpcs_code || ') accounts for ' || 
-            ROUND((s.total_paid / pt.sum_paid) * 100, 1) || '% of total revenue ($' || 
-            ROUND(s.total_paid/1000, 1) || 'k out of $' || ROUND(pt.sum_paid/1000, 1) || 'k)'
-        FROM medicaid_spend s
-        JOIN provider_totals pt ON s.billing_npi = pt.billing_npi
-        JOIN providers p ON s.billing_npi = p.npi
-        WHERE (s.total_paid / pt.sum_paid) > ?
-          AND pt.sum_paid > ?
-          AND p.taxonomy_desc NOT IN ('Ambulance', 'Clinical Medical Laboratory', 'End‑Stage Renal Disease (ESRD) Treatment Facility', 'Interpreter', 'Transportation Broker', 'Non-emergency Medical Transport (NEMT)')
-          AND p.name NOT LIKE '%TRANSPORT%'
-    """, [settings.EXTREME_CONCENTRATION_THRESHOLD, settings.MIN_CONCENTRATION_SPEND])
-
+    Rule(
+        flag_type="EXTREME_CONCENTRATION",
+        grain="spend",
+        predicate=f"""
+            (total_paid / provider_total_paid) > $extreme_concentration_threshold
+            AND provider_total_paid > $min_concentration_spend
+            AND taxonomy_desc NOT IN ({CONCENTRATION_EXEMPT_TAXONOMIES})
+            AND provider_name NOT LIKE '%TRANSPORT%'
+        """,
+        score="total_paid / provider_total_paid",
+        evidence="""
+            'Concentration Evidence: A single code (' || hcpcs_code || ') accounts for ' ||
+            ROUND((total_paid / provider_total_paid) * 100, 1) || '% of total revenue ($' ||
+            ROUND(total_paid/1000, 1) || 'k out of $' || ROUND(provider_total_paid/1000, 1) || 'k)'
+        """,
+    ),
     # 3. New Entrant (Sudden Utilization) Screen
-    conn.execute("""
-        INSERT INTO risk_flags (npi, flag_type, flag_score, reason)
-        WITH first_month AS (
-            SELECT billing_npi, MIN(period) as min_p, SUM(total_paid) as first_month_spend 
-            FROM medicaid_spend GROUP BY 1
-        )
-        SELECT 
-            billing_npi,
-            'SUDDEN_UTILIZATION',
-            1.0,
-            'Utilization Spike: Provider billed $' || ROUND(first_month_spend/1000, 0) || 
-            'k in their first recorded month (' || CAST(min_p AS VARCHAR) || '), exceeding the $' || 
-            CAST(? / 1000 AS VARCHAR) || 'k monitoring limit.'
-        FROM first_month
-        WHERE min_p > '2020-01-01'
-          AND first_month_spend > ?
-    """, [settings.SUDDEN_UTILIZATION_LIMIT, settings.SUDDEN_UTILIZATION_LIMIT])
-
+    # Compares the provider's total recorded spend against the limit, as the original screen did.
+    Rule(
+        flag_type="SUDDEN_UTILIZATION",
+        grain="provider",
+        predicate="first_period > '2020-01-01' AND provider_total_paid > $sudden_utilization_limit",
+        score="1.0",
+        evidence="""
+            'Utilization Spike: Provider billed $' || ROUND(provider_total_paid/1000, 0) ||
+            'k in their first recorded month (' || CAST(first_period AS VARCHAR) || '), exceeding the $' ||
+            CAST($sudden_utilization_limit / 1000 AS VARCHAR) || 'k monitoring limit.'
+        """,
+    ),
     # 4. Volume Outlier (Claim Mill) Screen
+    Rule(
+        flag_type="VOLUME_OUTLIER",
+        grain="spend",
+        predicate="""
+            total_claims > $volume_outlier_multiplier * (total_peer_claims / peer_count)
+            AND total_claims > $min_volume_claims
+            AND peer_count >= 5
+        """,
+        score="total_claims / (total_peer_claims / peer_count)",
+        evidence="""
+            'Volume Evidence: Billed ' || total_claims || ' claims for code ' || hcpcs_code ||
+            ', which is ' || ROUND(total_claims / (total_peer_claims / peer_count), 1) ||
+            'x more than the peer average (' || ROUND(total_peer_claims / peer_count, 1) || ')'
+        """,
+    ),
+    # 5. Dynamic Percentile Outlier Screen (Theme 2 Enhancement)
+    # Flag the top 1% of spenders within their specialty x code peer group.
+    # The cutoff is precomputed per group from its quantile sketch, the rank
+    # is only looked up for rows that clear it. For large groups the floor is
+    # interpolated, so the rank check confirms rows near the boundary.
+    Rule(
+        flag_type="PERCENTILE_OUTLIER",
+        grain="spend",
+        predicate="""
+            total_paid > paid_rank_floor
+            AND total_paid > 50000 -- Floor to avoid low-value noise
+            AND sketch_percent_rank(paid_sketch, total_paid) >= $percentile_cutoff
+        """,
+        score="sketch_percent_rank(paid_sketch, total_paid)",
+        evidence="""
+            'Statistical Persistence: This provider is in the top ' ||
+            ROUND((1 - sketch_percent_rank(paid_sketch, total_paid)) * 100, 2) || '% of all ' || taxonomy_desc ||
+            ' providers for code ' || hcpcs_code || ' by total spend.'
+        """,
+    ),
+    # 6. Claim Mill Detection (beneficiary ratio)
+    Rule(
+        flag_type="CLAIM_MILL_RATIO",
+        grain="spend",
+        predicate="""
+            unique_beneficiaries > 0
+            AND (CAST(total_claims AS DOUBLE) / unique_beneficiaries) > 20 -- Arbitrary initial threshold for review
+            AND total_paid > 10000
+        """,
+        score="CAST(total_claims AS DOUBLE) / NULLIF(unique_beneficiaries, 0)",
+        evidence="""
+            'Patient Density Risk: Billed ' || total_claims || ' claims to only ' ||
+            unique_beneficiaries || ' patients for code ' || hcpcs_code ||
+            ' (' || ROUND(CAST(total_claims AS DOUBLE) / NULLIF(unique_beneficiaries, 0), 1) || ' claims/patient)'
+        """,
+    ),
+    # 7. Robust Price Outlier Screen (median / MAD, insensitive to the outliers themselves)
+    Rule(
+        flag_type="ROBUST_Z_OUTLIER",
+        grain="spend",
+        predicate="""
+            price_mad > 0
+            AND 0.6745 * (price_per_claim - price_median) / price_mad > $robust_z_threshold
+            AND total_paid > 20000
+            AND peer_count >= $min_peer_count
+        """,
+        score="0.6745 * (price_per_claim - price_median) / price_mad",
+        evidence="""
+            'Robust Price Evidence: Billed avg $' || ROUND(price_per_claim, 2) ||
+            ' for code ' || hcpcs_code || ', a robust z-score of ' ||
+            ROUND(0.6745 * (price_per_claim - price_median) / price_mad, 1) ||
+            ' against the peer median of $' || ROUND(price_median, 2)
+        """,
+    ),
+]
+
+def rule_params():
+    """Values available to rule SQL as $name (lower-cased settings)."""
+    return {
+        "z_score_threshold": settings.Z_SCORE_THRESHOLD,
+        "robust_z_threshold": settings.ROBUST_Z_THRESHOLD,
+        "min_peer_count": settings.MIN_PEER_COUNT,
+        "sudden_utilization_limit": settings.SUDDEN_UTILIZATION_LIMIT,
+        "extreme_concentration_threshold": settings.EXTREME_CONCENTRATION_THRESHOLD,
+        "min_concentration_spend": settings.MIN_CONCENTRATION_SPEND,
+        "volume_outlier_multiplier": settings.VOLUME_OUTLIER_MULTIPLIER,
+        "min_volume_claims": settings.MIN_VOLUME_CLAIMS,
+        "percentile_cutoff": PERCENTILE_CUTOFF,
+    }
+
+def _strip_comments(sql):
+    return re.sub(r"--[^\n]*", "", sql)
+
+def materialize_rule_inputs(conn):
+    """
+    Build the shared row sets once: per-provider aggregates (from the feature
+    store), and every spend row joined to its provider, peer benchmark and
+    provider totals.
+    """
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE rule_provider_rows AS
+        SELECT npi AS billing_npi, total_paid AS provider_total_paid, * EXCLUDE (npi)
+        FROM provider_features
+    """)
     conn.execute("""
-        INSERT INTO risk_flags (npi, flag_type, flag_score, reason)
-        SELECT 
+        CREATE OR REPLACE TEMP TABLE rule_spend_rows AS
+        SELECT
             s.billing_npi,
-            'VOLUME_OUTLIER',
-            s.total_claims / (b.total_peer_claims / b.peer_count),
-            'Volume Evidence: Billed ' || s.total_claims || ' claims for code ' || s.hcpcs_code || 
-            ', which is ' || ROUND(s.total_claims / (b.total_peer_claims / b.peer_count), 1) || 
-            'x more than the peer average (' || ROUND(b.total_peer_claims / b.peer_count, 1) || ')'
+            s.hcpcs_code,
+            s.period,
+            s.total_paid,
+            s.total_claims,
+            s.unique_beneficiaries,
+            s.total_paid / NULLIF(s.total_claims, 0) AS price_per_claim,
+            p.name AS provider_name,
+            p.taxonomy_desc,
+            b.avg_price_per_claim,
+            b.stddev_price_per_claim,
+            b.total_peer_claims,
+            b.peer_count,
+            b.paid_rank_floor,
+            b.price_median,
+            b.price_mad,
+            pr.provider_total_paid
         FROM medicaid_spend s
-        JOIN providers p ON s.billing_npi = p.npi
-        JOIN benchmarks b ON p.taxonomy_desc = b.taxonomy_desc AND s.period = b.period AND s.hcpcs_code = b.hcpcs_code
-        WHERE s.total_claims > ? * (b.total_peer_claims / b.peer_count)
-          AND s.total_claims > ?
-          AND b.peer_count >= 5
-    """, [settings.VOLUME_OUTLIER_MULTIPLIER, settings.MIN_VOLUME_CLAIMS])
+        LEFT JOIN providers p ON s.billing_npi = p.npi
+        LEFT JOIN benchmarks b ON p.taxonomy_desc = b.taxonomy_desc AND s.period = b.period AND s.hcpcs_code = b.hcpcs_code
+        LEFT JOIN rule_provider_rows pr ON s.billing_npi = pr.billing_npi
+    """)
 
-    # 5. Dynamic Percentile Outlier Screen (Theme 2 Enhancement)
-    # Flag the top 1% of spenders within their specialty x code peer group
-    print("Running dynamic percentile screening...")
-    conn.execute("""
-        INSERT INTO risk_flags (npi, flag_type, flag_score, reason)
-        WITH peer_ranks AS (
-            SELECT 
-                s.billing_npi,
-                s.total_paid,
-                s.hcpcs_code,
-                p.taxonomy_desc,
-                PERCENT_RANK() OVER (PARTITION BY p.taxonomy_desc, s.period, s.hcpcs_code ORDER BY s.total_paid) as rank_pct
-            FROM medicaid_spend s
-            JOIN providers p ON s.billing_npi = p.npi
+# Sketch blobs are joined in at evaluation time rather than copied into every staged row
+SPEND_ROWS = """(
+    SELECT r.*, k.paid_sketch
+    FROM rule_spend_rows r
+    LEFT JOIN benchmark_sketches k
+        ON r.taxonomy_desc = k.taxonomy_desc AND r.period = k.period AND r.hcpcs_code = k.hcpcs_code
+)"""
+
+def evaluate_rules(conn, rules, source_table, run_id):
+    """
+    Evaluate every rule of one grain in a single scan of `source_table`.
+    Each row yields a list of (flag_type, score, evidence) structs, one per
+    rule whose predicate holds, which is unnested straight into the run's
+    risk_flag_history rows.
+    """
+    if not rules:
+        return
+    flags = ",\n".join(
+        f"""CASE WHEN ({_strip_comments(r.predicate)}) THEN {{
+                'flag_type': '{r.flag_type}',
+                'flag_score': CAST({r.score} AS DOUBLE),
+                'reason': CAST({_strip_comments(r.evidence)} AS VARCHAR)
+            }} END"""
+        for r in rules
+    )
+    any_match = " OR ".join(f"COALESCE(({_strip_comments(r.predicate)}), FALSE)" for r in rules)
+    sql = f"""
+        INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason)
+        SELECT $run_id, npi, flag.flag_type, flag.flag_score, flag.reason
+        FROM (
+            SELECT billing_npi AS npi, UNNEST([{flags}]) AS flag
+            FROM {source_table}
+            WHERE {any_match}
         )
-        SELECT 
-            billing_npi,
-            'PERCENTILE_OUTLIER',
-            rank_pct,
-            'Statistical Persistence: This provider is in the top ' || 
-            ROUND((1 - rank_pct) * 100, 2) || '% of all ' || taxonomy_desc || 
-            ' providers for code ' || hcpcs_code || ' by total spend.'
-        FROM peer_ranks
-        WHERE rank_pct >= 0.99
-          AND total_paid > 50000 -- Floor to avoid low-value noise
-    """)
+        WHERE flag IS NOT NULL
+    """
+    params = {**rule_params(), "run_id": run_id}
+    used = set(re.findall(r"\$(\w+)", sql))
+    conn.execute(sql, {k: v for k, v in params.items() if k in used})
 
-    # 6. Claim Mill Detection (beneficiary ratio)
-    print("Running Claim Mill (Patient Ratio) screening...")
-    conn.execute("""
-        INSERT INTO risk_flags (npi, flag_type, flag_score, reason)
-        SELECT 
-            billing_npi,
-            'CLAIM_MILL_RATIO',
-            CAST(total_claims AS DOUBLE) / NULLIF(unique_beneficiaries, 0),
-            'Patient Density Risk: Billed ' || total_claims || ' claims to only ' || 
-            unique_beneficiaries || ' patients for code ' || hcpcs_code || 
-            ' (' || ROUND(CAST(total_claims AS DOUBLE) / NULLIF(unique_beneficiaries, 0), 1) || ' claims/patient)'
-        FROM medicaid_spend
-        WHERE unique_beneficiaries > 0 
-          AND (CAST(total_claims AS DOUBLE) / unique_beneficiaries) > 20 -- Arbitrary initial threshold for review
-          AND total_paid > 10000
-    """)
+def screen_providers(run_id=None):
+    """
+    Write rule flags under flag run `run_id`. Without one, the screen runs as
+    its own flag run and publishes it (other flag types carry forward).
+    """
+    conn = connect(settings.DB_PATH)
+    standalone = run_id is None
+    if standalone:
+        run_id = start_flag_run(conn)
+
+    print(f"Screening providers against {len(RULES)} rules (flag run {run_id})...")
+    conn.execute("DELETE FROM risk_flag_history WHERE run_id = ? AND list_contains(?, flag_type)",
+                 [run_id, [r.flag_type for r in RULES]])
+
+    register_sketch_functions(conn)
+    materialize_rule_inputs(conn)
+    evaluate_rules(conn, [r for r in RULES if r.grain == "spend"], SPEND_ROWS, run_id)
+    evaluate_rules(conn, [r for r in RULES if r.grain == "provider"], "rule_provider_rows", run_id)
+    claim_flag_types(conn, run_id, [r.flag_type for r in RULES])
+
+    counts = conn.execute("""
+        SELECT flag_type, COUNT(*) FROM risk_flag_history
+        WHERE run_id = ? AND list_contains(?, flag_type)
+        GROUP BY 1 ORDER BY 1
+    """, [run_id, [r.flag_type for r in RULES]]).fetchall()
+    for flag_type, count in counts:
+        print(f"  {flag_type}: {count}")
+    print(f"Risk screening complete. Total flags: {sum(c for _, c in counts)}")
 
-    print(f"Risk screening complete. Total flags: {conn.execute('SELECT COUNT(*) FROM risk_flags').fetchone()[0]}")
+    if standalone:
+        publish_flag_run(conn, run_id)
     conn.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+import math
+import struct
+from bisect import bisect_left
+
+# Mergeable quantile sketch (a merging t-digest) for peer group distributions.
+# Groups with at most `compression` distinct values are kept exactly, so the
+# answers match the SQL window functions they replace; larger groups are
+# summarised into ~compression/2 weighted centroids.
+
+_HEADER = struct.Struct("<4sIBQddI")
+_MAGIC = b"QSK1"
+
+class QuantileSketch:
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.exact = True
+        self._buffer = []
+
+    def update(self, values):
+        for v in values:
+            if v is None or v != v:
+                continue
+            v = float(v)
+            self._buffer.append((v, 1))
+            self.count += 1
+            self.min = min(self.min, v)
+            self.max = max(self.max, v)
+            if len(self._buffer) >= 10 * self.compression:
+                self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch (e.g. a different period of the same peer group) into this one."""
+        other._compress()
+        if not other.count:
+            return self
+        self._buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.exact = self.exact and other.exact
+        self._compress()
+        return self
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+
+        # Equal values collapse losslessly
+        collapsed = []
+        for m, w in points:
+            if collapsed and collapsed[-1][0] == m:
+                collapsed[-1][1] += w
+            else:
+                collapsed.append([m, w])
+
+        if len(collapsed) > self.compression:
+            self.exact = False
+            total = sum(w for _, w in collapsed)
+            merged = []
+            done = 0
+            cur_m, cur_w = collapsed[0]
+            limit = self._k(0) + 1
+            for m, w in collapsed[1:]:
+                if self._k((done + cur_w + w) / total) <= limit:
+                    cur_m += (m - cur_m) * w / (cur_w + w)
+                    cur_w += w
+                else:
+                    merged.append([cur_m, cur_w])
+                    done += cur_w
+                    limit = self._k(done / total) + 1
+                    cur_m, cur_w = m, w
+            merged.append([cur_m, cur_w])
+            collapsed = merged
+
+        self.means = [m for m, _ in collapsed]
+        self.weights = [w for _, w in collapsed]
+
+    def rank(self, x):
+        """Number of values strictly below x."""
+        self._compress()
+        if not self.count or x <= self.min:
+            return 0.0
+        if x > self.max:
+            return float(self.count)
+        i = bisect_left(self.means, x)
+        if self.exact:
+            return float(sum(self.weights[:i]))
+        # Merged centroids spread their weight evenly between the midpoints to
+        # their neighbours, only the two around x can be partly below it
+        below = float(sum(self.weights[:max(i - 1, 0)]))
+        for j in (i - 1, i):
+            if 0 <= j < len(self.means):
+                below += self.weights[j] * self._fraction_below(j, x)
+        return below
+
+    def _fraction_below(self, j, x):
+        if self.weights[j] == 1:
+            return 1.0 if self.means[j] < x else 0.0
+        lo = self.min if j == 0 else (self.means[j - 1] + self.means[j]) / 2
+        hi = self.max if j == len(self.means) - 1 else (self.means[j] + self.means[j + 1]) / 2
+        if hi <= lo:
+            return 1.0 if self.means[j] < x else 0.0
+        return min(max((x - lo) / (hi - lo), 0.0), 1.0)
+
+    def percent_rank(self, x):
+        """SQL PERCENT_RANK of x within the group: values below x / (n - 1)."""
+        if self.count < 2:
+            return 0.0
+        return min(self.rank(x) / (self.count - 1), 1.0)
+
+    def value_at(self, index):
+        """The index-th smallest value (0-based), interpolated between centroids when inexact."""
+        self._compress()
+        if not self.count:
+            return None
+        index = min(max(index, 0), self.count - 1)
+        cumulative = 0
+        if self.exact:
+            for m, w in zip(self.means, self.weights):
+                cumulative += w
+                if index < cumulative:
+                    return m
+            return self.max
+        centers = []
+        for w in self.weights:
+            centers.append(cumulative + (w - 1) / 2)
+            cumulative += w
+        if index <= centers[0]:
+            return self.min + (self.means[0] - self.min) * (index / centers[0] if centers[0] else 1.0)
+        if index >= centers[-1]:
+            span = (self.count - 1) - centers[-1]
+            return self.means[-1] + (self.max - self.means[-1]) * ((index - centers[-1]) / span if span else 0.0)
+        j = bisect_left(centers, index)
+        t = (index - centers[j - 1]) / (centers[j] - centers[j - 1])
+        return self.means[j - 1] + (self.means[j] - self.means[j - 1]) * t
+
+    def quantile(self, q):
+        """Continuous quantile (SQL quantile_cont)."""
+        if not self.count:
+            return None
+        pos = q * (self.count - 1)
+        lo = math.floor(pos)
+        lo_v = self.value_at(lo)
+        if pos == lo:
+            return lo_v
+        return lo_v + (self.value_at(lo + 1) - lo_v) * (pos - lo)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def mad(self):
+        """Median absolute deviation from the median."""
+        med = self.median()
+        if med is None:
+            return None
+        deviations = QuantileSketch(self.compression)
+        deviations._buffer = [(abs(m - med), w) for m, w in zip(self.means, self.weights)]
+        deviations.count = self.count
+        deviations.min = min(m for m, _ in deviations._buffer)
+        deviations.max = max(m for m, _ in deviations._buffer)
+        deviations.exact = self.exact
+        return deviations.median()
+
+    def rank_floor(self, cutoff):
+        """
+        Smallest value v such that PERCENT_RANK(x) >= cutoff exactly when x > v,
+        or None when no value can reach the cutoff (groups of one).
+        """
+        if self.count < 2:
+            return None
+        needed = math.ceil(cutoff * (self.count - 1) - 1e-9)
+        if needed <= 0:
+            return -math.inf
+        return self.value_at(needed - 1)
+
+    def to_bytes(self):
+        self._compress()
+        n = len(self.means)
+        return (
+            _HEADER.pack(_MAGIC, self.compression, self.exact, self.count, self.min, self.max, n)
+            + struct.pack(f"<{n}d", *self.means)
+            + struct.pack(f"<{n}d", *self.weights)
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, compression, exact, count, lo, hi, n = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a quantile sketch")
+        sketch = cls(compression)
+        sketch.exact = bool(exact)
+        sketch.count, sketch.min, sketch.max = count, lo, hi
+        offset = _HEADER.size
+        sketch.means = list(struct.unpack_from(f"<{n}d", data, offset))
+        sketch.weights = list(struct.unpack_from(f"<{n}d", data, offset + 8 * n))
+        return sketch
+
+def sketch_percent_rank(blob, value):
+    """DuckDB scalar UDF: PERCENT_RANK of `value` in a serialized sketch."""
+    return QuantileSketch.from_bytes(blob).percent_rank(value)
+
+def register_sketch_functions(conn):
+    conn.create_function("sketch_percent_rank", sketch_percent_rank, ["BLOB", "DOUBLE"], "DOUBLE")
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import duckdb
+
+from src.config import settings
+
+# Database generation: a counter in a file next to the database, bumped by the
+# pipeline when it finishes with data the API has not seen. Each generation is
+# published as a checkpointed copy of the database
+# (<DB_PATH>.snapshots/<generation>.db) which the API serves, so writers never
+# wait on the API for the file lock. An API process holds a lease file on the
+# snapshot it serves (<generation>.<pid>.lease) until it has swapped to a newer
+# one, and leased snapshots are never pruned. Cached API responses are only
+# valid for the generation they were computed under, and reading it never
+# touches DuckDB.
+
+SNAPSHOTS_KEPT = 2  # the new generation's and the one the API may still be draining
+
+# What the API serves changes only with a new flag run, HHS ingestion, LEIE
+# load or provider update (enrichment and roster loads stamp last_updated)
+DATA_VERSION_SQL = """
+    SELECT [
+        (SELECT MAX(run_id) FROM flag_runs WHERE status = 'published')::VARCHAR,
+        (SELECT MAX(ingest_run_id) FILTER (periods_changed > 0) FROM hhs_ingestion_runs)::VARCHAR,
+        (SELECT MAX(applied_at) FROM leie_sources)::VARCHAR,
+        (SELECT COUNT(*) || '/' || COALESCE(MAX(last_updated)::VARCHAR, '') FROM providers)
+    ]::VARCHAR
+"""
+
+def generation_path():
+    return Path(settings.DB_PATH + ".generation")
+
+def snapshot_path(generation):
+    return Path(settings.DB_PATH + ".snapshots") / f"{generation}.db"
+
+def lease_path(generation, pid=None):
+    return snapshot_path(generation).with_name(f"{generation}.{pid or os.getpid()}.lease")
+
+def _read_generation_file():
+    """(generation, data version) as last published."""
+    try:
+        number, _, version = generation_path().read_text().partition("\n")
+        return int(number.strip() or 0), version.strip()
+    except (FileNotFoundError, ValueError):
+        return 0, ""
+
+def current_generation():
+    return _read_generation_file()[0]
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def leased(generation):
+    """Whether a running API process still serves this generation's snapshot (stale leases are removed)."""
+    held = False
+    for lease in snapshot_path(generation).parent.glob(f"{generation}.*.lease"):
+        pid = lease.name.split(".")[1]
+        if pid.isdigit() and _pid_alive(int(pid)):
+            held = True
+        else:
+            lease.unlink(missing_ok=True)
+    return held
+
+def publish_generation():
+    """
+    Snapshot the database as a new generation for the API to switch to
+    (invalidates every cached response), unless the data it serves is unchanged
+    since the last one. Returns the generation the API should serve.
+    """
+    path = generation_path()
+    current, published_version = _read_generation_file()
+    # The write connection keeps other writers out until the copy is complete
+    conn = duckdb.connect(settings.DB_PATH)
+    version = conn.execute(DATA_VERSION_SQL).fetchone()[0]
+    if current and version == published_version and snapshot_path(current).exists():
+        conn.close()
+        print(f"Database unchanged since generation {current}, nothing to publish.")
+        return current
+
+    generation = current + 1
+    snapshot = snapshot_path(generation)
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    tmp = snapshot.with_name(snapshot.name + ".tmp")
+    conn.execute("CHECKPOINT")
+    shutil.copyfile(settings.DB_PATH, tmp)
+    conn.close()
+    os.replace(tmp, snapshot)
+
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(f"{generation}\n{version}")
+    os.replace(tmp, path)
+    for old in snapshot.parent.glob("*.db"):
+        if old.stem.isdigit() and int(old.stem) <= generation - SNAPSHOTS_KEPT and not leased(int(old.stem)):
+            old.unlink()
+    return generation
+
+@dataclass
+class CachedResponse:
+    generation: int
+    body: bytes
+    etag: str
+    headers: dict
+
+def encode_json(content):
+    """Serialize like Starlette's JSONResponse."""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+class ResponseCache:
+    """
+    LRU cache of serialized responses for one database generation, bounded by
+    entry count and total body bytes. Entries from an older generation are
+    dropped as soon as a newer one is seen.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _roll(self, generation):
+        if generation != self.generation:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self.generation = generation
+
+    def get(self, key, generation):
+        with self._lock:
+            self._roll(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+    def put(self, key, generation, body, headers=None):
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        entry = CachedResponse(generation, body, f'"{generation}-{digest}"', headers or {})
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            self._roll(generation)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self.stats["evictions"] += 1
+        return entry
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, generation=self.generation, entries=len(self._entries), bytes=self._bytes,
+                        max_entries=self.max_entries, max_bytes=self.max_bytes)
@@ -0,0 +1,186 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+
+from src.config import settings
+from src.api.cache import current_generation, lease_path, snapshot_path
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """
+    One read-only DuckDB database shared by the API, handed out as cursors.
+
+    Cursors share the database instance (catalog and buffer cache) but each
+    runs its own queries, so at most `size` requests query concurrently and
+    the rest wait up to `timeout` seconds for a cursor.
+    """
+
+    def __init__(self, db_path, size=8, timeout=5.0, warm_tables=()):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.db = duckdb.connect(db_path, read_only=True)
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(self.db.cursor())
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "waited": 0, "timeouts": 0, "wait_seconds": 0.0, "in_use": 0, "peak_in_use": 0}
+        self.warmed = self.warm(warm_tables)
+
+    def warm(self, tables):
+        """Read every column of the hot tables once so first requests hit a warm cache."""
+        warmed = []
+        cur = self.db.cursor()
+        for table in tables:
+            try:
+                cur.execute(f"SELECT COUNT(*), MIN(COLUMNS(*)::VARCHAR) FROM {table}").fetchall()
+                warmed.append(table)
+            except duckdb.Error as e:
+                print(f"Warning: could not warm {table}: {e}")
+        cur.close()
+        return warmed
+
+    @contextmanager
+    def cursor(self):
+        start = time.monotonic()
+        try:
+            cur = self._idle.get_nowait()
+            waited = False
+        except queue.Empty:
+            waited = True
+            try:
+                cur = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise PoolTimeout(f"No database cursor free within {self.timeout}s")
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+            if waited:
+                self._stats["waited"] += 1
+                self._stats["wait_seconds"] += time.monotonic() - start
+        try:
+            yield cur
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._idle.put(cur)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["size"] = self.size
+        stats["idle"] = self._idle.qsize()
+        stats["saturation"] = stats["in_use"] / self.size if self.size else 0.0
+        stats["warmed_tables"] = self.warmed
+        return stats
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self.db.close()
+
+class SnapshotPool:
+    """
+    ConnectionPool over the published snapshot of the current database generation.
+
+    Handing out a cursor first checks the generation (a small file read). When
+    a new one has been published, a pool over its snapshot is opened and
+    swapped in; the old pool is closed once the cursors still checked out from
+    it (e.g. a streaming export) are returned. The API never publishes: it
+    only attaches snapshots that exist, and holds a lease on each one it
+    serves so writers don't prune it.
+    """
+
+    def __init__(self, size=8, timeout=5.0, warm_tables=()):
+        self.size = size
+        self.timeout = timeout
+        self.warm_tables = warm_tables
+        self.generation = None
+        self.pool = None
+        self.swaps = 0
+        self._users = {}  # pool -> cursors checked out from it
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self.refresh()
+        if self.pool is None:
+            raise RuntimeError(f"No published database snapshot for {settings.DB_PATH}; "
+                               "run the pipeline to publish one before starting the API.")
+
+    def refresh(self):
+        """Switch to the current generation's snapshot if it changed. Returns the generation served."""
+        generation = current_generation()
+        if generation == self.generation:
+            return generation
+        with self._swap_lock:
+            if generation == self.generation:
+                return generation
+            # Lease first: a snapshot still there afterwards is not pruned under us
+            lease = lease_path(generation)
+            lease.parent.mkdir(parents=True, exist_ok=True)
+            lease.touch()
+            if not snapshot_path(generation).exists():
+                # Not published (yet): keep serving what we have
+                lease.unlink(missing_ok=True)
+                return self.generation
+            pool = ConnectionPool(str(snapshot_path(generation)), self.size, self.timeout, self.warm_tables)
+            with self._lock:
+                old, self.pool, self.generation = self.pool, pool, generation
+                retired = old is not None and not self._users.get(old)
+                if old is not None:
+                    self.swaps += 1
+            if retired:
+                self._retire(old)
+            return generation
+
+    def _retire(self, pool):
+        """Close a swapped-out pool and release the lease on its snapshot."""
+        pool.close()
+        lease_path(int(Path(pool.db_path).stem)).unlink(missing_ok=True)
+
+    @contextmanager
+    def cursor(self):
+        with self.checkout() as (_, cur):
+            yield cur
+
+    @contextmanager
+    def checkout(self):
+        """A cursor together with the generation of the snapshot it reads, as (generation, cursor)."""
+        self.refresh()
+        with self._lock:
+            pool, generation = self.pool, self.generation
+            self._users[pool] = self._users.get(pool, 0) + 1
+        try:
+            with pool.cursor() as cur:
+                yield generation, cur
+        finally:
+            with self._lock:
+                self._users[pool] -= 1
+                retired = pool is not self.pool and not self._users[pool]
+                if not self._users[pool]:
+                    del self._users[pool]
+            if retired:
+                self._retire(pool)
+
+    def metrics(self):
+        with self._lock:
+            pool = self.pool
+        return dict(pool.metrics(), generation=self.generation, snapshot=pool.db_path, swaps=self.swaps)
+
+    def close(self):
+        with self._lock:
+            pools = {self.pool, *self._users}
+            self._users.clear()
+        for pool in pools:
+            self._retire(pool)
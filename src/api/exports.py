@@ -0,0 +1,114 @@
+from dataclasses import dataclass
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from src.config import settings
+
+# Bulk exports stream DuckDB's Arrow record batches straight into the response
+# encoder, so memory stays at about one batch whatever the export size.
+
+@dataclass
+class ExportDataset:
+    sql: str
+    npi_column: str
+    period_column: str | None = None
+    csv_sql: str | None = None  # same rows with nested columns as text (CSV has no nested types)
+
+EXPORT_DATASETS = {
+    "risk_flags": ExportDataset(
+        "SELECT npi, flag_type, flag_score, reason, detected_at FROM risk_flags",
+        npi_column="npi",
+    ),
+    "medicaid_spend": ExportDataset(
+        """
+        SELECT billing_npi, servicing_npi, hcpcs_code, period, state, county,
+               total_paid, total_claims, unique_beneficiaries
+        FROM medicaid_spend
+        """,
+        npi_column="billing_npi",
+        period_column="period",
+    ),
+    "provider_rollup": ExportDataset(
+        "SELECT * EXCLUDE (built_at) FROM provider_rollup",
+        npi_column="npi",
+        csv_sql="SELECT * EXCLUDE (built_at) REPLACE (flag_type_counts::VARCHAR AS flag_type_counts) FROM provider_rollup",
+    ),
+}
+
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv",
+}
+
+def export_query(dataset, fmt, npis=None, period_from=None, period_to=None):
+    """SQL and params for one export. Raises ValueError for filters the dataset does not support."""
+    spec = EXPORT_DATASETS[dataset]
+    base = spec.csv_sql if fmt == "csv" and spec.csv_sql else spec.sql
+    conditions, params = [], {}
+    if npis:
+        conditions.append(f"{spec.npi_column} IN (SELECT UNNEST($npis))")
+        params["npis"] = list(npis)
+    if period_from is not None or period_to is not None:
+        if spec.period_column is None:
+            raise ValueError(f"{dataset} cannot be filtered by period")
+        if period_from is not None:
+            conditions.append(f"{spec.period_column} >= $period_from")
+            params["period_from"] = period_from
+        if period_to is not None:
+            conditions.append(f"{spec.period_column} <= $period_to")
+            params["period_to"] = period_to
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT * FROM ({base}) {where}", params
+
+class _ChunkSink:
+    """Write-only file object whose written bytes are drained after each batch."""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _writer(fmt, sink, schema):
+    if fmt == "arrow":
+        return pa.ipc.new_stream(sink, schema)
+    if fmt == "parquet":
+        return pq.ParquetWriter(sink, schema)
+    return pa_csv.CSVWriter(sink, schema)
+
+def stream_export(reader, fmt):
+    """Encode a RecordBatchReader as `fmt`, yielding bytes batch by batch."""
+    sink = _ChunkSink()
+    writer = _writer(fmt, pa.PythonFile(sink, mode="w"), reader.schema)
+    for batch in reader:
+        if fmt == "parquet":
+            # One row group per batch, so nothing accumulates in the writer
+            writer.write_table(pa.Table.from_batches([batch], reader.schema))
+        else:
+            writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+def open_export(conn, dataset, fmt, **filters):
+    """Run the export query on `conn` and return its record batch stream."""
+    sql, params = export_query(dataset, fmt, **filters)
+    return conn.execute(sql, params).to_arrow_reader(settings.EXPORT_BATCH_ROWS)
@@ -0,0 +1,130 @@
+import base64
+import binascii
+from dataclasses import dataclass
+
+from src.config import settings
+
+# Flagged-provider listing over provider_rollup. Rows are stored in
+# dashboard_rank order, so a page is "the next `limit` matching rows after the
+# cursor's rank": zone maps skip everything before the cursor and every page
+# costs about the same as the first.
+
+class InvalidCursor(ValueError):
+    pass
+
+class StaleCursor(ValueError):
+    pass
+
+def encode_cursor(flag_run_id, rank):
+    return base64.urlsafe_b64encode(f"{flag_run_id}:{rank}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """(flag_run_id, rank) of the last row of the previous page."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        run_id, rank = raw.split(":")
+        return int(run_id), int(rank)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(f"Invalid cursor {cursor!r}")
+
+@dataclass(frozen=True)
+class ProviderFilters:
+    taxonomy_desc: str | None = None
+    flag_type: str | None = None
+    min_spend: float | None = None
+    max_spend: float | None = None
+    is_excluded: bool | None = None
+
+    def where(self, skip=None):
+        """SQL conditions and params for the set filters, leaving out the `skip` facet."""
+        conditions, params = ["flag_count > 0"], {}
+        if self.taxonomy_desc is not None and skip != "taxonomy_desc":
+            conditions.append("taxonomy_desc = $taxonomy_desc")
+            params["taxonomy_desc"] = self.taxonomy_desc
+        if self.flag_type is not None and skip != "flag_type":
+            conditions.append("map_contains(flag_type_counts, $flag_type)")
+            params["flag_type"] = self.flag_type
+        if self.min_spend is not None and skip != "spend_tier":
+            conditions.append("COALESCE(total_spend, 0) >= $min_spend")
+            params["min_spend"] = self.min_spend
+        if self.max_spend is not None and skip != "spend_tier":
+            conditions.append("COALESCE(total_spend, 0) < $max_spend")
+            params["max_spend"] = self.max_spend
+        if self.is_excluded is not None and skip != "is_excluded":
+            conditions.append("is_excluded = $is_excluded")
+            params["is_excluded"] = self.is_excluded
+        return " AND ".join(conditions), params
+
+def flagged_page(conn, filters, limit, cursor=None):
+    """One page of flagged providers in dashboard order and the cursor of the next page (or None)."""
+    where, params = filters.where()
+    after_run, after_rank = decode_cursor(cursor) if cursor else (None, 0)
+    rows = conn.execute(f"""
+        SELECT dashboard_rank, npi, name, taxonomy_desc, flag_count, risk_score, total_spend, is_excluded, flag_run_id
+        FROM provider_rollup
+        WHERE dashboard_rank > $after_rank AND {where}
+        ORDER BY dashboard_rank
+        LIMIT $limit
+    """, {**params, "after_rank": after_rank, "limit": limit + 1}).df()
+    if after_run is not None and len(rows) and rows["flag_run_id"].iloc[0] != after_run:
+        raise StaleCursor("Flags were refreshed since this cursor was issued, restart from the first page")
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows.iloc[:limit]
+        next_cursor = encode_cursor(int(rows["flag_run_id"].iloc[-1]), int(rows["dashboard_rank"].iloc[-1]))
+    return rows.drop(columns="flag_run_id"), next_cursor
+
+def spend_tiers():
+    """[(label, lower, upper)] from SPEND_TIER_BOUNDS, the last tier open-ended."""
+    bounds = list(settings.SPEND_TIER_BOUNDS) + [None]
+    return [
+        (f"{lo:,.0f}+" if hi is None else f"{lo:,.0f}-{hi:,.0f}", lo, hi)
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ]
+
+def flagged_facets(conn, filters):
+    """
+    Provider counts per taxonomy, flag type, exclusion status and spend tier.
+    Each facet applies every filter but its own, so the counts show what
+    selecting another value of that facet would return.
+    """
+    facets = {}
+
+    where, params = filters.where(skip="taxonomy_desc")
+    facets["taxonomy_desc"] = conn.execute(f"""
+        SELECT taxonomy_desc AS value, COUNT(*) AS count FROM provider_rollup WHERE {where}
+        GROUP BY 1 ORDER BY 2 DESC, 1
+    """, params).df()
+
+    where, params = filters.where(skip="flag_type")
+    facets["flag_type"] = conn.execute(f"""
+        SELECT flag_type AS value, COUNT(*) AS count
+        FROM (SELECT UNNEST(map_keys(flag_type_counts)) AS flag_type FROM provider_rollup WHERE {where})
+        GROUP BY 1 ORDER BY 2 DESC, 1
+    """, params).df()
+
+    where, params = filters.where(skip="is_excluded")
+    facets["is_excluded"] = conn.execute(f"""
+        SELECT is_excluded AS value, COUNT(*) AS count FROM provider_rollup WHERE {where}
+        GROUP BY 1 ORDER BY 1
+    """, params).df()
+
+    where, params = filters.where(skip="spend_tier")
+    tiers = spend_tiers()
+    tier_case = " ".join(
+        f"WHEN COALESCE(total_spend, 0) >= {lo!r}" + ("" if hi is None else f" AND COALESCE(total_spend, 0) < {hi!r}") + f" THEN {i}"
+        for i, (_, lo, hi) in enumerate(tiers)
+    )
+    counts = dict(conn.execute(f"""
+        SELECT CASE {tier_case} END AS tier, COUNT(*) FROM provider_rollup WHERE {where} GROUP BY 1
+    """, params).fetchall())
+    facets["spend_tier"] = [
+        {"value": label, "min_spend": lo, "max_spend": hi, "count": counts.get(i, 0)}
+        for i, (label, lo, hi) in enumerate(tiers)
+    ]
+
+    return {
+        name: value if isinstance(value, list) else value.astype(object).where(value.notna(), None).to_dict(orient="records")
+        for name, value in facets.items()
+    }
@@ -1,10 +1,39 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from datetime import date
+
+from anyio import to_thread
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import duckdb
 import os
 
-app = FastAPI(title="Medicaid Spend Watch API")
+from src.config import settings
+from src.analysis.flag_runs import changes_since
+from src.analysis.dossiers import provider_dossier
+from src.api.cache import ResponseCache, encode_json
+from src.api.db import PoolTimeout, SnapshotPool
+from src.api.exports import EXPORT_DATASETS, EXPORT_FORMATS, open_export, stream_export
+from src.api.search import SearchIndex
+from src.api.listing import InvalidCursor, ProviderFilters, StaleCursor, flagged_facets, flagged_page
+
+@asynccontextmanager
+async def lifespan(app):
+    # The published snapshot of the current generation, read-only, one cursor per worker thread by default
+    size = settings.API_DB_POOL_SIZE or to_thread.current_default_thread_limiter().total_tokens
+    app.state.db_pool = SnapshotPool(size=size, timeout=settings.API_DB_POOL_TIMEOUT,
+                                     warm_tables=settings.API_WARM_TABLES)
+    app.state.response_cache = ResponseCache(settings.API_CACHE_MAX_ENTRIES, settings.API_CACHE_MAX_BYTES)
+    app.state.search_index = SearchIndex()
+    app.state.search_generation = app.state.db_pool.generation
+    with app.state.db_pool.cursor() as cur:
+        app.state.search_index.refresh(cur)
+    yield
+    app.state.db_pool.close()
+
+app = FastAPI(title="Medicaid Spend Watch API", lifespan=lifespan)
 
 # Enable CORS for local development
 app.add_middleware(
@@ -14,75 +43,190 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from src.config import settings
+@contextmanager
+def db_checkout(request):
+    """A pooled cursor and the generation of the snapshot it reads."""
+    try:
+        with request.app.state.db_pool.checkout() as (generation, cur):
+            yield generation, cur
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Database busy, retry shortly")
+
+@contextmanager
+def db_cursor(request):
+    with db_checkout(request) as (_, cur):
+        yield cur
 
-def get_db():
-    return duckdb.connect(settings.DB_PATH)
+def get_db(request: Request):
+    with db_cursor(request) as cur:
+        yield cur
+
+def cached_json(request, key, compute):
+    """
+    Serve compute(conn) from the response cache while the database generation
+    is unchanged, answering 304 when the client already has the current ETag.
+    compute returns the JSON content (or bytes already encoded as JSON), or
+    (content, headers) to cache extra response headers with it.
+    """
+    # A new generation swaps the pool to its snapshot and empties the cache
+    generation = request.app.state.db_pool.refresh()
+    cache = request.app.state.response_cache
+    entry = cache.get(key, generation)
+    if entry is None:
+        # Cached under the generation of the snapshot the query actually read,
+        # which is newer than `generation` if one was published in between
+        with db_checkout(request) as (generation, conn):
+            content = compute(conn)
+        content, extra = content if isinstance(content, tuple) else (content, {})
+        body = content if isinstance(content, bytes) else encode_json(jsonable_encoder(content))
+        entry = cache.put(key, generation, body, extra)
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    client_etags = {t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")}
+    if entry.etag in client_etags or "*" in client_etags:
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
 
 @app.get("/api/summary")
-def get_summary():
-    conn = get_db()
+def get_summary(request: Request):
+    return cached_json(request, "summary", summary)
+
+def summary(conn):
     total_spend = conn.execute("SELECT SUM(total_paid) FROM medicaid_spend").fetchone()[0]
     total_providers = conn.execute("SELECT COUNT(*) FROM providers").fetchone()[0]
     total_flags = conn.execute("SELECT COUNT(*) FROM risk_flags").fetchone()[0]
-    conn.close()
     return {
         "total_spend": total_spend,
         "total_providers": total_providers,
         "total_flags": total_flags
     }
 
+def provider_filters(
+    taxonomy_desc: str | None = None,
+    flag_type: str | None = None,
+    min_spend: float | None = None,
+    max_spend: float | None = None,
+    is_excluded: bool | None = None,
+):
+    return ProviderFilters(taxonomy_desc, flag_type, min_spend, max_spend, is_excluded)
+
 @app.get("/api/flagged-providers")
-def get_flagged_providers(limit: int = 20):
-    conn = get_db()
-    # Join providers with risk_flags and get total spend
-    query = """
-        SELECT 
-            p.npi,
-            p.name,
-            p.taxonomy_desc,
-            COUNT(f.flag_type) as flag_count,
-            MAX(p.risk_score) as risk_score,
-            (SELECT SUM(total_paid) FROM medicaid_spend WHERE billing_npi = p.npi) as total_spend
-        FROM providers p
-        JOIN risk_flags f ON p.npi = f.npi
-        GROUP BY 1, 2, 3
-        ORDER BY flag_count DESC, total_spend DESC
-        LIMIT ?
+def get_flagged_providers(
+    request: Request,
+    limit: int = Query(20, ge=1, le=settings.API_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    filters: ProviderFilters = Depends(provider_filters),
+):
+    """
+    Flagged providers in dashboard order (flag count, then spend). The next
+    page's cursor is in the X-Next-Cursor and Link headers.
     """
-    df = conn.execute(query, [limit]).df()
+    key = ("flagged-providers", limit, cursor, filters)
+    return cached_json(request, key, lambda conn: flagged_providers(conn, request, filters, limit, cursor))
+
+def flagged_providers(conn, request, filters, limit, cursor):
+    try:
+        df, next_cursor = flagged_page(conn, filters, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except StaleCursor as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
     # Sanitize NaN values for JSON compliance
     df = df.fillna(0)
     results = df.to_dict(orient="records")
-    conn.close()
-    return results
+    return results, headers
+
+@app.get("/api/flagged-providers/facets")
+def get_flagged_provider_facets(request: Request, filters: ProviderFilters = Depends(provider_filters)):
+    """Counts of flagged providers per filter value, under the other active filters."""
+    return cached_json(request, ("flagged-provider-facets", filters), lambda conn: flagged_facets(conn, filters))
 
 @app.get("/api/provider/{npi}")
-def get_provider_detail(npi: str):
-    conn = get_db()
-    provider_df = conn.execute("SELECT * FROM providers WHERE npi = ?", [npi]).df()
-    if provider_df.empty:
-        conn.close()
+def get_provider_detail(npi: str, request: Request):
+    return cached_json(request, ("provider", npi), lambda conn: provider_detail(conn, npi))
+
+def provider_detail(conn, npi):
+    dossier = provider_dossier(conn, npi)
+    if dossier is None:
         raise HTTPException(status_code=404, detail="Provider not found")
-    
-    # Sanitize NaN
-    provider_df = provider_df.fillna(0)
-    provider = provider_df.to_dict(orient="records")[0]
-    
-    flags = conn.execute("SELECT * FROM risk_flags WHERE npi = ?", [npi]).df().fillna(0).to_dict(orient="records")
-    spend_trend = conn.execute("""
-        SELECT period, SUM(total_paid) as spend 
-        FROM medicaid_spend 
-        WHERE billing_npi = ? 
-        GROUP BY 1 ORDER BY 1
-    """, [npi]).df().fillna(0).to_dict(orient="records")
-    
-    conn.close()
-    return {
-        "details": provider,
-        "flags": flags,
-        "spend_trend": spend_trend
-    }
+    return dossier.encode("utf-8")
+
+@app.get("/api/changes")
+def get_changes(since_run_id: int | None = None, conn=Depends(get_db)):
+    """Flags that appeared, resolved or changed score since `since_run_id` (default: the last refresh)."""
+    try:
+        df = changes_since(conn, since_run_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    df = df.astype(object).where(df.notna(), None)
+    results = df.to_dict(orient="records")
+    return results
+
+@app.get("/api/search")
+def search_providers(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """Typeahead search by NPI prefix or fuzzy provider, authorized official or city name."""
+    index = request.app.state.search_index
+    generation = request.app.state.db_pool.refresh()
+    if generation != request.app.state.search_generation:
+        # Pick up providers added or updated in the newly published snapshot
+        with db_checkout(request) as (generation, conn):
+            index.refresh(conn)
+        request.app.state.search_generation = generation
+    return index.search(q, limit)
+
+@app.get("/api/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    request: Request,
+    format: str = "parquet",
+    npi: list[str] | None = Query(None),
+    period_from: date | None = None,
+    period_to: date | None = None,
+):
+    """
+    Stream risk_flags, medicaid_spend or provider_rollup as Arrow IPC, Parquet
+    or CSV, optionally limited to a set of NPIs (repeat `npi`) and, for spend,
+    a period range.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset {dataset!r}, expected one of {sorted(EXPORT_DATASETS)}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format!r}, expected one of {sorted(EXPORT_FORMATS)}")
+
+    # The cursor stays checked out until the stream ends (or the client goes away)
+    stack = ExitStack()
+    conn = stack.enter_context(db_cursor(request))
+    try:
+        reader = open_export(conn, dataset, format, npis=npi, period_from=period_from, period_to=period_to)
+    except ValueError as e:
+        stack.close()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def body():
+        with stack:
+            yield from stream_export(reader, format)
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{format}"'},
+        background=BackgroundTask(stack.close),
+    )
+
+@app.get("/api/metrics/db-pool")
+def get_db_pool_metrics(request: Request):
+    return request.app.state.db_pool.metrics()
+
+@app.get("/api/metrics/response-cache")
+def get_response_cache_metrics(request: Request):
+    return request.app.state.response_cache.metrics()
 
 # Serve static files for the dashboard
 if os.path.exists("web"):
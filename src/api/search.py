@@ -0,0 +1,154 @@
+import bisect
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+# Provider search for the dashboard's typeahead, held in API memory:
+#   * NPIs in a sorted array, so a digit prefix is a bisect range
+#   * an inverted index from name tokens (provider name, authorized official,
+#     city) to providers, over a vocabulary that is both sorted (prefix
+#     matches while typing) and trigram-indexed (typo-tolerant matches)
+# Matching works on the vocabulary, which is far smaller than the provider
+# list, so latency depends on how many providers share the matched tokens.
+# Refreshed incrementally from providers.last_updated.
+
+SEARCH_FIELDS = {"name": 1.0, "auth_official_name": 0.8, "city": 0.4}
+DOC_COLUMNS = ["npi", "name", "taxonomy_desc", "city", "state", "auth_official_name"]
+
+MIN_SIMILARITY = 0.3  # trigram similarity for a fuzzy token match
+MAX_TOKEN_MATCHES = 200  # vocabulary tokens considered per query token
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    return _NON_ALNUM.sub(" ", text).strip()
+
+def trigrams(token):
+    """Trigrams of a token, padded so its start and end count."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.docs = {}  # npi -> display fields
+        self.doc_tokens = {}  # npi -> tokens indexed for it
+        self.postings = {}  # token -> {npi: (field weight, field)}
+        self.grams = {}  # trigram -> set of tokens
+        self.vocab = []  # sorted tokens
+        self.npis = []  # sorted npis
+        self.watermark = None  # max providers.last_updated indexed
+
+    def _remove(self, npi):
+        for token in self.doc_tokens.pop(npi, ()):
+            posting = self.postings[token]
+            posting.pop(npi, None)
+            if not posting:
+                del self.postings[token]
+                for g in trigrams(token):
+                    self.grams[g].discard(token)
+        self.docs.pop(npi, None)
+
+    def _add(self, row):
+        npi = row["npi"]
+        self.docs[npi] = {k: row[k] for k in DOC_COLUMNS}
+        tokens = {}
+        for field, weight in SEARCH_FIELDS.items():
+            for token in normalize(row[field]).split():
+                if weight > tokens.get(token, (0.0, None))[0]:
+                    tokens[token] = (weight, field)
+        for token, match in tokens.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                for g in trigrams(token):
+                    self.grams.setdefault(g, set()).add(token)
+            self.postings[token][npi] = match
+        self.doc_tokens[npi] = list(tokens)
+
+    def refresh(self, conn):
+        """Index providers updated since the last refresh (everything on the first call). Returns the count."""
+        columns = DOC_COLUMNS + ["last_updated"]
+        full_query = f"SELECT {', '.join(columns)} FROM providers"
+        if self.watermark is None:
+            rows = conn.execute(full_query).fetchall()
+        else:
+            rows = conn.execute(f"{full_query} WHERE last_updated >= ?", [self.watermark]).fetchall()
+        rows = [dict(zip(columns, r)) for r in rows]
+        total = conn.execute("SELECT COUNT(*) FROM providers").fetchone()[0]
+
+        with self._lock:
+            if self.watermark is not None and total != len(self.docs) + len({r["npi"] for r in rows} - self.docs.keys()):
+                # Providers were deleted: rebuild from scratch
+                self._reset()
+                rows = [dict(zip(columns, r)) for r in conn.execute(full_query).fetchall()]
+            for row in rows:
+                self._remove(row["npi"])
+                self._add(row)
+                if row["last_updated"] is not None and (self.watermark is None or row["last_updated"] > self.watermark):
+                    self.watermark = row["last_updated"]
+            if rows:
+                self.vocab = sorted(self.postings)
+                self.npis = sorted(self.docs)
+        return len(rows)
+
+    def _prefixed(self, sorted_list, prefix, limit):
+        start = bisect.bisect_left(sorted_list, prefix)
+        end = bisect.bisect_left(sorted_list, prefix + "\x7f")
+        return sorted_list[start:min(end, start + limit)]
+
+    def _token_matches(self, query_token):
+        """{vocabulary token: similarity} for one query token: prefix matches and close spellings."""
+        matches = {t: (1.0 if t == query_token else 0.9) for t in self._prefixed(self.vocab, query_token, MAX_TOKEN_MATCHES)}
+        if len(query_token) >= 3:
+            query_grams = trigrams(query_token)
+            shared = Counter()
+            for g in query_grams:
+                shared.update(self.grams.get(g, ()))
+            for token, n in shared.most_common(MAX_TOKEN_MATCHES):
+                similarity = n / (len(query_grams) + len(trigrams(token)) - n)
+                if similarity >= MIN_SIMILARITY and similarity > matches.get(token, 0.0):
+                    matches[token] = similarity
+        return matches
+
+    def search(self, q, limit=10):
+        """Ranked matches for `q`: NPI prefix matches first, then providers matching every word of `q`."""
+        q = (q or "").strip()
+        if not q:
+            return []
+        with self._lock:
+            results = []
+            digits = q.replace(" ", "")
+            if digits.isdigit():
+                results = [{**self.docs[npi], "match": "npi", "score": 1.0} for npi in self._prefixed(self.npis, digits, limit)]
+
+            query_tokens = normalize(q).split()
+            if query_tokens and len(results) < limit:
+                scores = None
+                for query_token in query_tokens:
+                    best = {}
+                    for token, similarity in self._token_matches(query_token).items():
+                        for npi, (weight, field) in self.postings[token].items():
+                            score = similarity * weight
+                            if score > best.get(npi, (0.0,))[0]:
+                                best[npi] = (score, field)
+                    if scores is None:
+                        scores = best
+                    else:
+                        scores = {npi: (scores[npi][0] + best[npi][0], max(scores[npi], best[npi])[1])
+                                  for npi in scores.keys() & best.keys()}
+                    if not scores:
+                        break
+
+                seen = {r["npi"] for r in results}
+                ranked = sorted(scores.items(), key=lambda s: (-s[1][0], self.docs[s[0]]["name"] or "", s[0]))
+                for npi, (score, field) in ranked:
+                    if len(results) >= limit:
+                        break
+                    if npi not in seen:
+                        results.append({**self.docs[npi], "match": field, "score": round(score / len(query_tokens), 4)})
+            return results
@@ -9,19 +9,89 @@ class Settings(BaseSettings):
     
     # CMS / HHS Source (2026 Release)
     HHS_SOURCE_URL: str = "https://stopendataprod.blob.core.windows.net/datasets/medicaid-provider-spending/2026-02-09/medicaid-provider-spending.csv"
-    
+
+    # Local Parquet mirror of the HHS source (partitioned by CLAIM_FROM_MONTH)
+    USE_HHS_MIRROR: bool = True
+    HHS_MIRROR_DIR: Path = DATA_DIR / "mirror" / "hhs_spend"
+
+    # NPPES Registry API (enrichment)
+    NPPES_API_URL: str = "https://npiregistry.cms.hhs.gov/api/"
+    NPPES_RATE_LIMIT: float = 5.0  # requests per second across all workers
+    NPPES_MAX_CONCURRENCY: int = 8
+    NPPES_MAX_RETRIES: int = 4
+    NPPES_BACKOFF_SECONDS: float = 0.5
+    NPPES_WRITE_BATCH_SIZE: int = 200
+    NPPES_CACHE_PATH: str = str(DATA_DIR / "cache" / "nppes_cache.sqlite")
+    NPPES_CACHE_TTL_DAYS: float = 30.0
+    NPPES_CACHE_STALE_DAYS: float = 7.0  # past TTL, serve stale for this long while revalidating
+
+    # NPPES monthly full-replacement file and NUCC taxonomy codes (local copies)
+    NPPES_BULK_PATH: str = str(DATA_DIR / "raw" / "npidata_pfile.csv")
+    NUCC_TAXONOMY_PATH: str = str(DATA_DIR / "raw" / "nucc_taxonomy.csv")
+    # Zip -> county reference table (CSV with zip, state, county[, ratio] columns)
+    ZIP_COUNTY_CROSSWALK_PATH: str = str(DATA_DIR / "raw" / "zip_county_crosswalk.csv")
+
     # Analysis Scope
     TARGET_COUNTY: str = "CLARK"
     TARGET_STATE: str = "WA"
+    # Counties ingested in one pass, as "STATE:COUNTY" or "STATE:*" for every county
+    # in the crosswalk (empty = TARGET_STATE:TARGET_COUNTY only)
+    MONITORED_COUNTIES: list[str] = []
     
     # Anomaly Thresholds
     Z_SCORE_THRESHOLD: float = 5.0
+    ROBUST_Z_THRESHOLD: float = 3.5  # modified z-score (0.6745 * deviation / MAD)
     MIN_PEER_COUNT: int = 3
     SUDDEN_UTILIZATION_LIMIT: float = 1_000_000.0
     EXTREME_CONCENTRATION_THRESHOLD: float = 0.95
     MIN_CONCENTRATION_SPEND: float = 250_000.0
     VOLUME_OUTLIER_MULTIPLIER: float = 10.0
     MIN_VOLUME_CLAIMS: int = 500
+    # Published flag runs whose full flag sets stay in risk_flag_history (0 = keep all),
+    # older runs keep only their flag_run_diffs
+    FLAG_RUNS_KEPT: int = 10
+
+    # OIG LEIE: full list (revalidated with a conditional GET) and monthly supplements
+    # (e.g. .../downloadables/2026/2602EXCL.csv and 2602REIN.csv), applied in order
+    LEIE_URL: str = "https://oig.hhs.gov/exclusions/downloadables/UPDATED.csv"
+    LEIE_SUPPLEMENT_URLS: list[str] = []
+
+    # OIG LEIE fuzzy matching (scores 0-1)
+    LEIE_MATCH_MIN_SCORE: float = 0.80  # candidate pairs kept in leie_matches for review
+    LEIE_MATCH_FLAG_SCORE: float = 0.92  # a provider's best match at or above this raises LEIE_MATCH
+
+    # API database pool (0 = one cursor per API worker thread)
+    API_DB_POOL_SIZE: int = 0
+    API_DB_POOL_TIMEOUT: float = 5.0  # seconds a request waits for a free cursor before a 503
+    API_WARM_TABLES: list[str] = ["providers", "medicaid_spend", "risk_flag_history", "flag_runs", "provider_features"]
+    # In-process response cache, invalidated when the pipeline bumps the database generation
+    API_CACHE_MAX_ENTRIES: int = 1024
+    API_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    API_MAX_PAGE_SIZE: int = 500
+    DOSSIER_TOP_CODES: int = 10  # HCPCS codes listed in a provider dossier
+    EXPORT_BATCH_ROWS: int = 65_536  # rows per streamed record batch (and Parquet row group)
+    # Lower bounds of the total-spend tiers offered as list filters (last tier is open-ended)
+    SPEND_TIER_BOUNDS: list[float] = [0, 10_000, 100_000, 1_000_000, 10_000_000]
+
+    # ML Anomaly Detection
+    # "auto" scores with the registered model and retrains when none fits the current
+    # feature schema or parameters, or it crossed the drift or age limit below,
+    # "train" always refits, "score" never does
+    ML_MODE: str = "auto"
+    ML_MODEL_DIR: Path = DATA_DIR / "models"
+    ML_CONTAMINATION: float = 0.03
+    ML_RETRAIN_DRIFT: float = 0.25  # share of providers whose features differ from training
+    ML_MAX_MODEL_AGE_DAYS: int = 90  # 0 never retrains on age
+    ML_N_JOBS: int = -1
+
+    # Pipeline orchestration (src.dag): independent stages run side by side
+    PIPELINE_MAX_WORKERS: int = 4
+
+    # Performance benchmarks on synthetic data (src.perf)
+    PERF_BASELINE_PATH: str = str(DATA_DIR / "perf" / "baselines.json")  # per machine, one entry per scale
+    PERF_TOLERANCE: float = 0.25  # slowdown over the baseline reported as a regression
+    PERF_MIN_REGRESSION_SECONDS: float = 0.05  # smaller slowdowns are noise
+    PERF_MIN_REGRESSION_MB: float = 64.0  # smaller peak RSS growth is noise
 
     class Config:
         case_sensitive = True
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+import duckdb
+
+from src.config import settings
+from src.instrumentation import StageProfile
+from src.run_ledger import finish_pipeline_run, record_stage, start_pipeline_run
+
+# Pipeline stages as a DAG. Each stage declares what it reads: tables, settings
+# and local files. Before running, a stage's inputs are fingerprinted. When the
+# fingerprint matches the one recorded at the stage's last successful run in
+# pipeline_stages, the stage is skipped. Stages whose dependencies are done run
+# side by side on a thread pool.
+#
+# Volatile stages (source ingestion) always run: their real inputs are remote
+# files they revalidate themselves with conditional GETs, and what they write
+# is what downstream stages fingerprint.
+
+# Version queries for tables whose writers keep a ledger. Other tables are
+# fingerprinted by row count and an order-independent sum of row hashes, over
+# the listed columns only when declared as "table:col1,col2".
+TABLE_VERSION_SQL = {
+    "medicaid_spend": "SELECT COALESCE(MAX(ingest_run_id) FILTER (periods_changed > 0), 0) FROM hhs_ingestion_runs",
+    "leie_exclusions": "SELECT MAX(applied_at)::VARCHAR FROM leie_sources",
+}
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], object]
+    deps: list[str] = field(default_factory=list)
+    tables: list[str] = field(default_factory=list)  # input tables, optionally "table:col1,col2"
+    settings: list[str] = field(default_factory=list)  # settings the stage reads
+    files: list[str] = field(default_factory=list)  # settings holding local input file paths
+    volatile: bool = False  # always runs
+
+class StageFailed(RuntimeError):
+    pass
+
+def table_version(conn, table):
+    if table in TABLE_VERSION_SQL:
+        return str(conn.execute(TABLE_VERSION_SQL[table]).fetchone()[0])
+    name, _, columns = table.partition(":")
+    row = columns or "t"
+    return str(conn.execute(f"SELECT COUNT(*)::VARCHAR || ':' || COALESCE(SUM(hash({row})::HUGEINT), 0)::VARCHAR FROM {name} t").fetchone()[0])
+
+def file_version(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+def stage_inputs(conn, stage):
+    """Current values of everything `stage` declares as input."""
+    return {
+        "tables": {t: table_version(conn, t) for t in stage.tables},
+        "settings": {k: getattr(settings, k) for k in stage.settings},
+        "files": {k: file_version(str(getattr(settings, k))) for k in stage.files},
+    }
+
+def fingerprint(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+def _changed_inputs(previous, current):
+    """Names of the inputs that differ between two stage_inputs dicts."""
+    return sorted(
+        name
+        for kind in current
+        for name in current[kind]
+        if previous.get(kind, {}).get(name, object()) != json.loads(json.dumps(current[kind][name], default=str))
+    )
+
+class Dag:
+    def __init__(self, stages):
+        self.stages = {s.name: s for s in stages}
+        for s in stages:
+            unknown = set(s.deps) - self.stages.keys()
+            if unknown:
+                raise ValueError(f"Stage {s.name} depends on unknown stages {sorted(unknown)}")
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def descendants(self, name):
+        """`name` and every stage that depends on it, directly or not."""
+        selected = {name}
+        for stage in self.order:
+            if selected & set(self.stages[stage].deps):
+                selected.add(stage)
+        return selected
+
+    def select(self, only=None, start=None):
+        """Stage names targeted by --only (exactly these) or --from (that stage and its descendants)."""
+        names = list(only or []) + ([start] if start else [])
+        unknown = set(names) - self.stages.keys()
+        if unknown:
+            raise ValueError(f"Unknown stages {sorted(unknown)}. Stages: {', '.join(self.order)}")
+        if only:
+            return set(only)
+        if start:
+            return self.descendants(start)
+        return set(self.stages)
+
+    def _execute(self, stage, force, profile):
+        """Run one stage unless its inputs are unchanged, measured by `profile`. Returns (status, inputs)."""
+        with profile.measure():
+            conn = duckdb.connect(settings.DB_PATH)
+            try:
+                inputs = stage_inputs(conn, stage)
+                row = conn.execute("SELECT fingerprint, inputs FROM pipeline_stages WHERE stage = ?", [stage.name]).fetchone()
+            finally:
+                conn.close()
+
+            if not (force or stage.volatile):
+                if row and row[0] == fingerprint(inputs):
+                    print(f"[{stage.name}] inputs unchanged, skipping.")
+                    return "skipped", inputs
+                reason = f"changed: {', '.join(_changed_inputs(json.loads(row[1]), inputs))}" if row else "no previous run"
+                print(f"[{stage.name}] running ({reason}).")
+
+            stage.run()
+            return "ran", inputs
+
+    def _record(self, conn, run_id, stage, status, inputs, profile):
+        if status == "ran":
+            conn.execute("""
+                INSERT INTO pipeline_stages (stage, fingerprint, inputs, seconds, finished_at)
+                VALUES (?, ?, ?, ?, now())
+                ON CONFLICT (stage) DO UPDATE SET
+                    fingerprint = excluded.fingerprint, inputs = excluded.inputs,
+                    seconds = excluded.seconds, finished_at = excluded.finished_at
+            """, [stage.name, fingerprint(inputs), json.dumps(inputs, sort_keys=True, default=str), profile.wall_seconds])
+        record_stage(conn, run_id, status, profile)
+
+    def run(self, only=None, start=None, force=False, max_workers=None):
+        """
+        Run the selected stages in dependency order, independent ones
+        concurrently. Stages outside the selection count as done. Every stage
+        that runs is measured into the pipeline run ledger. Returns
+        {stage: "ran" | "skipped" | "not selected"}; raises StageFailed after
+        the running stages finish if any stage failed.
+        """
+        selected = self.select(only, start)
+        status = {name: "not selected" for name in self.order if name not in selected}
+        pending = [name for name in self.order if name in selected]
+        running, failures = {}, {}
+        workers = max_workers or settings.PIPELINE_MAX_WORKERS
+
+        # Held for the whole run: the stages' own connections then share one open
+        # database instance instead of racing to open and close it
+        conn = duckdb.connect(settings.DB_PATH)
+        run_id = start_pipeline_run(conn, {"only": only, "from": start, "force": force, "workers": workers})
+        print(f"Pipeline run {run_id}: {', '.join(pending)}")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                if not failures:
+                    for name in [n for n in pending if all(d in status for d in self.stages[n].deps)]:
+                        pending.remove(name)
+                        profile = StageProfile(name)
+                        running[pool.submit(self._execute, self.stages[name], force, profile)] = (name, profile)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, profile = running.pop(future)
+                    try:
+                        result, inputs = future.result()
+                    except Exception as e:
+                        print(f"[{name}] failed: {e!r}")
+                        failures[name] = e
+                        self._record(conn, run_id, self.stages[name], "failed", None, profile)
+                        continue
+                    self._record(conn, run_id, self.stages[name], result, inputs, profile)
+                    status[name] = result
+
+        finish_pipeline_run(conn, run_id, "failed" if failures else "succeeded")
+        conn.close()
+        if failures:
+            not_run = ", ".join(pending) or "none"
+            raise StageFailed(f"Stages failed: {', '.join(failures)} (not run: {not_run})") from next(iter(failures.values()))
+        return status
@@ -0,0 +1,71 @@
+import os
+
+from src.config import settings
+from src.instrumentation import connect
+
+def load_crosswalk(path=None):
+    """
+    (Re)load the zip -> county reference table from a local CSV.
+
+    Expected columns: zip, state, county and optionally ratio (share of the
+    zip's addresses in that county, as in the HUD USPS crosswalk). County
+    names are normalised to upper case without a trailing "COUNTY" so they
+    line up with TARGET_COUNTY. Returns the number of rows loaded.
+    """
+    path = path or settings.ZIP_COUNTY_CROSSWALK_PATH
+    conn = connect(settings.DB_PATH)
+
+    columns = [d[0] for d in conn.execute(
+        f"SELECT * FROM read_csv('{path}', header=True, all_varchar=True, normalize_names=True) LIMIT 0"
+    ).description]
+    ratio = "TRY_CAST(ratio AS DOUBLE)" if "ratio" in columns else "1.0"
+
+    conn.execute("BEGIN TRANSACTION")
+    conn.execute("DELETE FROM zip_county_crosswalk")
+    conn.execute(f"""
+        INSERT INTO zip_county_crosswalk (zip, state, county, ratio)
+        SELECT
+            LPAD(TRIM(zip), 5, '0'),
+            UPPER(TRIM(state)),
+            UPPER(TRIM(regexp_replace(county, '(?i)\\s+county$', ''))),
+            {ratio}
+        FROM read_csv('{path}', header=True, all_varchar=True, normalize_names=True)
+        WHERE zip IS NOT NULL AND county IS NOT NULL
+    """)
+    conn.execute("COMMIT")
+
+    count = conn.execute("SELECT COUNT(*) FROM zip_county_crosswalk").fetchone()[0]
+    conn.close()
+    print(f"Loaded {count} zip -> county rows from {path}.")
+    return count
+
+def load_crosswalk_if_present(path=None):
+    path = path or settings.ZIP_COUNTY_CROSSWALK_PATH
+    if os.path.exists(path):
+        return load_crosswalk(path)
+    return 0
+
+def crosswalk_available(conn):
+    return conn.execute("SELECT COUNT(*) > 0 FROM zip_county_crosswalk").fetchone()[0]
+
+def counties_in_state(conn, state):
+    rows = conn.execute(
+        "SELECT DISTINCT county FROM zip_county_crosswalk WHERE state = ? ORDER BY 1", [state]
+    ).fetchall()
+    return [r[0] for r in rows]
+
+# Each zip is assigned to the county holding the largest share of it, so a
+# provider is never counted in two neighbouring counties.
+PRIMARY_ZIP_COUNTY_SQL = """
+    SELECT zip, state, county FROM (
+        SELECT zip, state, county,
+               ROW_NUMBER() OVER (PARTITION BY zip ORDER BY ratio DESC NULLS LAST, county) AS rn
+        FROM zip_county_crosswalk
+    ) WHERE rn = 1
+"""
+
+def zips_for_county(conn, state, county):
+    rows = conn.execute(f"""
+        SELECT zip FROM ({PRIMARY_ZIP_COUNTY_SQL}) WHERE state = ? AND county = ? ORDER BY 1
+    """, [state, county]).fetchall()
+    return [r[0] for r in rows]
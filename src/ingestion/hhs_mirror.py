@@ -0,0 +1,134 @@
+import duckdb
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from src.config import settings
+from src.ingestion.remote import conditional_download
+
+MANIFEST_NAME = "_manifest.json"
+PARTITION_COLUMN = "CLAIM_FROM_MONTH"
+
+# Types for the columns the ingestion queries touch; everything else is sniffed.
+HHS_COLUMN_TYPES = {
+    "BILLING_PROVIDER_NPI_NUM": "VARCHAR",
+    "HCPCS_CODE": "VARCHAR",
+    "CLAIM_FROM_MONTH": "VARCHAR",
+    "TOTAL_UNIQUE_BENEFICIARIES": "BIGINT",
+    "TOTAL_CLAIMS": "BIGINT",
+    "TOTAL_PAID": "DOUBLE",
+}
+
+def _is_remote(url):
+    return urlparse(url).scheme in ("http", "https")
+
+def _local_validators(path):
+    stat = os.stat(path)
+    return {"url": path, "etag": f"{stat.st_size}-{int(stat.st_mtime)}", "last_modified": None}
+
+def load_manifest(mirror_dir=None):
+    path = os.path.join(str(mirror_dir or settings.HHS_MIRROR_DIR), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _convert_csv_to_parquet(csv_path, mirror_dir):
+    """Rewrite the CSV as a Parquet dataset with one Hive partition per month."""
+    staging_dir = mirror_dir + ".staging"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+    conn = duckdb.connect()
+    types = ", ".join(f"'{col}': '{typ}'" for col, typ in HHS_COLUMN_TYPES.items())
+    conn.execute(f"""
+        COPY (
+            SELECT * FROM read_csv('{csv_path}', header=True, types={{{types}}})
+        ) TO '{staging_dir}' (FORMAT PARQUET, PARTITION_BY ({PARTITION_COLUMN}), COMPRESSION ZSTD)
+    """)
+    months = _month_stats(conn, staging_dir)
+    conn.close()
+
+    # Swap the new dataset in only once it is complete
+    retired_dir = mirror_dir + ".retired"
+    shutil.rmtree(retired_dir, ignore_errors=True)
+    if os.path.exists(mirror_dir):
+        os.replace(mirror_dir, retired_dir)
+    os.replace(staging_dir, mirror_dir)
+    shutil.rmtree(retired_dir, ignore_errors=True)
+    return months
+
+def _month_stats(conn, dataset_dir):
+    """{month: (row count, checksum)} of a partitioned dataset, the checksum an order-independent sum of row hashes."""
+    rows = conn.execute(f"""
+        SELECT {PARTITION_COLUMN}, COUNT(*), COUNT(*) || ':' || SUM(hash(t))::HUGEINT
+        FROM read_parquet('{dataset_dir}/**/*.parquet', hive_partitioning=True, hive_types={{'{PARTITION_COLUMN}': VARCHAR}}) t
+        GROUP BY 1 ORDER BY 1
+    """).fetchall()
+    return {month: (count, checksum) for month, count, checksum in rows}
+
+def _write_manifest(mirror_dir, manifest):
+    with open(os.path.join(mirror_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+def sync_hhs_mirror(url=None, force=False):
+    """
+    Make sure the local Parquet mirror reflects `url` (default: settings.HHS_SOURCE_URL).
+
+    The mirror is keyed by URL + ETag/Last-Modified. A conditional GET is issued on
+    every call; only a changed source is downloaded and converted again.
+    Returns the mirror manifest.
+    """
+    url = url or settings.HHS_SOURCE_URL
+    mirror_dir = str(settings.HHS_MIRROR_DIR)
+    manifest = load_manifest(mirror_dir)
+    cached = manifest if manifest and manifest.get("url") == url and not force else None
+
+    if cached and not (cached.get("etag") or cached.get("last_modified")) and _is_remote(url):
+        # Server gave us no validators; the dated release URL is the version key.
+        print(f"HHS mirror is current for {url} (no validators, URL unchanged).")
+        return cached
+
+    if _is_remote(url):
+        csv_path = os.path.join(os.path.dirname(mirror_dir), "hhs_source_download.csv")
+        changed, validators = conditional_download(url, csv_path, cached, desc="Downloading HHS spend")
+    else:
+        csv_path = url
+        validators = _local_validators(url)
+        changed = not cached or cached.get("etag") != validators["etag"]
+
+    if not changed:
+        print(f"HHS mirror is current for {url} (revalidated).")
+        return cached
+
+    print(f"Converting HHS source to partitioned Parquet at {mirror_dir}...")
+    months = _convert_csv_to_parquet(csv_path, mirror_dir)
+    if _is_remote(url):
+        os.remove(csv_path)
+
+    manifest = {
+        **validators,
+        "converted_at": datetime.now(timezone.utc).isoformat(),
+        "row_count": sum(count for count, _ in months.values()),
+        "months": {month: count for month, (count, _) in months.items()},
+        "month_checksums": {month: checksum for month, (_, checksum) in months.items()},
+    }
+    _write_manifest(mirror_dir, manifest)
+    print(f"HHS mirror ready: {manifest['row_count']} rows across {len(months)} months.")
+    return manifest
+
+def mirror_relation(months=None, mirror_dir=None):
+    """
+    SQL table expression over the mirror. Passing `months` ('YYYY-MM' strings)
+    restricts the scan to those partitions; DuckDB projects columns on its own.
+    """
+    mirror_dir = str(mirror_dir or settings.HHS_MIRROR_DIR)
+    if months is None:
+        files = f"'{mirror_dir}/**/*.parquet'"
+    else:
+        files = "[" + ", ".join(f"'{mirror_dir}/{PARTITION_COLUMN}={m}/*.parquet'" for m in sorted(months)) + "]"
+    return f"read_parquet({files}, hive_partitioning=True, hive_types={{'{PARTITION_COLUMN}': VARCHAR}})"
+
+if __name__ == "__main__":
+    sync_hhs_mirror()
@@ -1,56 +1,140 @@
-import requests
-import duckdb
-import pandas as pd
-import io
-from tqdm import tqdm
 import os
+from urllib.parse import urlparse
 
-LEIE_URL = "https://oig.hhs.gov/exclusions/downloadables/UPDATED.csv"
 from src.config import settings
-TMP_LEIE_CSV = str(settings.DATA_DIR / "raw" / "leie_full.csv")
+from src.instrumentation import connect
+from src.ingestion.remote import conditional_download
 
-def main():
-    print("Downloading OIG LEIE Exclusion List...")
-    # ... rest uses settings
-    response = requests.get(LEIE_URL, stream=True)
-    response.raise_for_status()
-    
-    total_size = int(response.headers.get('content-length', 0))
-    
-    os.makedirs("data/raw", exist_ok=True)
-    with open(TMP_LEIE_CSV, "wb") as f, tqdm(
-        desc="Downloading LEIE",
-        total=total_size,
-        unit='iB',
-        unit_scale=True,
-        unit_divisor=1024,
-    ) as bar:
-        for chunk in response.iter_content(chunk_size=8192):
-            size = f.write(chunk)
-            bar.update(size)
-
-    print("Loading LEIE into DuckDB...")
-    conn = duckdb.connect(settings.DB_PATH)
-    
-    # Clean it up: Some NPIs might be 0 or empty in the CSV
-    # LEIE has its own column names: LASTNAME, FIRSTNAME, MIDNAME, BUSNAME, GENERAL, SPECIALTY, UPIN, NPI, DOB, ADDRESS, CITY, STATE, ZIP, EXCLTYPE, EXCLDATE, REINDATE, WAIVERDATE, WVRSTATE
-    
+# The OIG LEIE as a keyed table. The full list (UPDATED.csv) is revalidated with
+# a conditional GET and, when it changed, applied as an upsert that also drops
+# entries no longer listed (reinstated). Monthly supplements add exclusions or
+# stamp reinstatement dates without touching the rest. Only NPIs whose
+# exclusion status may have changed, plus providers added since the last
+# check, get is_excluded recomputed.
+
+LEIE_COLUMNS = [
+    "last_name", "first_name", "mid_name", "bus_name", "general_specialty", "specialty", "upin", "npi", "dob",
+    "address", "city", "state", "zip", "excl_type", "excl_date", "rein_date", "waiver_date", "wvr_state",
+]
+
+# Identity of a listed exclusion: a reinstatement names the same person, NPI, type and date
+LEIE_KEY_SQL = """
+    md5(concat_ws('|', COALESCE(last_name, ''), COALESCE(first_name, ''), COALESCE(mid_name, ''),
+                  COALESCE(bus_name, ''), COALESCE(npi, ''), COALESCE(dob, ''), COALESCE(excl_type, ''),
+                  COALESCE(excl_date, ''), COALESCE(address, ''), COALESCE(zip, '')))
+"""
+
+ACTIVE_SQL = "COALESCE(NULLIF(trim(rein_date), ''), '00000000') = '00000000'"
+
+def upgrade_leie_table(conn):
+    # Older databases appended the whole list on every run, without a key.
+    # The table only mirrors the download, so drop it and reload from scratch.
+    legacy = conn.execute("""
+        SELECT COUNT(*) FROM information_schema.tables t
+        WHERE t.table_name = 'leie_exclusions'
+          AND NOT EXISTS (
+              SELECT 1 FROM information_schema.columns c
+              WHERE c.table_name = 'leie_exclusions' AND c.column_name = 'leie_key'
+          )
+    """).fetchone()[0]
+    if legacy:
+        conn.execute("DROP TABLE leie_exclusions")
+
+def _download_path(url):
+    return str(settings.DATA_DIR / "raw" / "leie" / os.path.basename(urlparse(url).path))
+
+def _stage_incoming(conn, csv_path):
+    """TEMP leie_incoming: the file's rows, keyed and deduplicated, with placeholder NPIs as NULL."""
+    names = ", ".join(f"'{c}'" for c in LEIE_COLUMNS)
     conn.execute(f"""
-        INSERT INTO leie_exclusions 
-        SELECT * FROM read_csv_auto('{TMP_LEIE_CSV}', normalize_names=True)
+        CREATE OR REPLACE TEMP TABLE leie_incoming AS
+        SELECT {LEIE_KEY_SQL} AS leie_key, *
+        FROM (
+            SELECT * REPLACE (NULLIF(regexp_replace(trim(COALESCE(npi, '')), '^0*$', ''), '') AS npi)
+            FROM read_csv('{csv_path}', header=True, all_varchar=True, names=[{names}])
+        )
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY leie_key ORDER BY rein_date DESC NULLS LAST) = 1
     """)
-    
-    # Update providers table with exclusion flags
-    print("Updating provider exclusion flags...")
+
+def _apply_incoming(conn, url, full):
+    """
+    Upsert leie_incoming into leie_exclusions (deleting unlisted rows when
+    `full`) and add NPIs whose entries changed to TEMP leie_affected.
+    Returns the number of changed entries.
+    """
+    changes = "SELECT leie_key, npi, rein_date FROM leie_incoming EXCEPT SELECT leie_key, npi, rein_date FROM leie_exclusions"
+    if full:
+        changes += """
+            UNION ALL
+            (SELECT leie_key, npi, rein_date FROM leie_exclusions EXCEPT SELECT leie_key, npi, rein_date FROM leie_incoming)
+        """
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE leie_changes AS {changes}")
+    conn.execute("INSERT INTO leie_affected SELECT DISTINCT npi FROM leie_changes WHERE npi IS NOT NULL")
+
+    if full:
+        conn.execute("DELETE FROM leie_exclusions WHERE leie_key NOT IN (SELECT leie_key FROM leie_incoming)")
+    updates = ", ".join(f"{c} = excluded.{c}" for c in LEIE_COLUMNS)
+    conn.execute(f"""
+        INSERT INTO leie_exclusions BY NAME
+        SELECT *, ? AS source_url FROM leie_incoming
+        ON CONFLICT (leie_key) DO UPDATE SET {updates}, source_url = excluded.source_url, loaded_at = now()
+    """, [url])
+    return conn.execute("SELECT COUNT(*) FROM leie_changes").fetchone()[0]
+
+def _sync_source(conn, url, kind):
+    """Revalidate one LEIE file and apply it if it changed. Returns the number of changed entries, or None if unchanged."""
+    row = conn.execute("SELECT etag, last_modified FROM leie_sources WHERE url = ?", [url]).fetchone()
+    validators = {"url": url, "etag": row[0], "last_modified": row[1]} if row else None
+
+    csv_path = _download_path(url)
+    changed, validators = conditional_download(url, csv_path, validators, desc=f"Downloading LEIE {kind}")
+    if not changed:
+        conn.execute("UPDATE leie_sources SET checked_at = now() WHERE url = ?", [url])
+        print(f"LEIE {kind} is current: {url}")
+        return None
+
+    _stage_incoming(conn, csv_path)
+    conn.execute("BEGIN TRANSACTION")
+    changed_entries = _apply_incoming(conn, url, full=kind == "full")
     conn.execute("""
-        UPDATE providers 
-        SET is_excluded = TRUE 
-        WHERE npi IN (SELECT CAST(npi AS VARCHAR) FROM leie_exclusions WHERE npi IS NOT NULL AND npi != '0')
-    """)
-    
+        INSERT INTO leie_sources (url, kind, etag, last_modified, row_count, applied_at, checked_at)
+        VALUES ($url, $kind, $etag, $last_modified, (SELECT COUNT(*) FROM leie_incoming), now(), now())
+        ON CONFLICT (url) DO UPDATE SET
+            kind = excluded.kind, etag = excluded.etag, last_modified = excluded.last_modified,
+            row_count = excluded.row_count, applied_at = now(), checked_at = now()
+    """, {"url": url, "kind": kind, "etag": validators["etag"], "last_modified": validators["last_modified"]})
+    conn.execute("COMMIT")
+    print(f"Applied LEIE {kind} {url}: {changed_entries} entries added, changed or removed.")
+    return changed_entries
+
+def refresh_exclusion_status(conn, since=None):
+    """
+    Recompute providers.is_excluded for NPIs in TEMP leie_affected and for
+    providers updated at or after `since` (every provider when None).
+    Returns the number of providers whose status changed.
+    """
+    return conn.execute(f"""
+        UPDATE providers
+        SET is_excluded = npi IN (SELECT npi FROM leie_exclusions WHERE npi IS NOT NULL AND {ACTIVE_SQL})
+        WHERE (npi IN (SELECT npi FROM leie_affected) OR $since IS NULL OR last_updated >= $since)
+          AND is_excluded IS DISTINCT FROM (npi IN (SELECT npi FROM leie_exclusions WHERE npi IS NOT NULL AND {ACTIVE_SQL}))
+    """, {"since": since}).fetchone()[0]
+
+def main():
+    print("Refreshing OIG LEIE Exclusion List...")
+    conn = connect(settings.DB_PATH)
+    since = conn.execute("SELECT MAX(checked_at) FROM leie_sources").fetchone()[0]
+    conn.execute("CREATE OR REPLACE TEMP TABLE leie_affected (npi VARCHAR)")
+
+    _sync_source(conn, settings.LEIE_URL, "full")
+    for url in settings.LEIE_SUPPLEMENT_URLS:
+        _sync_source(conn, url, "supplement")
+
+    print("Updating provider exclusion flags...")
+    updated = refresh_exclusion_status(conn, since)
     excluded_count = conn.execute("SELECT COUNT(*) FROM providers WHERE is_excluded = TRUE").fetchone()[0]
-    print(f"Ingestion complete. Found {excluded_count} matches in our provider database.")
-    
+    print(f"Ingestion complete. {updated} providers changed status, {excluded_count} excluded in our provider database.")
+
     conn.close()
 
 if __name__ == "__main__":
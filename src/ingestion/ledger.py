@@ -0,0 +1,35 @@
+# Read side of the HHS ingestion ledger. filter_hhs_spend records every
+# (county, period) it rewrites under an increasing ingest_run_id; downstream
+# stages remember the last run id they consumed and only revisit what changed.
+
+def latest_ingest_run_id(conn):
+    """Id of the most recent ingestion run, or 0 if nothing was ingested yet."""
+    return conn.execute("SELECT COALESCE(MAX(ingest_run_id), 0) FROM hhs_ingestion_runs").fetchone()[0]
+
+def changed_periods(conn, since_run_id=0):
+    """Sorted list of periods (dates) added, rewritten or removed after `since_run_id`."""
+    rows = conn.execute("""
+        SELECT DISTINCT period FROM hhs_ingestion_changes
+        WHERE ingest_run_id > ?
+        ORDER BY 1
+    """, [since_run_id]).fetchall()
+    return [r[0] for r in rows]
+
+def loaded_periods(conn):
+    """Current ledger: (state, county, period, source_release, row_count) per loaded period."""
+    return conn.execute("""
+        SELECT state, county, period, source_release, row_count
+        FROM hhs_ingestion_ledger
+        ORDER BY 1, 2, 3
+    """).fetchall()
+
+def stage_watermark(conn, stage):
+    """Last ingest_run_id `stage` consumed, or None if it has never run."""
+    row = conn.execute("SELECT ingest_run_id FROM analysis_watermarks WHERE stage = ?", [stage]).fetchone()
+    return row[0] if row else None
+
+def set_stage_watermark(conn, stage, ingest_run_id):
+    conn.execute("""
+        INSERT INTO analysis_watermarks (stage, ingest_run_id) VALUES (?, ?)
+        ON CONFLICT (stage) DO UPDATE SET ingest_run_id = excluded.ingest_run_id, updated_at = now()
+    """, [stage, ingest_run_id])
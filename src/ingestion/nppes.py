@@ -0,0 +1,262 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.config import settings
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class NPPESCache:
+    """
+    On-disk cache of raw NPPES API responses keyed by the canonical query parameters.
+
+    SQLite rather than DuckDB so several enrichment scripts (and their worker
+    threads) can share one cache file at the same time.
+    """
+
+    def __init__(self, path=None, ttl_days=None, stale_days=None):
+        self.path = path or settings.NPPES_CACHE_PATH
+        self.ttl = 86400 * (settings.NPPES_CACHE_TTL_DAYS if ttl_days is None else ttl_days)
+        self.stale = 86400 * (settings.NPPES_CACHE_STALE_DAYS if stale_days is None else stale_days)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS nppes_responses (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    @staticmethod
+    def key(params):
+        # NPIs arrive as ints from some scripts and strings from others
+        return json.dumps({k: str(v) for k, v in params.items()}, sort_keys=True)
+
+    def get(self, params):
+        """(response, state) where state is 'fresh', 'stale' (serve + revalidate) or 'expired'/None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, fetched_at FROM nppes_responses WHERE cache_key = ?", [self.key(params)]
+            ).fetchone()
+        if row is None:
+            return None, None
+        age = time.time() - row[1]
+        if age < self.ttl:
+            state = "fresh"
+        elif age < self.ttl + self.stale:
+            state = "stale"
+        else:
+            state = "expired"
+        return json.loads(row[0]), state
+
+    def put(self, params, response):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO nppes_responses (cache_key, response, fetched_at) VALUES (?, ?, ?)",
+                [self.key(params), json.dumps(response), time.time()]
+            )
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def parse_npi_record(npi, res):
+    """Flatten one NPPES API result into our `providers` columns."""
+    basic = res.get("basic", {})
+    name = basic.get("organization_name") or f"{basic.get('first_name', '')} {basic.get('last_name', '')}".strip()
+    taxonomies = res.get("taxonomies", [])
+    primary_tax = next((t for t in taxonomies if t.get("primary")), taxonomies[0] if taxonomies else {})
+    addresses = res.get("addresses", []) or [{}]
+    practice_addr = next((a for a in addresses if a.get("address_purpose") == "LOCATION"), addresses[0])
+    mailing_addr = next((a for a in addresses if a.get("address_purpose") == "MAILING"), addresses[0])
+
+    # Authorized Official Details (Inside basic object with prefix)
+    auth_name = f"{basic.get('authorized_official_first_name', '')} {basic.get('authorized_official_last_name', '')}".strip()
+
+    return {
+        "npi": npi,
+        "name": name,
+        "taxonomy_desc": primary_tax.get("desc", "Unknown"),
+        "org_type": res.get("enumeration_type", "Unknown"),
+        "city": practice_addr.get("city", "Unknown"),
+        "state": practice_addr.get("state", "Unknown"),
+        "postal_code": practice_addr.get("postal_code", "Unknown"),
+        "auth_official_name": auth_name or None,
+        "auth_official_title": basic.get("authorized_official_title_or_position"),
+        "auth_official_phone": basic.get("authorized_official_telephone_number"),
+        "mailing_address": mailing_addr.get("address_1"),
+        "mailing_city": mailing_addr.get("city"),
+        "mailing_state": mailing_addr.get("state"),
+        "mailing_zip": mailing_addr.get("postal_code"),
+        "practice_address": practice_addr.get("address_1")
+    }
+
+class NPPESClient:
+    """
+    Pooled, rate-limited, cached NPPES Registry API client.
+
+    All worker threads share one requests.Session (keep-alive connection pool)
+    and one token bucket, so total throughput stays at `rate` requests/second
+    no matter how many workers are running. 429/5xx responses and connection
+    errors are retried with exponential backoff (honouring Retry-After).
+
+    Responses go through an NPPESCache: fresh entries never touch the network,
+    stale ones are returned immediately and refreshed in the background
+    (or, with allow_stale=False, refetched before returning), and
+    `stats` counts hits, stale hits, misses and revalidations.
+    """
+
+    def __init__(self, base_url=None, rate=None, concurrency=None, max_retries=None, backoff=None, timeout=10, cache=None):
+        self.base_url = base_url or settings.NPPES_API_URL
+        self.concurrency = concurrency or settings.NPPES_MAX_CONCURRENCY
+        self.max_retries = settings.NPPES_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.NPPES_BACKOFF_SECONDS if backoff is None else backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate or settings.NPPES_RATE_LIMIT)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.cache = cache if cache is not None else NPPESCache()
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.revalidator = ThreadPoolExecutor(max_workers=2)
+        self.revalidating = set()
+
+    def _count(self, event):
+        with self.stats_lock:
+            self.stats[event] += 1
+
+    def _sleep_before_retry(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = self.backoff * (2 ** attempt) + random.uniform(0, self.backoff / 2)
+        time.sleep(delay)
+
+    def query(self, params, allow_stale=True):
+        """
+        Decoded JSON body for `params`, served from the cache when possible.
+        With allow_stale=False a stale entry is refetched instead of served.
+        """
+        params = {"version": "2.1", **params}
+        cached, state = self.cache.get(params)
+        if state == "fresh":
+            self._count("hits")
+            return cached
+        if state == "stale" and allow_stale:
+            self._count("stale_hits")
+            self._revalidate_in_background(params)
+            return cached
+        if state == "stale":
+            response = self._fetch(params)
+            self.cache.put(params, response)
+            self._count("revalidated")
+            return response
+        self._count("misses")
+        response = self._fetch(params)
+        self.cache.put(params, response)
+        return response
+
+    def _revalidate_in_background(self, params):
+        key = self.cache.key(params)
+        with self.stats_lock:
+            if key in self.revalidating:
+                return
+            self.revalidating.add(key)
+
+        def refresh():
+            try:
+                self.cache.put(params, self._fetch(params))
+                self._count("revalidated")
+            except Exception as e:
+                print(f"Background NPPES refresh failed for {params}: {e}")
+            finally:
+                with self.stats_lock:
+                    self.revalidating.discard(key)
+
+        self.revalidator.submit(refresh)
+
+    def _fetch(self, params):
+        """GET the API with `params` and return the decoded JSON body."""
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+            except requests.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._sleep_before_retry(attempt, response)
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def lookup_npi(self, npi, allow_stale=True):
+        """Parsed provider details for one NPI, or None if unknown / unreachable."""
+        try:
+            results = self.query({"number": npi}, allow_stale).get("results", [])
+        except Exception as e:
+            print(f"Error fetching NPI {npi}: {e}")
+            return None
+        if not results:
+            return None
+        return parse_npi_record(npi, results[0])
+
+    def lookup_many(self, npis, allow_stale=True):
+        """Yield (npi, details) as lookups complete, `concurrency` at a time."""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self.lookup_npi, npi, allow_stale): npi for npi in npis}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def stats_summary(self):
+        s = self.stats
+        return (f"NPPES cache: {s['hits']} fresh hits, {s['stale_hits']} stale hits, "
+                f"{s['misses']} misses, {s['requests']} network requests")
+
+    def close(self):
+        self.revalidator.shutdown(wait=True)
+        self.session.close()
+        self.cache.close()
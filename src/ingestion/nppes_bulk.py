@@ -0,0 +1,119 @@
+import duckdb
+import json
+import os
+
+from src.config import settings
+from src.ingestion.scopes import scope_npi_path
+from src.analysis.rollup import refresh_provider_details
+
+TAXONOMY_SLOTS = 15
+
+def _col(name):
+    return '"' + name + '"'
+
+def _primary_taxonomy_sql():
+    # First slot flagged as primary, else slot 1 (same rule the API client uses)
+    branches = ",\n                ".join(
+        f"CASE WHEN {_col(f'Healthcare Provider Primary Taxonomy Switch_{i}')} = 'Y' "
+        f"THEN {_col(f'Healthcare Provider Taxonomy Code_{i}')} END"
+        for i in range(1, TAXONOMY_SLOTS + 1)
+    )
+    return f"COALESCE(\n                {branches},\n                {_col('Healthcare Provider Taxonomy Code_1')})"
+
+def load_bulk_roster(zips=None, state=None, csv_path=None, taxonomy_path=None, scope_county=None):
+    """
+    Build `providers` rows straight from the NPPES full-replacement CSV.
+
+    One columnar DuckDB pass projects only the columns we store and keeps every
+    active NPI whose practice location is in `state` (default TARGET_STATE) and,
+    when `zips` is given, in one of those 5-digit zip codes. Rows are upserted,
+    so earlier enrichment of the same NPIs is refreshed in place, along with
+    their provider_rollup rows and dossiers. When
+    `scope_county` is given, the selected NPIs are also saved as that county's
+    scope file for filter_hhs_spend. Returns the number of providers written.
+    """
+    csv_path = csv_path or settings.NPPES_BULK_PATH
+    taxonomy_path = taxonomy_path or settings.NUCC_TAXONOMY_PATH
+    state = state or settings.TARGET_STATE
+    conn = duckdb.connect(settings.DB_PATH)
+
+    practice_zip = f"LEFT({_col('Provider Business Practice Location Address Postal Code')}, 5)"
+    zip_filter = f"AND {practice_zip} IN (SELECT UNNEST(?))" if zips else ""
+    params = [state, list(zips)] if zips else [state]
+
+    print(f"Streaming NPPES bulk file {csv_path} for {state} ({len(zips) if zips else 'all'} zips)...")
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE nppes_roster AS
+        SELECT
+            {_col('NPI')} AS npi,
+            COALESCE(NULLIF({_col('Provider Organization Name (Legal Business Name)')}, ''),
+                     TRIM(COALESCE({_col('Provider First Name')}, '') || ' ' || COALESCE({_col('Provider Last Name (Legal Name)')}, ''))) AS name,
+            {_primary_taxonomy_sql()} AS taxonomy_code,
+            'NPI-' || {_col('Entity Type Code')} AS org_type,
+            {_col('Provider Business Practice Location Address City Name')} AS city,
+            {_col('Provider Business Practice Location Address State Name')} AS state,
+            {_col('Provider Business Practice Location Address Postal Code')} AS postal_code,
+            {_col('Provider First Line Business Practice Location Address')} AS practice_address,
+            NULLIF(TRIM(COALESCE({_col('Authorized Official First Name')}, '') || ' ' || COALESCE({_col('Authorized Official Last Name')}, '')), '') AS auth_official_name,
+            {_col('Authorized Official Title or Position')} AS auth_official_title,
+            {_col('Authorized Official Telephone Number')} AS auth_official_phone,
+            {_col('Provider First Line Business Mailing Address')} AS mailing_address,
+            {_col('Provider Business Mailing Address City Name')} AS mailing_city,
+            {_col('Provider Business Mailing Address State Name')} AS mailing_state,
+            {_col('Provider Business Mailing Address Postal Code')} AS mailing_zip
+        FROM read_csv('{csv_path}', header=True, all_varchar=True)
+        WHERE {_col('Provider Business Practice Location Address State Name')} = ?
+          AND {_col('Entity Type Code')} IS NOT NULL
+          AND ({_col('NPI Deactivation Date')} IS NULL OR {_col('NPI Reactivation Date')} IS NOT NULL)
+          {zip_filter}
+    """, params)
+
+    # Bulk file only carries taxonomy codes; the API's "desc" is NUCC Classification[, Specialization]
+    conn.execute("CREATE OR REPLACE TEMP TABLE nucc_taxonomy (code VARCHAR, taxonomy_desc VARCHAR)")
+    if os.path.exists(taxonomy_path):
+        conn.execute(f"""
+            INSERT INTO nucc_taxonomy
+            SELECT Code, Classification || COALESCE(', ' || NULLIF(Specialization, ''), '')
+            FROM read_csv('{taxonomy_path}', header=True, all_varchar=True)
+        """)
+    else:
+        print(f"Warning: NUCC taxonomy file not found at {taxonomy_path}; storing raw taxonomy codes.")
+
+    conn.execute("""
+        INSERT INTO providers (npi, name, taxonomy_desc, org_type, city, state, postal_code, practice_address,
+                               auth_official_name, auth_official_title, auth_official_phone,
+                               mailing_address, mailing_city, mailing_state, mailing_zip)
+        SELECT r.npi, r.name, COALESCE(t.taxonomy_desc, r.taxonomy_code), r.org_type, r.city, r.state, r.postal_code,
+               r.practice_address, r.auth_official_name, r.auth_official_title, r.auth_official_phone,
+               r.mailing_address, r.mailing_city, r.mailing_state, r.mailing_zip
+        FROM nppes_roster r
+        LEFT JOIN nucc_taxonomy t ON r.taxonomy_code = t.code
+        ON CONFLICT (npi) DO UPDATE SET
+            name = excluded.name, taxonomy_desc = excluded.taxonomy_desc, org_type = excluded.org_type,
+            city = excluded.city, state = excluded.state, postal_code = excluded.postal_code,
+            practice_address = excluded.practice_address,
+            auth_official_name = excluded.auth_official_name, auth_official_title = excluded.auth_official_title,
+            auth_official_phone = excluded.auth_official_phone,
+            mailing_address = excluded.mailing_address, mailing_city = excluded.mailing_city,
+            mailing_state = excluded.mailing_state, mailing_zip = excluded.mailing_zip,
+            last_updated = now()
+    """)
+
+    npis = [r[0] for r in conn.execute("SELECT npi FROM nppes_roster ORDER BY 1").fetchall()]
+    if npis:
+        refresh_provider_details(conn, npis)
+    conn.close()
+
+    if scope_county:
+        path = scope_npi_path(scope_county)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(npis, f)
+        print(f"Saved {len(npis)} NPIs to {path}")
+
+    print(f"Roster load complete. Upserted {len(npis)} providers.")
+    return len(npis)
+
+if __name__ == "__main__":
+    from scripts.get_clark_county_npis import target_zips
+    load_bulk_roster(zips=target_zips(), scope_county=settings.TARGET_COUNTY)
@@ -0,0 +1,52 @@
+import os
+import requests
+from tqdm import tqdm
+
+def conditional_download(url, dest_path, validators=None, desc="Downloading"):
+    """
+    Download `url` to `dest_path` unless the server confirms our cached copy is current.
+
+    `validators` is the dict returned by a previous call ({"url", "etag", "last_modified"}).
+    Returns (changed, validators). When `changed` is False nothing was written.
+    """
+    validators = validators or {}
+    headers = {}
+    if validators.get("url") == url:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = requests.get(url, headers=headers, stream=True, timeout=60)
+    try:
+        if response.status_code == 304:
+            return False, validators
+        response.raise_for_status()
+
+        fresh = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        # Some servers ignore conditional headers but still send validators;
+        # identical validators mean the same object, so skip the body.
+        if validators.get("url") == url and (fresh["etag"] or fresh["last_modified"]):
+            if fresh["etag"] == validators.get("etag") and fresh["last_modified"] == validators.get("last_modified"):
+                return False, validators
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        total_size = int(response.headers.get("content-length", 0))
+        tmp_path = dest_path + ".part"
+        with open(tmp_path, "wb") as f, tqdm(
+            desc=desc,
+            total=total_size,
+            unit="iB",
+            unit_scale=True,
+            unit_divisor=1024,
+        ) as bar:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                bar.update(f.write(chunk))
+        os.replace(tmp_path, dest_path)
+        return True, fresh
+    finally:
+        response.close()
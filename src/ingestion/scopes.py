@@ -0,0 +1,93 @@
+import json
+import os
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from src.config import settings
+from src.ingestion.crosswalk import PRIMARY_ZIP_COUNTY_SQL, crosswalk_available, counties_in_state
+
+@dataclass
+class CountyScope:
+    """One monitored jurisdiction and the billing NPIs that belong to it."""
+    state: str
+    county: str
+    npis: set = field(default_factory=set)
+
+def parse_county_key(key):
+    """'WA:CLARK' -> ('WA', 'CLARK')"""
+    state, county = key.split(":", 1)
+    return state.strip().upper(), county.strip().upper()
+
+def monitored_counties(conn=None):
+    """
+    (state, county) pairs to ingest; defaults to the single TARGET_* scope.
+    "STATE:*" expands to every county of that state in the crosswalk.
+    """
+    keys = settings.MONITORED_COUNTIES or [f"{settings.TARGET_STATE}:{settings.TARGET_COUNTY}"]
+    counties = []
+    for state, county in map(parse_county_key, keys):
+        if county == "*":
+            counties.extend((state, c) for c in counties_in_state(conn, state))
+        else:
+            counties.append((state, county))
+    return counties
+
+def resolve_county_scopes(conn, counties):
+    """
+    Counties -> zips (crosswalk) -> NPIs (provider roster) in one join.
+    Providers are matched on the 5-digit practice zip.
+    """
+    conn.execute("CREATE OR REPLACE TEMP TABLE requested_counties (state VARCHAR, county VARCHAR)")
+    conn.executemany("INSERT INTO requested_counties VALUES (?, ?)", [list(c) for c in counties])
+    rows = conn.execute(f"""
+        SELECT r.state, r.county, LIST(p.npi) FILTER (WHERE p.npi IS NOT NULL)
+        FROM requested_counties r
+        LEFT JOIN ({PRIMARY_ZIP_COUNTY_SQL}) z ON z.state = r.state AND z.county = r.county
+        LEFT JOIN providers p ON LEFT(p.postal_code, 5) = z.zip
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """).fetchall()
+    return [CountyScope(state, county, set(npis or [])) for state, county, npis in rows]
+
+def scope_npi_path(county):
+    # Matches the file written by scripts/get_clark_county_npis.py
+    return os.path.join(str(settings.DATA_DIR), "raw", f"{county.lower()}_county_npis.json")
+
+def saved_county_scope(conn, state, county):
+    """CountyScope from a saved NPI list (None if there is none to use)."""
+    path = scope_npi_path(county)
+    if os.path.exists(path):
+        with open(path) as f:
+            return CountyScope(state, county, {str(n) for n in json.load(f)})
+    if (state, county) == (settings.TARGET_STATE, settings.TARGET_COUNTY):
+        return CountyScope(state, county, {r[0] for r in conn.execute("SELECT npi FROM providers").fetchall()})
+    print(f"Warning: no NPI scope found for {county}, {state} at {path}; skipping.")
+    return None
+
+def load_county_scopes(conn):
+    """
+    Build a CountyScope per monitored county.
+
+    With a zip -> county crosswalk loaded, scopes are resolved from it against
+    the provider roster. Counties it cannot resolve (no crosswalk, or no
+    providers with practice zips yet) use their saved NPI list instead, and the
+    target county falls back to every provider in the database, which is how
+    single-county runs have always worked.
+    """
+    counties = monitored_counties(conn)
+    resolved = {}
+    if crosswalk_available(conn):
+        resolved = {(s.state, s.county): s for s in resolve_county_scopes(conn, counties) if s.npis}
+
+    scopes = []
+    for state, county in counties:
+        scope = resolved.get((state, county)) or saved_county_scope(conn, state, county)
+        if scope is not None:
+            scopes.append(scope)
+    return scopes
+
+def scope_map_frame(scopes):
+    """Flatten scopes into one npi -> (state, county) frame; an NPI may map to several scopes."""
+    rows = [(npi, s.state, s.county) for s in scopes for npi in s.npis]
+    return pd.DataFrame(rows, columns=["npi", "state", "county"]).drop_duplicates()
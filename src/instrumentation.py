@@ -0,0 +1,181 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+# Per-stage measurements for the pipeline run ledger. While a stage runs under
+# StageProfile.measure(), connect() hands out connections with DuckDB profiling
+# on: each statement's profile (the tree EXPLAIN ANALYZE prints, as JSON) is
+# collected once its result has been consumed, with its latency, CPU time and
+# rows read and written. Wall time, process CPU time and peak RSS are taken
+# around the whole stage. CPU and RSS are process-wide, so they include any
+# stage running alongside (use --workers 1 for clean attribution).
+
+_local = threading.local()
+
+# Operators whose input rows are rows written
+WRITE_OPERATORS = {"INSERT", "DELETE", "DELETE_OPERATOR", "UPDATE", "CREATE_TABLE_AS", "BATCH_CREATE_TABLE_AS"}
+RSS_SAMPLE_SECONDS = 0.05
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No procfs: lifetime peak (kilobytes on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def _operators(node):
+    for child in node.get("children", []):
+        yield child
+        yield from _operators(child)
+
+def _rows_written(info):
+    return sum(
+        child.get("operator_cardinality") or 0
+        for op in _operators(info) if op.get("operator_type") in WRITE_OPERATORS
+        for child in op.get("children", [])
+    )
+
+class StageProfile:
+    def __init__(self, stage):
+        self.stage = stage
+        self.started_at = None
+        self.finished_at = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.queries = []  # dicts: query, latency_seconds, cpu_seconds, rows_read, rows_written, profile
+
+    @property
+    def rows_read(self):
+        return sum(q["rows_read"] for q in self.queries)
+
+    @property
+    def rows_written(self):
+        return sum(q["rows_written"] for q in self.queries)
+
+    @property
+    def duckdb_cpu_seconds(self):
+        return sum(q["cpu_seconds"] for q in self.queries)
+
+    def add_query(self, query, elapsed, info):
+        if not info.get("children"):
+            # Transaction control and other statements without a plan
+            return
+        # Prepared (parameterized) statements only carry per-operator metrics
+        operators = list(_operators(info))
+        self.queries.append({
+            "query": " ".join(query.split()),
+            "latency_seconds": info.get("latency") or elapsed,
+            "cpu_seconds": info.get("cpu_time") or sum(op.get("operator_timing") or 0.0 for op in operators),
+            "rows_read": info.get("cumulative_rows_scanned") or sum(op.get("operator_rows_scanned") or 0 for op in operators),
+            "rows_written": _rows_written(info),
+            "profile": json.dumps(info),
+        })
+
+    @contextmanager
+    def measure(self):
+        """Measure the enclosed block; connect() calls inside it (on this thread) are profiled."""
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(RSS_SAMPLE_SECONDS):
+                self.peak_rss_bytes = max(self.peak_rss_bytes, _rss_bytes())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        self.started_at = time.time()
+        self.peak_rss_bytes = _rss_bytes()
+        started, cpu_started = time.perf_counter(), _cpu_seconds()
+        _local.profile = self
+        sampler.start()
+        try:
+            yield self
+        finally:
+            _local.profile = None
+            done.set()
+            sampler.join()
+            self.peak_rss_bytes = max(self.peak_rss_bytes, _rss_bytes())
+            self.wall_seconds = time.perf_counter() - started
+            self.cpu_seconds = _cpu_seconds() - cpu_started
+            self.finished_at = time.time()
+
+FETCH_METHODS = {
+    "fetchone", "fetchall", "fetchmany", "df", "fetchdf", "fetch_df", "fetchnumpy",
+    "arrow", "fetch_arrow_table", "pl", "to_arrow_reader",
+}
+RESULT_ATTRIBUTES = {"description", "rowcount"}
+
+class ProfiledConnection:
+    """A DuckDB connection that reports every statement's profile to a StageProfile."""
+
+    def __init__(self, conn, profile):
+        self._conn = conn
+        self._profile = profile
+        self._pending = None  # [query, started, last activity]
+        conn.execute("PRAGMA enable_profiling='no_output'")
+        # DataFrames referenced by name live in the caller's frame, not execute()'s
+        conn.execute("SET python_scan_all_frames = true")
+
+    def _finish(self):
+        # A statement's profile is complete once its result has been consumed,
+        # i.e. by the time the next statement runs or the connection closes
+        if self._pending is None:
+            return
+        query, started, ended = self._pending
+        self._pending = None
+        info = json.loads(self._conn.get_profiling_information(format="json"))
+        self._profile.add_query(query, ended - started, info)
+
+    def execute(self, query, parameters=None):
+        self._finish()
+        started = time.perf_counter()
+        self._conn.execute(query, parameters)
+        self._pending = [query, started, time.perf_counter()]
+        return self
+
+    def executemany(self, query, parameters=None):
+        self._finish()
+        started = time.perf_counter()
+        self._conn.executemany(query, parameters)
+        self._pending = [query, started, time.perf_counter()]
+        return self
+
+    def close(self):
+        self._finish()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        if name not in FETCH_METHODS and name not in RESULT_ATTRIBUTES:
+            # Anything else (register, create_function...) may run statements of its own
+            self._finish()
+        attr = getattr(self._conn, name)
+        if name not in FETCH_METHODS:
+            return attr
+
+        def fetch(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if self._pending is not None:
+                self._pending[2] = time.perf_counter()
+            return result
+        return fetch
+
+def connect(database, **kwargs):
+    """duckdb.connect, profiled when called inside StageProfile.measure()."""
+    conn = duckdb.connect(database, **kwargs)
+    profile = getattr(_local, "profile", None)
+    return conn if profile is None else ProfiledConnection(conn, profile)
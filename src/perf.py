@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import duckdb
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.api.cache import publish_generation
+from src.api.main import app
+from src.pipeline import FlagRun, build_dag, init_db
+from src.synthetic import generate_synthetic_data
+
+# Performance benchmarks on synthetic data. A benchmark generates a fresh
+# database at a given scale, runs the analysis stages through the DAG on one
+# worker (so the run ledger attributes CPU and memory to each stage), then
+# times the API's requests with the response cache off. Results are compared
+# against the baseline stored for that scale on this machine, and slowdowns
+# beyond PERF_TOLERANCE fail the run.
+#
+#   python -m src.perf --scale county --save-baseline
+#   python -m src.perf --scale county          # exit status 1 on regressions
+
+SCALES = {
+    "tiny": {"providers": 1_000, "months": 36},
+    "county": {"providers": 10_000, "months": 48},
+    "state": {"providers": 100_000, "months": 72},
+    "national": {"providers": 1_000_000, "months": 96},
+}
+
+# Everything downstream of ingestion, which needs the remote sources
+ANALYSIS_STAGES = ["benchmarks", "features", "rules", "leie_matching", "ml", "publish"]
+STAGE_METRICS = ["wall_seconds", "cpu_seconds", "peak_rss_mb", "rows_read", "rows_written"]
+
+# {npi} is the first provider of the dashboard
+API_REQUESTS = {
+    "summary": "/api/summary",
+    "flagged_page": "/api/flagged-providers?limit=100",
+    "flagged_by_type": "/api/flagged-providers?limit=100&flag_type=VOLUME_OUTLIER",
+    "flagged_facets": "/api/flagged-providers/facets",
+    "provider_detail": "/api/provider/{npi}",
+    "search": "/api/search?q=smith",
+    "changes": "/api/changes",
+    "export_provider_spend": "/api/export/medicaid_spend?format=parquet&npi={npi}",
+}
+
+@contextmanager
+def _benchmark_settings(workdir):
+    """Point the pipeline and API at `workdir` and turn the response cache off."""
+    overrides = {
+        "DB_PATH": os.path.join(workdir, "perf.db"),
+        "ML_MODEL_DIR": os.path.join(workdir, "models"),
+        "API_CACHE_MAX_ENTRIES": 0,
+    }
+    saved = {k: getattr(settings, k) for k in overrides}
+    for k, v in overrides.items():
+        setattr(settings, k, v)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            setattr(settings, k, v)
+
+def _stage_metrics(run_id):
+    conn = duckdb.connect(settings.DB_PATH, read_only=True)
+    rows = conn.execute(f"""
+        SELECT stage, {', '.join(STAGE_METRICS)} FROM pipeline_run_stages WHERE run_id = ? ORDER BY started_at
+    """, [run_id]).fetchall()
+    conn.close()
+    return {row[0]: dict(zip(STAGE_METRICS, row[1:])) for row in rows}
+
+def time_api_requests(repeat):
+    """Median and worst latency of each API_REQUESTS entry over `repeat` requests, after one warm-up."""
+    timings = {}
+    with TestClient(app) as client:
+        page = client.get("/api/flagged-providers?limit=1").json()
+        npi = page[0]["npi"] if page else "0"
+        for name, path in API_REQUESTS.items():
+            url = path.format(npi=npi)
+            samples = []
+            for _ in range(repeat + 1):
+                started = time.perf_counter()
+                response = client.get(url)
+                samples.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"GET {url} answered {response.status_code}: {response.text[:200]}")
+            samples = samples[1:]
+            timings[name] = {"median_seconds": statistics.median(samples), "max_seconds": max(samples)}
+    return timings
+
+def run_benchmark(scale="tiny", params=None, repeat=5, seed=0, workdir=None):
+    """
+    Generate a synthetic database (SCALES[scale], updated with `params`), run
+    the analysis stages and time the API. Returns the results as a dict.
+    """
+    params = {**SCALES.get(scale, {}), **(params or {})}
+    with tempfile.TemporaryDirectory(prefix="perf-") as tmp, _benchmark_settings(workdir or tmp):
+        os.makedirs(os.path.dirname(settings.DB_PATH), exist_ok=True)
+        if os.path.exists(settings.DB_PATH):
+            os.remove(settings.DB_PATH)
+        init_db()
+        started = time.perf_counter()
+        counts = generate_synthetic_data(seed=seed, **params)
+        generate_seconds = time.perf_counter() - started
+
+        dag = build_dag(FlagRun())
+        dag.run(only=ANALYSIS_STAGES, force=True, max_workers=1)
+        conn = duckdb.connect(settings.DB_PATH, read_only=True)
+        run_id = conn.execute("SELECT MAX(run_id) FROM pipeline_runs").fetchone()[0]
+        conn.close()
+        # The API serves the published snapshot
+        publish_generation()
+
+        results = {
+            "scale": scale,
+            "params": dict(params, seed=seed),
+            "rows": counts,
+            "generate_seconds": generate_seconds,
+            "stages": _stage_metrics(run_id),
+            "api": time_api_requests(repeat),
+            "database_mb": os.path.getsize(settings.DB_PATH) / 2**20,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+    return results
+
+def load_baselines(path=None):
+    path = path or settings.PERF_BASELINE_PATH
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(results, path=None):
+    path = path or settings.PERF_BASELINE_PATH
+    baselines = load_baselines(path)
+    baselines[results["scale"]] = results
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def _compared_metrics(results):
+    """(metric name, value, noise floor) for every metric that can regress."""
+    for stage, metrics in results["stages"].items():
+        yield f"stage {stage} wall_seconds", metrics["wall_seconds"], settings.PERF_MIN_REGRESSION_SECONDS
+        yield f"stage {stage} peak_rss_mb", metrics["peak_rss_mb"], settings.PERF_MIN_REGRESSION_MB
+    for name, timing in results["api"].items():
+        yield f"api {name} median_seconds", timing["median_seconds"], settings.PERF_MIN_REGRESSION_SECONDS
+
+def find_regressions(baseline, results, tolerance=None):
+    """
+    Metrics of `results` worse than `baseline` by more than `tolerance`
+    (a fraction, default PERF_TOLERANCE) and by more than the metric's noise
+    floor. Returns a list of (metric, baseline value, new value).
+    """
+    tolerance = settings.PERF_TOLERANCE if tolerance is None else tolerance
+    if baseline["params"] != results["params"]:
+        raise ValueError(f"Baseline was recorded with {baseline['params']}, this run used {results['params']}")
+    before = {name: value for name, value, _ in _compared_metrics(baseline)}
+    return [
+        (name, before[name], value)
+        for name, value, floor in _compared_metrics(results)
+        if name in before and value > before[name] * (1 + tolerance) and value - before[name] > floor
+    ]
+
+def print_report(results, baseline=None):
+    def change(new, old):
+        return f"{100 * (new - old) / old:+.0f}%" if old else ""
+
+    print(f"\nScale {results['scale']}: " + ", ".join(f"{n} {t}" for t, n in results["rows"].items()))
+    print(f"Generated in {results['generate_seconds']:.1f}s, database {results['database_mb']:.0f} MB\n")
+    old_stages = (baseline or {}).get("stages", {})
+    print(f"  {'stage':<14} {'wall s':>8} {'cpu s':>8} {'rss MB':>8} {'rows read':>12} {'rows written':>12} {'vs baseline':>11}")
+    for stage, m in results["stages"].items():
+        old = old_stages.get(stage)
+        print(f"  {stage:<14} {m['wall_seconds']:>8.2f} {m['cpu_seconds']:>8.2f} {m['peak_rss_mb']:>8.0f} "
+              f"{m['rows_read']:>12} {m['rows_written']:>12} {change(m['wall_seconds'], old['wall_seconds']) if old else '':>11}")
+    old_api = (baseline or {}).get("api", {})
+    print(f"\n  {'request':<22} {'median ms':>10} {'max ms':>10} {'vs baseline':>11}")
+    for name, t in results["api"].items():
+        old = old_api.get(name)
+        print(f"  {name:<22} {1000 * t['median_seconds']:>10.1f} {1000 * t['max_seconds']:>10.1f} "
+              f"{change(t['median_seconds'], old['median_seconds']) if old else '':>11}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis stages and API on synthetic data.")
+    parser.add_argument("--scale", default="tiny", help=f"named scale ({', '.join(SCALES)}) or a label for --providers/--months")
+    parser.add_argument("--providers", type=int)
+    parser.add_argument("--months", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="timed requests per API endpoint")
+    parser.add_argument("--tolerance", type=float, help="allowed slowdown as a fraction (default PERF_TOLERANCE)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the scale's baseline")
+    parser.add_argument("--baselines", help="baseline file (default PERF_BASELINE_PATH)")
+    parser.add_argument("--workdir", help="keep the generated database here instead of a temporary directory")
+    args = parser.parse_args(argv)
+
+    params = {k: v for k, v in {"providers": args.providers, "months": args.months}.items() if v is not None}
+    if args.scale not in SCALES and set(params) != {"providers", "months"}:
+        parser.error(f"unknown scale {args.scale!r}: use one of {', '.join(SCALES)} or give --providers and --months")
+
+    results = run_benchmark(args.scale, params, args.repeat, args.seed, args.workdir)
+    baseline = load_baselines(args.baselines).get(args.scale)
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        save_baseline(results, args.baselines)
+        print(f"\nSaved as the {args.scale} baseline.")
+        return 0
+    if baseline is None:
+        print(f"\nNo {args.scale} baseline yet, record one with --save-baseline.")
+        return 0
+    regressions = find_regressions(baseline, results, args.tolerance)
+    if not regressions:
+        print(f"\nNo regressions against the baseline from {baseline['recorded_at']}.")
+        return 0
+    print(f"\n{len(regressions)} regressions against the baseline from {baseline['recorded_at']}:")
+    for name, old, new in regressions:
+        print(f"  {name}: {old:.3f} -> {new:.3f}")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,22 @@
+import argparse
 import os
+import threading
+
 import duckdb
 from src.config import settings
 from scripts.get_clark_county_npis import main as fetch_npis
 from scripts.filter_hhs_data import filter_hhs_spend
-from src.ingestion.ingest_leie import main as ingest_leie
+from src.ingestion.crosswalk import load_crosswalk_if_present
+from src.ingestion.ingest_leie import main as ingest_leie, upgrade_leie_table
 from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.features import ensure_feature_table, refresh_provider_features
 from src.analysis.rules import screen_providers
 from src.analysis.models import run_ml_analysis
+from src.analysis.leie_matching import match_leie_exclusions
+from src.analysis.flag_runs import publish_flag_run, start_flag_run
+from src.api.cache import publish_generation
+from src.dag import Dag, Stage
+from src.instrumentation import connect
 
 def init_db():
     print(f"Initializing database at {settings.DB_PATH}...")
@@ -18,39 +28,96 @@ def init_db():
     with open(schema_path, 'r') as f:
         schema_sql = f.read()
     
+    upgrade_leie_table(conn)
+
     # Split by semicolon and execute
     for statement in schema_sql.split(';'):
         if statement.strip():
             conn.execute(statement)
+
+    # Catalog-driven tables
+    ensure_feature_table(conn)
             
     conn.close()
 
-def main():
+# Settings read by the rule-based screens
+RULE_SETTINGS = [
+    "Z_SCORE_THRESHOLD", "ROBUST_Z_THRESHOLD", "MIN_PEER_COUNT", "SUDDEN_UTILIZATION_LIMIT",
+    "EXTREME_CONCENTRATION_THRESHOLD", "MIN_CONCENTRATION_SPEND", "VOLUME_OUTLIER_MULTIPLIER", "MIN_VOLUME_CLAIMS",
+]
+ROSTER_COLUMNS = "providers:npi,name,org_type,city,state,postal_code,practice_address,auth_official_name,mailing_zip,mailing_city,mailing_state,mailing_address"
+
+class FlagRun:
+    """The flag run shared by the screening stages, opened by the first one that runs."""
+
+    def __init__(self):
+        self.run_id = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        with self._lock:
+            if self.run_id is None:
+                with connect(settings.DB_PATH) as conn:
+                    self.run_id = start_flag_run(conn)
+        return self.run_id
+
+    def publish(self):
+        if self.run_id is None:
+            print("No screening stage ran, the published flags are current.")
+            return
+        with connect(settings.DB_PATH) as conn:
+            publish_flag_run(conn, self.run_id)
+
+def build_dag(flag_run, hhs_months=None):
+    # Rules, LEIE matching and ML write into one flag run, published together.
+    # Publishing carries forward the flag types of screens that were skipped.
+    # `hhs_months` limits HHS ingestion to those months.
+    return Dag([
+        Stage("crosswalk", load_crosswalk_if_present, files=["ZIP_COUNTY_CROSSWALK_PATH"]),
+        Stage("hhs_spend", lambda: filter_hhs_spend(months=hhs_months), deps=["crosswalk"], volatile=True),
+        Stage("leie", ingest_leie, volatile=True),
+        Stage("benchmarks", calculate_benchmarks, deps=["hhs_spend"],
+              tables=["medicaid_spend", "providers:npi,taxonomy_desc"]),
+        Stage("features", refresh_provider_features, deps=["benchmarks"],
+              tables=["medicaid_spend", "benchmark_stats", "providers:npi,taxonomy_desc"]),
+        Stage("rules", lambda: screen_providers(flag_run.open()), deps=["features"],
+              tables=["medicaid_spend", "benchmark_stats", "benchmark_sketches", "provider_features", "providers:npi,name,taxonomy_desc"],
+              settings=RULE_SETTINGS),
+        Stage("leie_matching", lambda: match_leie_exclusions(flag_run.open()), deps=["leie"],
+              tables=["leie_exclusions", ROSTER_COLUMNS],
+              settings=["LEIE_MATCH_MIN_SCORE", "LEIE_MATCH_FLAG_SCORE"]),
+        Stage("ml", lambda: run_ml_analysis(run_id=flag_run.open()), deps=["features"],
+              tables=["provider_features"], settings=["ML_MODE", "ML_CONTAMINATION", "ML_RETRAIN_DRIFT", "ML_MAX_MODEL_AGE_DAYS"]),
+        Stage("publish", flag_run.publish, deps=["rules", "leie_matching", "ml"], volatile=True),
+    ])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Medicaid Watch pipeline, skipping stages whose inputs are unchanged.")
+    targets = parser.add_mutually_exclusive_group()
+    targets.add_argument("--from", dest="start", metavar="STAGE", help="run this stage and everything downstream of it")
+    targets.add_argument("--only", nargs="+", metavar="STAGE", help="run exactly these stages")
+    parser.add_argument("--force", action="store_true", help="run the selected stages even if their inputs are unchanged")
+    parser.add_argument("--workers", type=int, help="stages run concurrently (default PIPELINE_MAX_WORKERS)")
+    parser.add_argument("--months", nargs="+", metavar="YYYY-MM", help="only ingest these HHS months")
+    args = parser.parse_args(argv)
+
     print("--- STARTING MEDICAID WATCH PIPELINE (THEME 1: PORTABLE) ---")
-    
-    # 0. Setup
     init_db()
-    
-    # 1. Fetch NPIs (Scope)
-    print("\n[Phase 1] Fetching NPI Scope...")
     # fetch_npis() # Optional if already have data/raw/clark_county_npis.json
-    
-    # 2. Ingest HHS Data (Streaming Filter)
-    print("\n[Phase 2] Ingesting HHS Spend Data...")
-    filter_hhs_spend()
-    
-    # 3. Ingest LEIE Exclusions
-    print("\n[Phase 3] Ingesting LEIE Exclusion List...")
-    ingest_leie()
-    
-    # 4. Analytics
-    print("\n[Phase 4] Running Analytics...")
-    calculate_benchmarks()
-    screen_providers()
-    run_ml_analysis()
-    
+
+    flag_run = FlagRun()
+    dag = build_dag(flag_run, args.months)
+    status = dag.run(only=args.only, start=args.start, force=args.force, max_workers=args.workers)
+    if flag_run.run_id is not None and status["publish"] == "not selected":
+        # A screen ran under --only without publish: don't leave its run half-built
+        flag_run.publish()
+
+    generation = publish_generation()
     print("\n--- PIPELINE EXECUTION COMPLETE ---")
-    print(f"Database ready for API at: {settings.DB_PATH}")
+    for stage in dag.order:
+        print(f"  {stage:<14} {status[stage]}")
+    print(f"Database ready for API at: {settings.DB_PATH} (generation {generation})")
+    return status
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,151 @@
+import argparse
+import json
+from datetime import datetime
+
+import duckdb
+import pandas as pd
+
+from src.config import settings
+
+# Write and read side of the pipeline run ledger (pipeline_runs,
+# pipeline_run_stages, pipeline_query_profiles). The DAG runner records every
+# run; `python -m src.run_ledger compare` lines two runs up stage by stage.
+
+def start_pipeline_run(conn, args):
+    run_id = conn.execute("SELECT COALESCE(MAX(run_id), 0) + 1 FROM pipeline_runs").fetchone()[0]
+    conn.execute("""
+        INSERT INTO pipeline_runs (run_id, status, args, started_at) VALUES (?, 'running', ?, now())
+    """, [run_id, json.dumps(args, sort_keys=True)])
+    return run_id
+
+def finish_pipeline_run(conn, run_id, status):
+    conn.execute("""
+        UPDATE pipeline_runs
+        SET status = ?, finished_at = now(), wall_seconds = epoch(now() - started_at)
+        WHERE run_id = ?
+    """, [status, run_id])
+
+def record_stage(conn, run_id, status, profile):
+    """Store a stage's StageProfile and its query profiles under `run_id`."""
+    conn.execute("""
+        INSERT OR REPLACE INTO pipeline_run_stages
+            (run_id, stage, status, started_at, finished_at, wall_seconds, cpu_seconds, duckdb_cpu_seconds,
+             peak_rss_mb, rows_read, rows_written, queries)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        run_id, profile.stage, status,
+        datetime.fromtimestamp(profile.started_at), datetime.fromtimestamp(profile.finished_at),
+        profile.wall_seconds, profile.cpu_seconds, profile.duckdb_cpu_seconds,
+        profile.peak_rss_bytes / 2**20, profile.rows_read, profile.rows_written, len(profile.queries),
+    ])
+    if profile.queries:
+        conn.executemany("""
+            INSERT INTO pipeline_query_profiles
+                (run_id, stage, seq, query, latency_seconds, cpu_seconds, rows_read, rows_written, profile)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            [run_id, profile.stage, seq, q["query"], q["latency_seconds"], q["cpu_seconds"], q["rows_read"], q["rows_written"], q["profile"]]
+            for seq, q in enumerate(profile.queries, 1)
+        ])
+
+def compare_stages(conn, base, other):
+    """Stage metrics of two runs side by side, with wall time change in percent."""
+    return conn.execute("""
+        SELECT
+            COALESCE(b.stage, o.stage) AS stage,
+            b.status AS status_a, o.status AS status_b,
+            round(b.wall_seconds, 2) AS wall_a, round(o.wall_seconds, 2) AS wall_b,
+            round(100 * (o.wall_seconds - b.wall_seconds) / NULLIF(b.wall_seconds, 0), 1) AS wall_change_pct,
+            round(b.cpu_seconds, 2) AS cpu_a, round(o.cpu_seconds, 2) AS cpu_b,
+            round(b.peak_rss_mb) AS rss_mb_a, round(o.peak_rss_mb) AS rss_mb_b,
+            b.rows_read AS rows_read_a, o.rows_read AS rows_read_b,
+            b.rows_written AS rows_written_a, o.rows_written AS rows_written_b
+        FROM (SELECT * FROM pipeline_run_stages WHERE run_id = $base) b
+        FULL OUTER JOIN (SELECT * FROM pipeline_run_stages WHERE run_id = $other) o ON b.stage = o.stage
+        ORDER BY COALESCE(b.started_at, o.started_at), 1
+    """, {"base": base, "other": other}).df()
+
+def compare_queries(conn, base, other, top=10):
+    """Statements whose total latency changed most between two runs, matched by stage and text."""
+    return conn.execute("""
+        WITH totals AS (
+            SELECT run_id, stage, query, COUNT(*) AS executions, SUM(latency_seconds) AS latency, SUM(rows_read) AS rows_read
+            FROM pipeline_query_profiles WHERE run_id IN ($base, $other)
+            GROUP BY ALL
+        ),
+        b AS (SELECT * FROM totals WHERE run_id = $base),
+        o AS (SELECT * FROM totals WHERE run_id = $other)
+        SELECT
+            COALESCE(b.stage, o.stage) AS stage,
+            round(b.latency, 3) AS latency_a, round(o.latency, 3) AS latency_b,
+            round(COALESCE(o.latency, 0) - COALESCE(b.latency, 0), 3) AS latency_change,
+            b.rows_read AS rows_read_a, o.rows_read AS rows_read_b,
+            LEFT(COALESCE(b.query, o.query), 100) AS query
+        FROM b FULL OUTER JOIN o ON b.stage = o.stage AND b.query = o.query
+        ORDER BY abs(COALESCE(o.latency, 0) - COALESCE(b.latency, 0)) DESC
+        LIMIT $top
+    """, {"base": base, "other": other, "top": top}).df()
+
+def slowest_queries(conn, run_id, stage=None, top=10):
+    stage_filter = "AND stage = $stage" if stage else ""
+    params = {"run_id": run_id, "top": top, **({"stage": stage} if stage else {})}
+    return conn.execute(f"""
+        SELECT stage, seq, round(latency_seconds, 3) AS latency, round(cpu_seconds, 3) AS cpu,
+               rows_read, rows_written, LEFT(query, 100) AS query
+        FROM pipeline_query_profiles
+        WHERE run_id = $run_id {stage_filter}
+        ORDER BY latency_seconds DESC
+        LIMIT $top
+    """, params).df()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and compare pipeline runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="recent pipeline runs")
+    compare = commands.add_parser("compare", help="two runs stage by stage (default: the last two)")
+    compare.add_argument("runs", nargs="*", type=int, metavar="RUN_ID")
+    compare.add_argument("--top", type=int, default=10, help="statements listed by latency change")
+    queries = commands.add_parser("queries", help="slowest statements of a run")
+    queries.add_argument("run", type=int, metavar="RUN_ID")
+    queries.add_argument("--stage")
+    queries.add_argument("--top", type=int, default=10)
+    queries.add_argument("--profile", type=int, metavar="SEQ", help="print the full profile of this statement (with --stage)")
+    args = parser.parse_args(argv)
+
+    pd.set_option("display.width", 250)
+    pd.set_option("display.max_columns", None)
+    pd.set_option("display.max_colwidth", 100)
+    conn = duckdb.connect(settings.DB_PATH, read_only=True)
+
+    if args.command == "list":
+        print(conn.execute("""
+            SELECT run_id, status, started_at, round(wall_seconds, 1) AS wall_seconds, args
+            FROM pipeline_runs ORDER BY run_id DESC LIMIT 20
+        """).df().to_string(index=False))
+    elif args.command == "compare":
+        if len(args.runs) not in (0, 2):
+            parser.error("compare takes two run ids, or none for the last two runs")
+        if args.runs:
+            base, other = args.runs
+        else:
+            ids = [r[0] for r in conn.execute("SELECT run_id FROM pipeline_runs ORDER BY run_id DESC LIMIT 2").fetchall()]
+            if len(ids) < 2:
+                parser.error("fewer than two recorded pipeline runs")
+            other, base = ids
+        print(f"Run {base} (a) vs run {other} (b)\n")
+        print(compare_stages(conn, base, other).to_string(index=False))
+        print("\nStatements with the largest latency change (seconds):\n")
+        print(compare_queries(conn, base, other, args.top).to_string(index=False))
+    elif args.profile is not None:
+        if not args.stage:
+            parser.error("--profile needs --stage")
+        row = conn.execute("""
+            SELECT profile FROM pipeline_query_profiles WHERE run_id = ? AND stage = ? AND seq = ?
+        """, [args.run, args.stage, args.profile]).fetchone()
+        print(json.dumps(json.loads(row[0]), indent=2) if row else "No such statement.")
+    else:
+        print(slowest_queries(conn, args.run, args.stage, args.top).to_string(index=False))
+    conn.close()
+
+if __name__ == "__main__":
+    main()
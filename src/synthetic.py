@@ -0,0 +1,376 @@
+import argparse
+import math
+import os
+
+from src.config import settings
+from src.instrumentation import connect
+from src.ingestion.ingest_leie import LEIE_KEY_SQL
+from src.pipeline import init_db
+
+# Deterministic synthetic providers, spend and LEIE exclusions for end-to-end
+# tests and performance benchmarks. Everything is generated inside DuckDB from
+# hashes of (seed, row, purpose), so a given seed and size always produce the
+# same database (for a given DuckDB version) without shipping any data.
+#
+# The shape follows the real tables: specialties of very different sizes, each
+# with its own HCPCS menu where a staple code dominates and the rest fall off
+# log-uniformly, lognormal provider volumes, late entrants, and a national LEIE
+# that mostly lists people elsewhere. A small share of providers is given one
+# injected anomaly, recorded in synthetic_anomalies with the flag it should raise.
+
+# (taxonomy, share of providers, share that are organizations, organization name noun, HCPCS menu by popularity)
+TAXONOMIES = [
+    ("Family Medicine", 0.20, 0.15, "FAMILY MEDICINE", ["99213", "99214", "99212", "99215", "99391", "96372", "81002"]),
+    ("Counselor", 0.14, 0.20, "COUNSELING", ["90837", "90834", "H0031", "H2015", "90791", "H2019"]),
+    ("Home Health", 0.12, 0.70, "HOME CARE", ["T1019", "S5125", "T1020", "G0151", "G0299", "T2025"]),
+    ("Clinic/Center", 0.10, 0.90, "HEALTH CENTER", ["99213", "99214", "T1015", "H2015", "90837", "99204"]),
+    ("Pediatrics", 0.09, 0.20, "PEDIATRICS", ["99213", "99214", "99392", "99393", "90460", "96110"]),
+    ("Dentist", 0.08, 0.30, "DENTAL", ["D0120", "D1120", "D1206", "D0274", "D2391"]),
+    ("Physical Therapist", 0.07, 0.30, "PHYSICAL THERAPY", ["97110", "97140", "97530", "97161", "97112"]),
+    ("Speech-Language Pathologist", 0.04, 0.20, "SPEECH THERAPY", ["92507", "92523", "92526"]),
+    ("Clinical Medical Laboratory", 0.04, 1.00, "LABORATORY", ["80053", "85025", "87491", "36415"]),
+    ("Pharmacy", 0.04, 1.00, "PHARMACY", ["J1885", "J0696", "J3420"]),
+    ("Ambulance", 0.04, 1.00, "AMBULANCE", ["A0427", "A0425", "A0429"]),
+    ("Non-emergency Medical Transport (NEMT)", 0.04, 1.00, "TRANSPORT", ["A0130", "A0100", "T2003"]),
+]
+
+# HCPCS code: (typical paid per claim, typical claims per provider-month)
+HCPCS_CODES = {
+    "99213": (75, 30), "99214": (110, 20), "99212": (50, 15), "99215": (150, 8), "99391": (120, 5),
+    "96372": (25, 8), "81002": (6, 10), "99204": (165, 6), "99392": (125, 6), "99393": (125, 5),
+    "90460": (22, 12), "96110": (12, 8), "90837": (140, 12), "90834": (105, 10), "H0031": (95, 6),
+    "H2015": (22, 60), "90791": (160, 4), "H2019": (30, 40), "T1015": (210, 25), "T1019": (18, 120),
+    "S5125": (17, 80), "T1020": (45, 15), "G0151": (95, 4), "G0299": (60, 8), "T2025": (40, 25),
+    "D0120": (30, 25), "D1120": (32, 20), "D1206": (25, 20), "D0274": (40, 10), "D2391": (95, 8),
+    "97110": (32, 20), "97140": (28, 15), "97530": (35, 12), "97161": (90, 3), "97112": (33, 8),
+    "92507": (70, 10), "92523": (150, 2), "92526": (80, 4), "80053": (11, 40), "85025": (8, 50),
+    "87491": (35, 15), "36415": (3, 60), "J1885": (5, 4), "J0696": (8, 3), "J3420": (4, 3),
+    "A0427": (400, 6), "A0425": (9, 90), "A0429": (330, 5), "A0130": (35, 30), "A0100": (30, 20),
+    "T2003": (25, 25),
+}
+
+# Injected anomaly -> flag it should raise. The first four reshape the
+# provider's staple code, the last two list the provider on the LEIE.
+ANOMALIES = {
+    "price": "PRICE_Z_SCORE_OUTLIER",
+    "volume": "VOLUME_OUTLIER",
+    "claim_mill": "CLAIM_MILL_RATIO",
+    "new_entrant": "SUDDEN_UTILIZATION",
+    "excluded_npi": "LEIE_MATCH",
+    "excluded_name": "LEIE_MATCH",
+}
+
+FIRST_NAMES = [
+    "JAMES", "MARY", "ROBERT", "PATRICIA", "JOHN", "JENNIFER", "MICHAEL", "LINDA", "DAVID", "ELIZABETH",
+    "WILLIAM", "BARBARA", "RICHARD", "SUSAN", "JOSEPH", "JESSICA", "THOMAS", "SARAH", "CHRISTOPHER", "KAREN",
+    "DANIEL", "LISA", "MATTHEW", "NANCY", "ANTHONY", "BETTY", "MARK", "SANDRA", "STEVEN", "ASHLEY",
+    "ANDREW", "KIMBERLY", "JOSHUA", "EMILY", "KEVIN", "DONNA", "BRIAN", "MICHELLE", "OLEG", "NATALIYA",
+    "VIKTOR", "SVETLANA", "MINH", "LAN", "JOSE", "MARIA", "LUIS", "ANA", "WEI", "MEI",
+]
+# Surnames are a stem plus an ending, about 2,000 combinations
+SURNAME_STEMS = [
+    "AND", "BAKER", "BELL", "BROWN", "CARL", "CLARK", "COOK", "DAV", "EDWARD", "ELLI", "FISH", "GARD",
+    "GRAY", "HALL", "HARRI", "HILL", "HOLM", "JACK", "JOHN", "KING", "KOVAL", "LARS", "LEE", "LIND",
+    "MART", "MILL", "MOORE", "NELS", "NGUY", "OLS", "PARK", "PETER", "PRICE", "REED", "RICH", "ROB",
+    "ROSS", "SAND", "SHEV", "SMITH", "STEW", "SVENS", "TAYL", "THOM", "TRAN", "TURN", "WALK", "WARD",
+    "WATS", "WEST", "WHITE", "WILL", "WOOD", "YOUNG", "ZAK", "BOND", "FROST", "LOPEZ", "GARC", "HERN",
+]
+SURNAME_ENDINGS = [
+    "", "SON", "SEN", "MAN", "ER", "ERS", "TON", "LEY", "S", "EN", "BERG", "FIELD", "WOOD", "STROM",
+    "ENKO", "OV", "OVA", "EZ", "INS", "ETT", "ELL", "ING", "ISON", "HAM", "FORD", "WELL", "LAND", "DALE",
+    "STEIN", "ICK", "KOV", "ENSON",
+]
+ORG_WORDS = [
+    "CASCADE", "COLUMBIA", "EVERGREEN", "SUMMIT", "RIVERVIEW", "PACIFIC", "NORTHWEST", "HARMONY", "BRIDGE",
+    "CEDAR", "MERIDIAN", "PIONEER", "HORIZON", "ALDER", "LIBERTY", "FAMILY", "UNITED", "PREMIER", "VALLEY",
+    "HEARTLAND", "CORNERSTONE", "NEW HOPE", "BRIGHT PATH", "TRUE NORTH", "GOLDEN", "SILVER LAKE", "ORCHARD",
+]
+ORG_SUFFIXES = ["LLC", "INC", "PLLC", "PS", "CORP"]
+STREETS = [
+    "MAIN ST", "MILL PLAIN BLVD", "FOURTH PLAIN BLVD", "NE 112TH AVE", "SE 164TH AVE", "NE HIGHWAY 99",
+    "E EVERGREEN BLVD", "NE ANDRESEN RD", "SE MILL PLAIN BLVD", "NE 78TH ST", "BROADWAY", "NE 134TH ST",
+]
+# "CITY|ZIP" practice locations inside the target county
+ROSTER_LOCATIONS = [
+    "VANCOUVER|98660", "VANCOUVER|98661", "VANCOUVER|98662", "VANCOUVER|98663", "VANCOUVER|98664",
+    "VANCOUVER|98665", "VANCOUVER|98682", "VANCOUVER|98683", "VANCOUVER|98684", "VANCOUVER|98686",
+    "CAMAS|98607", "BATTLE GROUND|98604", "RIDGEFIELD|98642", "WASHOUGAL|98671", "LA CENTER|98629",
+]
+# "CITY|STATE|ZIP" for LEIE entries listed elsewhere (Washington ones outside the county)
+LEIE_LOCATIONS = [
+    "SEATTLE|WA|98101", "SPOKANE|WA|99201", "TACOMA|WA|98402", "OLYMPIA|WA|98501", "PORTLAND|OR|97205",
+    "SALEM|OR|97301", "BOISE|ID|83702", "LOS ANGELES|CA|90012", "SACRAMENTO|CA|95814", "PHOENIX|AZ|85004",
+    "HOUSTON|TX|77002", "DALLAS|TX|75201", "MIAMI|FL|33101", "ORLANDO|FL|32801", "NEW YORK|NY|10001",
+    "BROOKLYN|NY|11201", "CHICAGO|IL|60601", "DETROIT|MI|48201", "ATLANTA|GA|30303", "NEWARK|NJ|07102",
+]
+LEIE_EXCLUSION_TYPES = ["1128a1", "1128a2", "1128a3", "1128a4", "1128b4", "1128b5", "1128b7", "1128b8"]
+
+SPEND_BATCH_PROVIDERS = 50_000  # providers whose spend is inserted per statement
+
+def _register_macros(conn, seed):
+    # synth_u: uniform [0, 1) from the seed, a row id, a purpose tag and a sub-index
+    conn.execute(f"CREATE OR REPLACE TEMP MACRO synth_u(i, tag, k) AS (hash({int(seed)}, i, tag, k) % 1000003) / 1000003.0")
+    # Irwin-Hall approximation of a standard normal
+    conn.execute("""
+        CREATE OR REPLACE TEMP MACRO synth_normal(i, tag, k) AS
+        (synth_u(i, tag, k) + synth_u(i, tag + 1, k) + synth_u(i, tag + 2, k) + synth_u(i, tag + 3, k) - 2) * sqrt(3)
+    """)
+    conn.execute("CREATE OR REPLACE TEMP MACRO synth_pick(items, u) AS items[1 + floor(u * len(items))::INTEGER]")
+    conn.execute("CREATE OR REPLACE TEMP MACRO synth_date(lo, days, u) AS strftime(lo::DATE + floor(u * days)::INTEGER, '%Y%m%d')")
+
+def _stage_reference_tables(conn):
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE synth_taxonomies (
+            taxonomy_idx INTEGER, taxonomy_desc VARCHAR, cum_lo DOUBLE, cum_hi DOUBLE,
+            org_share DOUBLE, org_noun VARCHAR, menu_size INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE synth_menu (
+            taxonomy_idx INTEGER, code_rank INTEGER, hcpcs_code VARCHAR, price DOUBLE, claims DOUBLE
+        )
+    """)
+    total = sum(t[1] for t in TAXONOMIES)
+    taxonomies, menu, cum = [], [], 0.0
+    for idx, (desc, share, org_share, noun, codes) in enumerate(TAXONOMIES):
+        taxonomies.append([idx, desc, cum / total, (cum + share) / total, org_share, noun, len(codes)])
+        cum += share
+        menu += [[idx, rank, code, *HCPCS_CODES[code]] for rank, code in enumerate(codes)]
+    taxonomies[-1][3] = 1.0
+    conn.executemany("INSERT INTO synth_taxonomies VALUES (?, ?, ?, ?, ?, ?, ?)", taxonomies)
+    conn.executemany("INSERT INTO synth_menu VALUES (?, ?, ?, ?, ?)", menu)
+
+def _stage_roster(conn, providers, months, codes_per_provider, anomaly_rate):
+    """TEMP synth_roster: one row per provider with its identity, volume profile and anomaly, if any."""
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE synth_roster AS
+        WITH typed AS (
+            SELECT
+                r.i, t.taxonomy_idx, t.taxonomy_desc, t.menu_size, t.org_noun,
+                CASE WHEN synth_u(r.i, 2, 0) < t.org_share THEN 'NPI-2' ELSE 'NPI-1' END AS org_type,
+                CASE WHEN synth_u(r.i, 90, 0) < $anomaly_rate THEN synth_pick($anomalies, synth_u(r.i, 91, 0)) END AS anomaly
+            FROM range($providers) r(i)
+            JOIN synth_taxonomies t ON synth_u(r.i, 1, 0) >= t.cum_lo AND synth_u(r.i, 1, 0) < t.cum_hi
+        )
+        SELECT
+            *,
+            CAST(CASE org_type WHEN 'NPI-2' THEN 2000000000 ELSE 1000000000 END + i AS VARCHAR) AS npi,
+            exp(0.8 * synth_normal(i, 3, 0)) AS volume_scale,
+            0.9 + 0.2 * synth_u(i, 7, 0) AS price_factor,
+            -- Most providers bill from the first month, 15% enter later
+            CASE
+                WHEN anomaly = 'new_entrant' THEN greatest($months - 3, 0)
+                WHEN anomaly IS NULL AND synth_u(i, 4, 0) >= 0.85 THEN floor(synth_u(i, 5, 0) * $months)::INTEGER
+                ELSE 0
+            END AS start_month,
+            CASE
+                WHEN anomaly = 'new_entrant' THEN 1
+                ELSE 1 + floor(synth_u(i, 6, 0) * least(menu_size, 2 * $codes_per_provider - 1))::INTEGER
+            END AS n_codes,
+            synth_pick($first_names, synth_u(i, 10, 0)) AS first_name,
+            synth_pick($surname_stems, synth_u(i, 11, 0)) || synth_pick($surname_endings, synth_u(i, 12, 0)) AS last_name,
+            synth_pick($org_words, synth_u(i, 13, 0)) || ' ' || org_noun || ' ' || synth_pick($org_suffixes, synth_u(i, 14, 0)) AS org_name,
+            (100 + floor(synth_u(i, 15, 0) * 19900))::INTEGER || ' ' || synth_pick($streets, synth_u(i, 16, 0)) AS address,
+            split_part(synth_pick($locations, synth_u(i, 17, 0)), '|', 1) AS city,
+            split_part(synth_pick($locations, synth_u(i, 17, 0)), '|', 2) AS zip
+        FROM typed
+    """, {
+        "providers": providers, "months": months, "codes_per_provider": codes_per_provider,
+        "anomaly_rate": anomaly_rate, "anomalies": list(ANOMALIES),
+        "first_names": FIRST_NAMES, "surname_stems": SURNAME_STEMS, "surname_endings": SURNAME_ENDINGS,
+        "org_words": ORG_WORDS, "org_suffixes": ORG_SUFFIXES, "streets": STREETS, "locations": ROSTER_LOCATIONS,
+    })
+    # Every provider bills its specialty's staple code (rank 0), the rest are
+    # drawn log-uniformly over the menu, so popular codes have dense peer groups
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE synth_provider_codes AS
+        WITH picks AS (
+            SELECT
+                i, taxonomy_idx,
+                CASE WHEN k = 0 THEN 0
+                     ELSE least(floor(pow(menu_size + 1, synth_u(i, 20, k)))::INTEGER - 1, menu_size - 1)
+                END AS code_rank
+            FROM (SELECT i, taxonomy_idx, menu_size, unnest(range(n_codes)) AS k FROM synth_roster)
+        )
+        SELECT DISTINCT p.i, m.code_rank, m.hcpcs_code, m.price, m.claims
+        FROM picks p JOIN synth_menu m ON p.taxonomy_idx = m.taxonomy_idx AND p.code_rank = m.code_rank
+    """)
+
+def _insert_providers(conn):
+    conn.execute("""
+        INSERT INTO providers (
+            npi, name, taxonomy_desc, org_type, city, state, postal_code, is_excluded, practice_address,
+            auth_official_name, auth_official_title, mailing_address, mailing_city, mailing_state, mailing_zip
+        )
+        SELECT
+            npi,
+            CASE org_type WHEN 'NPI-2' THEN org_name ELSE first_name || ' ' || last_name END,
+            taxonomy_desc, org_type, city, $state, zip,
+            anomaly IS NOT DISTINCT FROM 'excluded_npi',
+            address,
+            CASE org_type WHEN 'NPI-2' THEN first_name || ' ' || last_name END,
+            CASE org_type WHEN 'NPI-2' THEN 'OWNER' END,
+            address, city, $state, zip
+        FROM synth_roster
+        ORDER BY i
+    """, {"state": settings.TARGET_STATE})
+
+def _insert_spend(conn, lo, hi, months, first_period):
+    """medicaid_spend rows of providers lo <= i < hi, with anomalies applied to their staple code."""
+    conn.execute("""
+        INSERT INTO medicaid_spend (
+            billing_npi, servicing_npi, hcpcs_code, period, state, county, total_paid, total_claims, unique_beneficiaries
+        )
+        WITH base AS (
+            SELECT
+                r.npi, r.anomaly, c.hcpcs_code, c.code_rank = 0 AS staple,
+                ($first_period::DATE + to_months(m.m))::DATE AS period,
+                c.price * r.price_factor * (0.85 + 0.3 * synth_u(r.i, 30, m.m * 100 + c.code_rank)) AS price,
+                c.claims * r.volume_scale * (0.7 + 0.6 * synth_u(r.i, 31, m.m * 100 + c.code_rank)) AS claims,
+                1.5 + 3 * synth_u(r.i, 32, m.m * 100 + c.code_rank) AS claims_per_beneficiary
+            FROM synth_roster r
+            JOIN synth_provider_codes c ON c.i = r.i
+            JOIN range($months) m(m) ON m.m >= r.start_month
+            WHERE r.i >= $lo AND r.i < $hi
+              -- Established providers skip the odd month
+              AND (r.anomaly IS NOT NULL OR synth_u(r.i, 33, m.m * 100 + c.code_rank) < 0.92)
+        ),
+        priced AS (
+            SELECT * REPLACE (CASE WHEN staple AND anomaly = 'price' THEN price * 8 ELSE price END AS price)
+            FROM base
+        ),
+        shaped AS (
+            SELECT
+                *,
+                greatest(1, round(CASE
+                    WHEN NOT staple THEN claims
+                    WHEN anomaly = 'price' THEN greatest(claims, 30000 / price)
+                    WHEN anomaly = 'volume' THEN greatest(claims * 30, 600)
+                    WHEN anomaly = 'claim_mill' THEN greatest(claims, 15000 / price)
+                    WHEN anomaly = 'new_entrant' THEN 500000 / price
+                    ELSE claims
+                END))::INTEGER AS total_claims
+            FROM priced
+        )
+        SELECT
+            npi, npi, hcpcs_code, period, $state, $county,
+            round(total_claims * price, 2),
+            total_claims,
+            greatest(1, round(total_claims / CASE WHEN staple AND anomaly = 'claim_mill' THEN 40 ELSE claims_per_beneficiary END))::INTEGER
+        FROM shaped
+    """, {
+        "lo": lo, "hi": hi, "months": months, "first_period": first_period,
+        "state": settings.TARGET_STATE, "county": settings.TARGET_COUNTY,
+    })
+
+def _insert_leie(conn, leie_rows):
+    """The injected exclusions of roster providers plus `leie_rows` unrelated entries from across the country."""
+    conn.execute(f"""
+        INSERT INTO leie_exclusions BY NAME
+        SELECT {LEIE_KEY_SQL} AS leie_key, *, 'synthetic' AS source_url
+        FROM (
+            SELECT
+                CASE WHEN org_type = 'NPI-1' THEN last_name END AS last_name,
+                CASE WHEN org_type = 'NPI-1' THEN first_name END AS first_name,
+                NULL::VARCHAR AS mid_name,
+                CASE WHEN org_type = 'NPI-2' THEN org_name END AS bus_name,
+                upper(taxonomy_desc) AS general_specialty, NULL::VARCHAR AS specialty, NULL::VARCHAR AS upin,
+                CASE WHEN anomaly = 'excluded_npi' THEN npi END AS npi,
+                CASE WHEN org_type = 'NPI-1' THEN synth_date('1950-01-01', 15000, synth_u(i, 40, 0)) END AS dob,
+                address, city, $state AS state, zip,
+                synth_pick($excl_types, synth_u(i, 41, 0)) AS excl_type,
+                synth_date('2010-01-01', 5000, synth_u(i, 42, 0)) AS excl_date,
+                NULL::VARCHAR AS rein_date, NULL::VARCHAR AS waiver_date, NULL::VARCHAR AS wvr_state
+            FROM synth_roster
+            WHERE anomaly IN ('excluded_npi', 'excluded_name')
+            UNION ALL
+            SELECT
+                CASE WHEN NOT business THEN synth_pick($surname_stems, synth_u(j, 43, 0)) || synth_pick($surname_endings, synth_u(j, 44, 0)) END,
+                CASE WHEN NOT business THEN synth_pick($first_names, synth_u(j, 45, 0)) END,
+                NULL,
+                CASE WHEN business THEN synth_pick($org_words, synth_u(j, 46, 0)) || ' ' || synth_pick($org_suffixes, synth_u(j, 47, 0)) END,
+                'OTHER BUSINESS', NULL, NULL,
+                -- Most entries carry no NPI
+                CASE WHEN synth_u(j, 48, 0) < 0.08 THEN CAST(1999999999 - j AS VARCHAR) END,
+                CASE WHEN NOT business THEN synth_date('1940-01-01', 22000, synth_u(j, 49, 0)) END,
+                (100 + floor(synth_u(j, 50, 0) * 19900))::INTEGER || ' ' || synth_pick($streets, synth_u(j, 51, 0)),
+                split_part(location, '|', 1), split_part(location, '|', 2), split_part(location, '|', 3),
+                synth_pick($excl_types, synth_u(j, 52, 0)),
+                synth_date('1990-01-01', 13000, synth_u(j, 53, 0)),
+                CASE WHEN synth_u(j, 54, 0) < 0.03 THEN synth_date('2015-01-01', 3500, synth_u(j, 55, 0)) END,
+                NULL, NULL
+            FROM (
+                SELECT j, synth_u(j, 56, 0) < 0.2 AS business, synth_pick($locations, synth_u(j, 57, 0)) AS location
+                FROM range(1, $leie_rows + 1) r(j)
+            )
+        )
+    """, {
+        "state": settings.TARGET_STATE, "leie_rows": leie_rows, "excl_types": LEIE_EXCLUSION_TYPES,
+        "first_names": FIRST_NAMES, "surname_stems": SURNAME_STEMS, "surname_endings": SURNAME_ENDINGS,
+        "org_words": ORG_WORDS, "org_suffixes": ORG_SUFFIXES, "streets": STREETS, "locations": LEIE_LOCATIONS,
+    })
+    conn.execute("""
+        INSERT INTO leie_sources (url, kind, row_count, applied_at, checked_at)
+        VALUES ('synthetic', 'full', (SELECT COUNT(*) FROM leie_exclusions), now(), now())
+    """)
+
+def generate_synthetic_data(providers=1000, months=36, seed=0, codes_per_provider=4, anomaly_rate=0.01,
+                            leie_rows=None, end_period="2025-12-01"):
+    """
+    Fill an empty database with `providers` providers billing over the
+    `months` months ending at `end_period`, plus an LEIE of `leie_rows`
+    unrelated entries (default: a tenth of the roster, at least 500).
+    Injected anomalies are listed in synthetic_anomalies. Returns row counts.
+    """
+    leie_rows = max(500, providers // 10) if leie_rows is None else leie_rows
+    conn = connect(settings.DB_PATH)
+    if conn.execute("SELECT COUNT(*) FROM providers").fetchone()[0]:
+        conn.close()
+        raise ValueError(f"{settings.DB_PATH} already has providers; synthetic data only goes into an empty database")
+
+    print(f"Generating {providers} synthetic providers over {months} months (seed {seed})...")
+    _register_macros(conn, seed)
+    _stage_reference_tables(conn)
+    _stage_roster(conn, providers, months, codes_per_provider, anomaly_rate)
+    _insert_providers(conn)
+
+    first_period = conn.execute("SELECT (?::DATE - to_months(? - 1))::DATE", [end_period, months]).fetchone()[0]
+    batches = math.ceil(providers / SPEND_BATCH_PROVIDERS)
+    for n, lo in enumerate(range(0, providers, SPEND_BATCH_PROVIDERS), 1):
+        _insert_spend(conn, lo, lo + SPEND_BATCH_PROVIDERS, months, first_period)
+        if batches > 1:
+            print(f"  spend batch {n}/{batches}")
+
+    _insert_leie(conn, leie_rows)
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE synthetic_anomalies AS
+        SELECT npi, anomaly, CASE anomaly {' '.join(f"WHEN '{k}' THEN '{v}'" for k, v in ANOMALIES.items())} END AS expected_flag
+        FROM synth_roster WHERE anomaly IS NOT NULL
+        ORDER BY npi
+    """)
+
+    counts = {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ["providers", "medicaid_spend", "leie_exclusions", "synthetic_anomalies"]
+    }
+    conn.close()
+    print("Synthetic data ready: " + ", ".join(f"{n} {table}" for table, n in counts.items()))
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic database for tests and benchmarks.")
+    parser.add_argument("--db", required=True, help="database to create (must not hold providers yet)")
+    parser.add_argument("--providers", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--codes-per-provider", type=int, default=4, help="average HCPCS codes billed per provider")
+    parser.add_argument("--anomaly-rate", type=float, default=0.01, help="share of providers given an injected anomaly")
+    parser.add_argument("--leie-rows", type=int, help="unrelated LEIE entries (default: a tenth of the providers)")
+    args = parser.parse_args(argv)
+
+    settings.DB_PATH = os.path.abspath(args.db)
+    init_db()
+    generate_synthetic_data(args.providers, args.months, args.seed, args.codes_per_provider, args.anomaly_rate, args.leie_rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.config import settings
+
+class StaticFileServer:
+    """Local HTTP stand-in that serves in-memory files with ETag/Last-Modified validators."""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                if self.path not in server.files:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body, etag, last_modified = server.files[self.path]
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def publish(self, path, body, etag, last_modified="Mon, 09 Feb 2026 00:00:00 GMT"):
+        self.files[path] = (body, etag, last_modified)
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def full_downloads(self, path):
+        return sum(1 for p, headers in self.requests if p == path and headers.get("If-None-Match") != self.files[path][1])
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def http_stand_in():
+    server = StaticFileServer()
+    yield server
+    server.close()
+
+@pytest.fixture
+def tmp_settings(tmp_path, monkeypatch):
+    """Point every path setting at a throwaway directory."""
+    monkeypatch.setattr(settings, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(settings, "DB_PATH", str(tmp_path / "medicaid_watch.db"))
+    monkeypatch.setattr(settings, "HHS_MIRROR_DIR", tmp_path / "mirror" / "hhs_spend")
+    monkeypatch.setattr(settings, "NPPES_CACHE_PATH", str(tmp_path / "cache" / "nppes_cache.sqlite"))
+    monkeypatch.setattr(settings, "ML_MODEL_DIR", tmp_path / "models")
+    return settings
@@ -0,0 +1,260 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.features import refresh_provider_features
+from src.analysis.flag_runs import claim_flag_types, publish_flag_run, start_flag_run
+from src.analysis.rules import screen_providers
+from src.api.cache import ResponseCache, current_generation, publish_generation, snapshot_path
+from src.api.db import ConnectionPool, PoolTimeout
+from src.api.main import app
+
+@pytest.fixture
+def api_db(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, name, taxonomy_desc) VALUES (?, ?, 'Clinic')",
+                     [[f"N{i}", f"CLINIC {i}"] for i in range(6)])
+    conn.executemany("""
+        INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+        VALUES (?, '99213', '2024-01-01', ?, ?, 10)
+    """, [[f"N{i}", 1000.0 * (i + 1), 100 * (i + 1)] for i in range(6)])
+    conn.close()
+    calculate_benchmarks()
+    refresh_provider_features()
+    screen_providers()
+    publish_generation()
+    return settings
+
+def test_concurrent_requests_share_pool(api_db, monkeypatch):
+    monkeypatch.setattr(settings, "API_DB_POOL_SIZE", 3)
+    with TestClient(app) as client:
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            responses = list(pool.map(lambda i: client.get(f"/api/provider/N{i % 6}"), range(60)))
+        assert all(r.status_code == 200 for r in responses)
+        assert {r.json()["details"]["npi"] for r in responses} == {f"N{i}" for i in range(6)}
+        assert client.get("/api/summary").json()["total_providers"] == 6
+
+        metrics = client.get("/api/metrics/db-pool").json()
+        assert metrics["size"] == 3
+        # Repeat views come from the response cache, not the pool
+        assert 8 <= metrics["acquired"] < 62
+        assert 1 <= metrics["peak_in_use"] <= 3
+        assert metrics["timeouts"] == 0
+        assert "providers" in metrics["warmed_tables"]
+
+    # The lifespan released the read-only handle: the pipeline can write again
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("DELETE FROM medicaid_spend WHERE billing_npi = 'N0'")
+    conn.close()
+
+def test_pool_timeout(api_db):
+    pool = ConnectionPool(settings.DB_PATH, size=1, timeout=0.05)
+    with pool.cursor():
+        with pytest.raises(PoolTimeout):
+            with pool.cursor():
+                pass
+    assert pool.metrics()["timeouts"] == 1
+    with pool.cursor() as cur:
+        assert cur.execute("SELECT COUNT(*) FROM providers").fetchone()[0] == 6
+    pool.close()
+
+def test_responses_cached_until_generation_bump(api_db):
+    with TestClient(app) as client:
+        first = client.get("/api/summary")
+        etag = first.headers["etag"]
+        assert first.json()["total_providers"] == 6
+        assert client.get("/api/summary").json() == first.json()
+        assert client.get("/api/summary", headers={"If-None-Match": etag}).status_code == 304
+        assert client.get("/api/provider/NOPE").status_code == 404
+        # Startup search index build, then the two misses
+        assert client.get("/api/metrics/db-pool").json()["acquired"] == 3
+        assert client.app.state.response_cache.metrics()["hits"] == 2
+
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("INSERT INTO providers (npi, name) VALUES ('N6', 'NEW CLINIC')")
+    conn.close()
+    publish_generation()
+
+    with TestClient(app) as client:
+        stale = client.get("/api/summary", headers={"If-None-Match": etag})
+        assert stale.status_code == 200
+        assert stale.json()["total_providers"] == 7
+        assert stale.headers["etag"] != etag
+
+def test_writers_publish_while_the_api_serves(api_db):
+    with TestClient(app) as client:
+        etag = client.get("/api/summary").headers["etag"]
+        assert client.get("/api/search", params={"q": "harbor"}).json() == []
+        # An export still streaming from the current snapshot when the next one is published
+        pool = client.app.state.db_pool
+        draining = pool.cursor()
+        old_cursor = draining.__enter__()
+
+        # The API holds only its snapshot: the pipeline and enrichment can write meanwhile
+        conn = duckdb.connect(settings.DB_PATH)
+        conn.execute("INSERT INTO providers (npi, name, city) VALUES ('N6', 'HARBOR CLINIC', 'VANCOUVER')")
+        conn.close()
+        generation = publish_generation()
+
+        fresh = client.get("/api/summary", headers={"If-None-Match": etag})
+        assert fresh.status_code == 200
+        assert fresh.json()["total_providers"] == 7
+        assert client.app.state.response_cache.metrics()["invalidations"] == 1
+        assert [r["npi"] for r in client.get("/api/search", params={"q": "harbor"}).json()] == ["N6"]
+        metrics = client.get("/api/metrics/db-pool").json()
+        assert metrics["generation"] == generation and metrics["swaps"] == 1
+
+        # The retired snapshot stays open for the cursor still using it
+        assert old_cursor.execute("SELECT COUNT(*) FROM providers").fetchone()[0] == 6
+        draining.__exit__(None, None, None)
+
+def test_unchanged_data_is_not_republished_and_served_snapshots_are_kept(api_db):
+    generation = current_generation()
+    assert publish_generation() == generation
+    assert sorted(p.name for p in snapshot_path(generation).parent.glob("*.db")) == [f"{generation}.db"]
+
+    with TestClient(app) as client:
+        client.get("/api/summary")
+        # Two publishes without API traffic: the snapshot still served is not pruned
+        for npi in ("N6", "N7"):
+            conn = duckdb.connect(settings.DB_PATH)
+            conn.execute("INSERT INTO providers (npi, name) VALUES (?, 'NEW CLINIC')", [npi])
+            conn.close()
+            publish_generation()
+        assert snapshot_path(generation).exists()
+        assert client.get("/api/summary").json()["total_providers"] == 8
+
+    # Released once the API swapped away from it
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("INSERT INTO providers (npi, name) VALUES ('N8', 'NEW CLINIC')")
+    conn.close()
+    publish_generation()
+    assert not snapshot_path(generation).exists()
+
+def test_api_only_attaches_published_snapshots(tmp_settings):
+    init_db()
+    with pytest.raises(RuntimeError, match="No published database snapshot"):
+        with TestClient(app):
+            pass
+    assert current_generation() == 0
+
+def test_etag_generation_is_the_one_the_query_read(api_db):
+    with TestClient(app) as client:
+        pool = client.app.state.db_pool
+        served = pool.generation
+        conn = duckdb.connect(settings.DB_PATH)
+        conn.execute("INSERT INTO providers (npi, name) VALUES ('N6', 'NEW CLINIC')")
+        conn.close()
+        published = publish_generation()
+
+        # The request reads the generation just before the publish, its query runs just after
+        refresh, calls = pool.refresh, []
+        def racing_refresh():
+            calls.append(1)
+            return served if len(calls) == 1 else refresh()
+        pool.refresh = racing_refresh
+        response = client.get("/api/summary")
+        assert response.json()["total_providers"] == 7
+        assert response.headers["etag"].startswith(f'"{published}-')
+
+def test_response_cache_lru_limits():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put("a", 1, b"aaaa")
+    cache.put("b", 1, b"bbbb")
+    cache.get("a", 1)
+    cache.put("c", 1, b"cccc")
+    assert cache.get("b", 1) is None and cache.get("a", 1) is not None
+    cache.put("d", 1, b"dddddddd")
+    assert cache.metrics()["bytes"] <= 10
+    # Larger than the whole cache: returned but not stored
+    assert cache.put("big", 1, b"x" * 11).etag and cache.get("big", 1) is None
+    assert cache.get("d", 2) is None and cache.metrics()["entries"] == 0
+
+def seed_flagged(n):
+    """n flagged providers in two specialties with 1-3 flags each."""
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, name, taxonomy_desc, is_excluded) VALUES (?, ?, ?, ?)",
+                     [[f"P{i:03d}", f"PROVIDER {i}", "Clinic" if i % 2 else "Lab", i % 10 == 0] for i in range(n)])
+    conn.executemany("""
+        INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+        VALUES (?, '99213', '2024-01-01', ?, 10, 5)
+    """, [[f"P{i:03d}", 1000.0 * i] for i in range(n)])
+    conn.close()
+    calculate_benchmarks()
+    refresh_provider_features()
+    conn = duckdb.connect(settings.DB_PATH)
+    run_id = start_flag_run(conn)
+    conn.executemany("INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason) VALUES (?, ?, ?, 1.0, 'x')",
+                     [[run_id, f"P{i:03d}", t] for i in range(n) for t in ["PRICE_OUTLIER", "LEIE_MATCH", "CLAIM_MILL_RATIO"][: 1 + i % 3]])
+    claim_flag_types(conn, run_id, ["PRICE_OUTLIER", "LEIE_MATCH", "CLAIM_MILL_RATIO"])
+    publish_flag_run(conn, run_id)
+    conn.close()
+    publish_generation()
+
+def test_keyset_pagination_and_filters(tmp_settings):
+    seed_flagged(50)
+    with TestClient(app) as client:
+        top = client.get("/api/flagged-providers", params={"limit": 50}).json()
+        assert [(r["flag_count"], r["total_spend"]) for r in top] == sorted(
+            [(r["flag_count"], r["total_spend"]) for r in top], reverse=True)
+
+        pages, params = [], {"limit": 7, "taxonomy_desc": "Clinic", "min_spend": 5000}
+        while True:
+            res = client.get("/api/flagged-providers", params=params)
+            pages.append(res.json())
+            if "x-next-cursor" not in res.headers:
+                break
+            assert 'rel="next"' in res.headers["link"]
+            params["cursor"] = res.headers["x-next-cursor"]
+        rows = [r for page in pages for r in page]
+        expected = [r["npi"] for r in top if r["taxonomy_desc"] == "Clinic" and r["total_spend"] >= 5000]
+        assert [r["npi"] for r in rows] == expected and len(pages) == 4
+
+        leie = client.get("/api/flagged-providers", params={"flag_type": "LEIE_MATCH", "is_excluded": True}).json()
+        assert {r["npi"] for r in leie} == {f"P{i:03d}" for i in range(50) if i % 3 and i % 10 == 0}
+
+        assert client.get("/api/flagged-providers", params={"cursor": "garbage!"}).status_code == 400
+
+        facets = client.get("/api/flagged-providers/facets", params={"taxonomy_desc": "Lab"}).json()
+        # The taxonomy facet ignores its own filter, the others apply it
+        assert {f["value"]: f["count"] for f in facets["taxonomy_desc"]} == {"Clinic": 25, "Lab": 25}
+        assert {f["value"]: f["count"] for f in facets["flag_type"]} == {
+            "PRICE_OUTLIER": 25, "LEIE_MATCH": 16, "CLAIM_MILL_RATIO": 8
+        }
+        assert sum(f["count"] for f in facets["spend_tier"]) == 25
+        assert {f["value"]: f["count"] for f in facets["is_excluded"]} == {False: 20, True: 5}
+
+def test_streaming_exports(tmp_settings, monkeypatch):
+    seed_flagged(50)
+    monkeypatch.setattr(settings, "EXPORT_BATCH_ROWS", 7)
+    with TestClient(app) as client:
+        res = client.get("/api/export/risk_flags", params={"format": "arrow"})
+        assert res.headers["content-type"] == "application/vnd.apache.arrow.stream"
+        flags = pa.ipc.open_stream(res.content).read_all()
+        assert flags.num_rows == 99
+
+        res = client.get("/api/export/medicaid_spend", params={
+            "format": "parquet", "npi": ["P001", "P002", "P003"], "period_from": "2024-01-01", "period_to": "2024-01-31"
+        })
+        parquet = pq.ParquetFile(io.BytesIO(res.content))
+        assert sorted(parquet.read().column("billing_npi").to_pylist()) == ["P001", "P002", "P003"]
+
+        res = client.get("/api/export/provider_rollup", params={"format": "csv"})
+        rollup = pa_csv.read_csv(io.BytesIO(res.content))
+        assert rollup.num_rows == 50 and rollup.column("dashboard_rank").to_pylist() == list(range(1, 51))
+        assert res.content.count(b'"npi"') == 1  # header written once across batches
+
+        assert client.get("/api/export/risk_flags", params={"period_from": "2024-01-01"}).status_code == 400
+        assert client.get("/api/export/providers").status_code == 404
+        assert client.get("/api/metrics/db-pool").json()["in_use"] == 0
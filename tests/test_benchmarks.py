@@ -0,0 +1,94 @@
+import duckdb
+import pytest
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis.benchmarks import calculate_benchmarks
+
+REFERENCE_SQL = """
+    SELECT p.taxonomy_desc, s.period, s.hcpcs_code,
+           AVG(s.total_paid / NULLIF(s.total_claims, 0)),
+           STDDEV_SAMP(s.total_paid / NULLIF(s.total_claims, 0)),
+           SUM(s.total_claims),
+           COUNT(DISTINCT s.billing_npi),
+           MEDIAN(s.total_paid / NULLIF(s.total_claims, 0)),
+           MAD(s.total_paid / NULLIF(s.total_claims, 0))
+    FROM medicaid_spend s JOIN providers p ON s.billing_npi = p.npi
+    WHERE p.taxonomy_desc IS NOT NULL
+    GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+"""
+
+def add_spend(conn, period, run_id):
+    for i in range(6):
+        for code in ("T1019", "T1020"):
+            claims = 10 + i
+            conn.execute("""
+                INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+                VALUES (?, ?, ?, ?, ?, 5)
+            """, [f"N{i}", code, period, claims * (95.5 + 3 * i), claims])
+    # What filter_hhs_spend would have recorded for the new month
+    conn.execute("INSERT INTO hhs_ingestion_runs (ingest_run_id) VALUES (?)", [run_id])
+    conn.execute("INSERT INTO hhs_ingestion_changes VALUES (?, 'WA', 'CLARK', ?, 'NEW', 12)", [run_id, period])
+
+def assert_matches_reference(conn):
+    derived = conn.execute("""
+        SELECT taxonomy_desc, period, hcpcs_code, avg_price_per_claim, stddev_price_per_claim,
+               total_peer_claims, peer_count, price_median, price_mad
+        FROM benchmarks ORDER BY 1, 2, 3
+    """).fetchall()
+    reference = conn.execute(REFERENCE_SQL).fetchall()
+    assert len(derived) == len(reference)
+    for got, want in zip(derived, reference):
+        assert got[:3] == want[:3]
+        assert got[3] == pytest.approx(want[3])
+        assert got[4] == pytest.approx(want[4])
+        assert got[5:7] == want[5:7]
+        # Small groups are sketched exactly
+        assert got[7:] == pytest.approx(want[7:])
+
+def test_benchmarks_recompute_only_affected_groups(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, taxonomy_desc) VALUES (?, ?)",
+                     [[f"N{i}", "Home Health" if i < 4 else "Clinic"] for i in range(6)] + [["L1", "Lab"]])
+    add_spend(conn, "2024-01-01", 1)
+    conn.execute("INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims) VALUES ('L1', '80053', '2024-01-01', 500, 20)")
+    conn.close()
+
+    assert calculate_benchmarks() == 5
+    conn = duckdb.connect(settings.DB_PATH)
+    assert_matches_reference(conn)
+
+    # A new month arrives and one provider is re-enriched into another specialty
+    add_spend(conn, "2024-02-01", 2)
+    conn.execute("UPDATE providers SET taxonomy_desc = 'Clinic' WHERE npi = 'N0'")
+    conn.close()
+
+    # 4 groups for February, plus both January T1019/T1020 groups for each side of N0's move
+    assert calculate_benchmarks() == 8
+    conn = duckdb.connect(settings.DB_PATH)
+    assert_matches_reference(conn)
+    assert conn.execute("SELECT COUNT(*) FROM benchmark_stats WHERE refresh_run_id = 2").fetchone()[0] == 8
+    # The lab group saw neither change and was left alone
+    assert conn.execute("SELECT refresh_run_id FROM benchmark_stats WHERE taxonomy_desc = 'Lab'").fetchone()[0] == 1
+    conn.close()
+
+    assert calculate_benchmarks() == 0
+
+def test_stddev_is_stable_for_large_clustered_prices(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, taxonomy_desc) VALUES (?, 'Hospital')", [[f"H{i}"] for i in range(3)])
+    # Prices of 1e9 + 0, 1, 2: sums of squares near 3e18 leave no digits for a deviation of 1
+    conn.executemany("""
+        INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims)
+        VALUES (?, '0001', '2024-01-01', ?, 1)
+    """, [[f"H{i}", 1e9 + i] for i in range(3)])
+    conn.close()
+
+    calculate_benchmarks()
+    conn = duckdb.connect(settings.DB_PATH)
+    avg, stddev = conn.execute("SELECT avg_price_per_claim, stddev_price_per_claim FROM benchmarks").fetchone()
+    conn.close()
+    assert avg == pytest.approx(1e9 + 1)
+    assert stddev == pytest.approx(1.0)
@@ -0,0 +1,105 @@
+import threading
+
+import duckdb
+import pytest
+
+from src.config import settings
+from src.dag import Dag, Stage, StageFailed
+from src.pipeline import init_db
+
+def make_dag(calls, fail=()):
+    barrier = threading.Barrier(2, timeout=5)
+
+    def step(name, parallel=False):
+        def run():
+            if name in fail:
+                raise RuntimeError(f"{name} broke")
+            if parallel:
+                # Both ingestion stages must be running at once to get past this
+                barrier.wait()
+            calls.append(name)
+        return run
+
+    return Dag([
+        Stage("ingest_a", step("ingest_a", parallel=True), volatile=True),
+        Stage("ingest_b", step("ingest_b", parallel=True), volatile=True),
+        Stage("derive", step("derive"), deps=["ingest_a"], tables=["source:value"]),
+        Stage("screen", step("screen"), deps=["derive"], tables=["source"], settings=["Z_SCORE_THRESHOLD"]),
+        Stage("report", step("report"), deps=["screen", "ingest_b"], volatile=True),
+    ])
+
+@pytest.fixture
+def dag_db(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("CREATE TABLE source (id INTEGER, value INTEGER, note VARCHAR)")
+    conn.execute("INSERT INTO source VALUES (1, 10, 'a'), (2, 20, 'b')")
+    conn.close()
+
+def test_skips_unchanged_stages_and_reruns_on_input_changes(dag_db, monkeypatch):
+    calls = []
+    status = make_dag(calls).run()
+    assert sorted(calls[:2]) == ["ingest_a", "ingest_b"] and calls[2:] == ["derive", "screen", "report"]
+    assert set(status.values()) == {"ran"}
+
+    calls.clear()
+    status = make_dag(calls).run()
+    assert sorted(calls) == ["ingest_a", "ingest_b", "report"]
+    assert status["derive"] == status["screen"] == "skipped"
+
+    # A threshold tweak re-runs only the stage that reads it
+    monkeypatch.setattr(settings, "Z_SCORE_THRESHOLD", 4.0)
+    calls.clear()
+    make_dag(calls).run()
+    assert "screen" in calls and "derive" not in calls
+
+    # A change outside derive's declared columns leaves it alone
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("UPDATE source SET note = 'c' WHERE id = 1")
+    conn.close()
+    calls.clear()
+    make_dag(calls).run()
+    assert "screen" in calls and "derive" not in calls
+
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("INSERT INTO source VALUES (3, 30, 'c')")
+    conn.close()
+    calls.clear()
+    make_dag(calls).run()
+    assert "derive" in calls and "screen" in calls
+
+def test_targeting_and_force(dag_db):
+    calls = []
+    dag = make_dag(calls)
+    assert dag.descendants("derive") == {"derive", "screen", "report"}
+
+    status = dag.run(only=["derive"])
+    assert calls == ["derive"] and status["screen"] == "not selected"
+
+    calls.clear()
+    dag.run(start="derive")
+    assert calls == ["screen", "report"]
+
+    calls.clear()
+    dag.run(start="derive", force=True)
+    assert calls == ["derive", "screen", "report"]
+
+    with pytest.raises(ValueError):
+        dag.run(only=["nope"])
+
+def test_failure_stops_downstream_and_keeps_fingerprint(dag_db):
+    calls = []
+    with pytest.raises(StageFailed, match="derive"):
+        make_dag(calls, fail={"derive"}).run()
+    assert "screen" not in calls and "report" not in calls
+
+    # derive never recorded a successful run, so it runs again
+    calls.clear()
+    make_dag(calls).run()
+    assert "derive" in calls
+
+def test_rejects_cycles_and_unknown_dependencies():
+    with pytest.raises(ValueError, match="cycle"):
+        Dag([Stage("a", print, deps=["b"]), Stage("b", print, deps=["a"])])
+    with pytest.raises(ValueError, match="unknown"):
+        Dag([Stage("a", print, deps=["missing"])])
@@ -0,0 +1,59 @@
+import json
+
+import duckdb
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.dossiers import dossier_sql, provider_dossier
+from src.analysis.features import refresh_provider_features
+from src.analysis.flag_runs import claim_flag_types, publish_flag_run, start_flag_run
+from src.api.cache import publish_generation
+from src.api.main import app
+
+def test_dossiers_prebuilt_for_flagged_providers(tmp_settings, monkeypatch):
+    monkeypatch.setattr(settings, "DOSSIER_TOP_CODES", 2)
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, name, taxonomy_desc, city) VALUES (?, ?, 'Clinic', 'VANCOUVER')",
+                     [["F1", "FLAGGED"], ["U1", "UNFLAGGED"]])
+    conn.executemany("""
+        INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+        VALUES (?, ?, ?, ?, ?, 5)
+    """, [
+        ["F1", "A", "2024-01-01", 300.0, 10], ["F1", "A", "2024-02-01", 300.0, 10],
+        ["F1", "B", "2024-01-01", 50.0, 10], ["F1", "C", "2024-02-01", 500.0, 10],
+        ["U1", "A", "2024-01-01", 100.0, 10], ["U1", "A", "2024-02-01", 100.0, 10],
+    ])
+    conn.close()
+    calculate_benchmarks()
+    refresh_provider_features()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    run_id = start_flag_run(conn)
+    conn.execute("INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason) VALUES (?, 'F1', 'PRICE_OUTLIER', 3.0, 'High price')", [run_id])
+    claim_flag_types(conn, run_id, ["PRICE_OUTLIER"])
+    publish_flag_run(conn, run_id)
+    assert conn.execute("SELECT npi, flag_run_id FROM provider_dossiers").fetchall() == [("F1", run_id)]
+
+    dossier = json.loads(provider_dossier(conn, "F1"))
+    assert dossier["details"]["name"] == "FLAGGED"
+    assert [(f["flag_type"], f["reason"]) for f in dossier["flags"]] == [("PRICE_OUTLIER", "High price")]
+    assert dossier["spend_trend"] == [{"period": "2024-01-01", "spend": 350.0}, {"period": "2024-02-01", "spend": 800.0}]
+    assert dossier["features"]["total_paid"] == 1150.0
+    # Top codes by spend, with the claim-weighted price against the peer average (A: 30 vs peers' 20)
+    assert [c["hcpcs_code"] for c in dossier["top_codes"]] == ["A", "C"]
+    assert dossier["top_codes"][0]["peer_price_ratio"] == 1.5
+
+    # The prebuilt dossier matches what the live query assembles
+    live = conn.execute(f"SELECT dossier FROM ({dossier_sql('= $npi')})", {"npi": "F1", "top_codes": 2}).fetchone()[0]
+    assert json.loads(live) == dossier
+    conn.close()
+    publish_generation()
+
+    with TestClient(app) as client:
+        assert client.get("/api/provider/F1").json() == dossier
+        unflagged = client.get("/api/provider/U1").json()
+        assert unflagged["flags"] == [] and unflagged["features"]["total_paid"] == 200.0
+        assert client.get("/api/provider/NOPE").status_code == 404
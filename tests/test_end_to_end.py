@@ -0,0 +1,74 @@
+import duckdb
+import pytest
+
+from src.config import settings
+from src.perf import ANALYSIS_STAGES, API_REQUESTS, find_regressions, run_benchmark
+from src.pipeline import FlagRun, build_dag, init_db
+from src.synthetic import ANOMALIES, generate_synthetic_data
+
+# Screens a clean synthetic provider should rarely trip (price noise alone can clear the robust z-score)
+STATISTICAL_FLAGS = ["PRICE_Z_SCORE_OUTLIER", "ROBUST_Z_OUTLIER", "VOLUME_OUTLIER", "CLAIM_MILL_RATIO"]
+
+def spend_checksum():
+    conn = duckdb.connect(settings.DB_PATH)
+    row = conn.execute("""
+        SELECT COUNT(*), SUM(hash(billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries))::HUGEINT
+        FROM medicaid_spend
+    """).fetchone()
+    conn.close()
+    return row
+
+def test_synthetic_data_is_deterministic(tmp_settings, tmp_path, monkeypatch):
+    checksums = []
+    for name, seed in [("a", 7), ("b", 7), ("c", 8)]:
+        monkeypatch.setattr(settings, "DB_PATH", str(tmp_path / f"{name}.db"))
+        init_db()
+        counts = generate_synthetic_data(providers=200, months=12, seed=seed)
+        checksums.append(spend_checksum())
+    assert counts["providers"] == 200 and counts["leie_exclusions"] >= 500
+    assert checksums[0] == checksums[1] != checksums[2]
+
+    with pytest.raises(ValueError, match="empty database"):
+        generate_synthetic_data(providers=10, months=3)
+
+def test_pipeline_flags_injected_anomalies(tmp_settings):
+    init_db()
+    generate_synthetic_data(providers=1500, months=36, seed=3, anomaly_rate=0.05)
+    status = build_dag(FlagRun()).run(only=ANALYSIS_STAGES, force=True)
+    assert all(status[s] == "ran" for s in ANALYSIS_STAGES)
+
+    conn = duckdb.connect(settings.DB_PATH)
+    missed = conn.execute("""
+        SELECT a.npi, a.anomaly FROM synthetic_anomalies a
+        WHERE NOT EXISTS (SELECT 1 FROM risk_flags f WHERE f.npi = a.npi AND f.flag_type = a.expected_flag)
+    """).fetchall()
+    kinds = {r[0] for r in conn.execute("SELECT DISTINCT anomaly FROM synthetic_anomalies").fetchall()}
+    false_alarms = conn.execute("""
+        SELECT COUNT(DISTINCT npi) FROM risk_flags
+        WHERE list_contains(?, flag_type) AND npi NOT IN (SELECT npi FROM synthetic_anomalies)
+    """, [STATISTICAL_FLAGS]).fetchone()[0]
+    excluded = conn.execute("SELECT COUNT(*) FROM providers WHERE is_excluded").fetchone()[0]
+    conn.close()
+
+    assert kinds == set(ANOMALIES)
+    assert missed == []
+    assert false_alarms <= 0.01 * 1500
+    assert excluded > 0
+
+def test_benchmark_reports_regressions(tmp_settings):
+    results = run_benchmark("e2e", {"providers": 300, "months": 12}, repeat=1)
+    assert set(results["stages"]) == set(ANALYSIS_STAGES)
+    assert set(results["api"]) == set(API_REQUESTS)
+    assert results["stages"]["rules"]["rows_read"] > 0
+    # The benchmark runs in its own directory and leaves the settings as they were
+    assert settings.DB_PATH == str(tmp_settings.DATA_DIR / "medicaid_watch.db")
+
+    assert find_regressions(results, results) == []
+    slower = {**results, "stages": {**results["stages"], "rules": {**results["stages"]["rules"], "wall_seconds": 10.0}}}
+    assert [r[0] for r in find_regressions(results, slower)] == ["stage rules wall_seconds"]
+    # Below the noise floor a slowdown is not a regression
+    slightly = {**results, "api": {**results["api"], "summary": {"median_seconds": results["api"]["summary"]["median_seconds"] + 0.01, "max_seconds": 1.0}}}
+    assert find_regressions(results, slightly, tolerance=0.0) == []
+
+    with pytest.raises(ValueError, match="Baseline"):
+        find_regressions(results, {**results, "params": {"providers": 1}})
@@ -0,0 +1,89 @@
+import duckdb
+import pytest
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis import features
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.features import Feature, refresh_provider_features
+
+# The per-provider aggregation the ML stage used to run inline
+REFERENCE_SQL = """
+    WITH provider_monthly AS (
+        SELECT billing_npi, period, SUM(total_paid) AS monthly_paid
+        FROM medicaid_spend GROUP BY 1, 2
+    )
+    SELECT
+        s.billing_npi,
+        SUM(s.total_paid),
+        COUNT(DISTINCT s.period),
+        COUNT(DISTINCT s.hcpcs_code),
+        AVG((s.total_paid / NULLIF(s.total_claims, 0)) / NULLIF(b.avg_price_per_claim, 0)),
+        (SELECT STDDEV(monthly_paid) FROM provider_monthly m WHERE m.billing_npi = s.billing_npi),
+        SUM(s.total_claims) / NULLIF(SUM(s.unique_beneficiaries), 0)
+    FROM medicaid_spend s
+    JOIN providers p ON s.billing_npi = p.npi
+    JOIN benchmarks b ON p.taxonomy_desc = b.taxonomy_desc AND s.period = b.period AND s.hcpcs_code = b.hcpcs_code
+    GROUP BY 1 ORDER BY 1
+"""
+
+def add_month(conn, period, run_id, npis):
+    for i, npi in enumerate(npis):
+        conn.execute("""
+            INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+            VALUES (?, 'T1019', ?, ?, ?, ?)
+        """, [npi, period, 1000.0 + 150 * i + run_id * 10, 10 + i, 3 + i])
+    conn.execute("INSERT INTO hhs_ingestion_runs (ingest_run_id) VALUES (?) ON CONFLICT DO NOTHING", [run_id])
+    conn.execute("INSERT INTO hhs_ingestion_changes VALUES (?, 'WA', 'CLARK', ?, 'NEW', ?)", [run_id, period, len(npis)])
+
+def assert_matches_reference(conn):
+    stored = conn.execute("""
+        SELECT npi, total_paid, active_months, unique_codes, avg_peer_price_ratio, spend_volatility, beneficiary_ratio
+        FROM provider_features WHERE taxonomy_desc IS NOT NULL ORDER BY 1
+    """).fetchall()
+    reference = conn.execute(REFERENCE_SQL).fetchall()
+    assert [r[0] for r in stored] == [r[0] for r in reference]
+    for got, want in zip(stored, reference):
+        assert got[1:] == pytest.approx(want[1:], nan_ok=True)
+
+def test_features_refresh_only_affected_providers(tmp_settings, monkeypatch):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, taxonomy_desc) VALUES (?, ?)",
+                     [["A1", "Home Health"], ["A2", "Home Health"], ["A3", "Home Health"],
+                      ["B1", "Clinic"], ["B2", "Clinic"]])
+    add_month(conn, "2024-01-01", 1, ["A1", "A2", "A3"])
+    add_month(conn, "2024-01-01", 1, ["B1", "B2"])
+    conn.close()
+
+    calculate_benchmarks()
+    assert refresh_provider_features() == 5
+    conn = duckdb.connect(settings.DB_PATH)
+    assert_matches_reference(conn)
+
+    # February only has Home Health billing: the clinics are not touched
+    add_month(conn, "2024-02-01", 2, ["A1", "A2"])
+    conn.close()
+    calculate_benchmarks()
+    assert refresh_provider_features() == 2
+    conn = duckdb.connect(settings.DB_PATH)
+    assert_matches_reference(conn)
+    assert conn.execute("SELECT active_months FROM provider_features WHERE npi = 'A1'").fetchone()[0] == 2
+
+    # Re-enrichment moves A3 into Clinic: A3, its old peers and its new peers are recomputed
+    conn.execute("UPDATE providers SET taxonomy_desc = 'Clinic' WHERE npi = 'A3'")
+    conn.close()
+    calculate_benchmarks()
+    assert refresh_provider_features() == 5
+    conn = duckdb.connect(settings.DB_PATH)
+    assert_matches_reference(conn)
+    conn.close()
+    assert refresh_provider_features() == 0
+
+    # A new catalog entry adds a column and refills every provider
+    catalog = features.FEATURE_CATALOG + [Feature("max_monthly_paid", "MAX(monthly_paid)", "DOUBLE", "Largest month", level="monthly")]
+    monkeypatch.setattr(features, "FEATURE_CATALOG", catalog)
+    assert refresh_provider_features() == 5
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT max_monthly_paid FROM provider_features WHERE npi = 'A2'").fetchone()[0] == 1170.0
+    conn.close()
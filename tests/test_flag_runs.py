@@ -0,0 +1,152 @@
+import duckdb
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.features import refresh_provider_features
+from src.analysis import flag_runs
+from src.analysis.flag_runs import claim_flag_types, publish_flag_run, start_flag_run
+from src.analysis.rules import screen_providers
+from src.api.cache import publish_generation
+from src.api.main import app
+
+def seed(conn):
+    conn.executemany("INSERT INTO providers (npi, name, taxonomy_desc) VALUES (?, ?, 'Clinic')",
+                     [["M1", "MILL CLINIC"], ["M2", "OTHER CLINIC"]])
+    conn.executemany("""
+        INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+        VALUES (?, '99213', '2024-01-01', ?, ?, ?)
+    """, [["M1", 20000.0, 1000, 10], ["M2", 30000.0, 900, 20]])
+
+def test_runs_publish_history_and_diffs(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    seed(conn)
+    conn.close()
+    calculate_benchmarks()
+    refresh_provider_features()
+
+    screen_providers()
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT run_id, status FROM flag_runs").fetchall() == [(1, "published")]
+    assert conn.execute("SELECT npi, change_type FROM flag_run_diffs ORDER BY 1").fetchall() == [("M1", "NEW"), ("M2", "NEW")]
+
+    # Another stage publishes its own flag type, rule flags carry forward unchanged
+    run_id = start_flag_run(conn)
+    conn.execute("INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason) VALUES (?, 'M2', 'LEIE_MATCH', 1.0, 'Excluded')", [run_id])
+    claim_flag_types(conn, run_id, ["LEIE_MATCH"])
+    # Nothing of the run is visible before it is published
+    assert conn.execute("SELECT COUNT(*) FROM risk_flags WHERE flag_type = 'LEIE_MATCH'").fetchone()[0] == 0
+    publish_flag_run(conn, run_id)
+    assert conn.execute("SELECT COUNT(*) FROM risk_flags").fetchone()[0] == 3
+    assert conn.execute("SELECT npi, flag_type, change_type FROM flag_run_diffs WHERE run_id = 2").fetchall() == [
+        ("M2", "LEIE_MATCH", "NEW")
+    ]
+
+    # M1 stops looking like a claim mill, M2 gets denser
+    conn.execute("UPDATE medicaid_spend SET unique_beneficiaries = 500 WHERE billing_npi = 'M1'")
+    conn.execute("UPDATE medicaid_spend SET unique_beneficiaries = 10 WHERE billing_npi = 'M2'")
+    conn.close()
+    screen_providers()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("""
+        SELECT npi, flag_type, change_type, previous_score, current_score FROM flag_run_diffs WHERE run_id = 3 ORDER BY 1
+    """).fetchall() == [
+        ("M1", "CLAIM_MILL_RATIO", "RESOLVED", 100.0, None),
+        ("M2", "CLAIM_MILL_RATIO", "SCORE_CHANGED", 45.0, 90.0),
+    ]
+    assert sorted(conn.execute("SELECT npi, flag_type FROM risk_flags").fetchall()) == [
+        ("M2", "CLAIM_MILL_RATIO"), ("M2", "LEIE_MATCH")
+    ]
+    # Earlier runs stay queryable
+    assert conn.execute("SELECT COUNT(*) FROM risk_flag_history WHERE run_id = 1").fetchone()[0] == 2
+    conn.close()
+    publish_generation()
+
+    with TestClient(app) as client:
+        latest = client.get("/api/changes").json()
+        since_first = client.get("/api/changes", params={"since_run_id": 1}).json()
+    assert [(c["npi"], c["change_type"], c["name"]) for c in latest] == [
+        ("M1", "RESOLVED", "MILL CLINIC"), ("M2", "SCORE_CHANGED", "OTHER CLINIC")
+    ]
+    assert {(c["npi"], c["flag_type"], c["change_type"]) for c in since_first} == {
+        ("M1", "CLAIM_MILL_RATIO", "RESOLVED"), ("M2", "CLAIM_MILL_RATIO", "SCORE_CHANGED"), ("M2", "LEIE_MATCH", "NEW")
+    }
+
+def test_legacy_flags_table_becomes_first_run(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    seed(conn)
+    conn.execute("DROP VIEW risk_flags")
+    conn.execute("CREATE TABLE risk_flags (npi VARCHAR, flag_type VARCHAR, flag_score DOUBLE, reason VARCHAR, detected_at TIMESTAMP)")
+    conn.execute("INSERT INTO risk_flags VALUES ('M1', 'CLAIM_MILL_RATIO', 100.0, 'old', now())")
+
+    run_id = start_flag_run(conn)
+    assert run_id == 2
+    assert conn.execute("SELECT run_id, status FROM flag_runs ORDER BY 1").fetchall() == [(1, "published"), (2, "building")]
+    assert conn.execute("SELECT npi, reason FROM risk_flags").fetchall() == [("M1", "old")]
+    conn.close()
+
+def test_publish_switches_flags_rollup_and_dossiers_together(tmp_settings, monkeypatch):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    seed(conn)
+    conn.close()
+    calculate_benchmarks()
+    refresh_provider_features()
+    screen_providers()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT DISTINCT flag_run_id FROM provider_rollup").fetchall() == [(1,)]
+    assert conn.execute("SELECT DISTINCT flag_run_id FROM provider_dossiers").fetchall() == [(1,)]
+
+    # A publish that fails while rebuilding the dossiers leaves the previous run visible everywhere
+    run_id = start_flag_run(conn)
+    conn.execute("INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason) VALUES (?, 'M2', 'LEIE_MATCH', 1.0, 'Excluded')", [run_id])
+    claim_flag_types(conn, run_id, ["LEIE_MATCH"])
+    def failing_dossiers(conn):
+        raise RuntimeError("dossier rebuild failed")
+    monkeypatch.setattr(flag_runs, "write_provider_dossiers", failing_dossiers)
+    with pytest.raises(RuntimeError):
+        publish_flag_run(conn, run_id)
+    conn.execute("ROLLBACK")
+    assert conn.execute("SELECT status FROM flag_runs WHERE run_id = ?", [run_id]).fetchone()[0] == "building"
+    assert conn.execute("SELECT COUNT(*) FROM risk_flags WHERE flag_type = 'LEIE_MATCH'").fetchone()[0] == 0
+    assert conn.execute("SELECT DISTINCT flag_run_id FROM provider_rollup").fetchall() == [(1,)]
+
+    monkeypatch.undo()
+    publish_flag_run(conn, run_id)
+    assert conn.execute("SELECT DISTINCT flag_run_id FROM provider_rollup").fetchall() == [(run_id,)]
+    assert conn.execute("SELECT DISTINCT flag_run_id FROM provider_dossiers").fetchall() == [(run_id,)]
+    assert conn.execute("SELECT flag_type_counts['LEIE_MATCH'] FROM provider_rollup WHERE npi = 'M2'").fetchone()[0] == 1
+    conn.close()
+
+def test_old_runs_are_archived_with_their_diffs(tmp_settings, monkeypatch):
+    monkeypatch.setattr(settings, "FLAG_RUNS_KEPT", 2)
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    seed(conn)
+    conn.close()
+    calculate_benchmarks()
+    refresh_provider_features()
+    for _ in range(4):
+        screen_providers()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT run_id, status FROM flag_runs ORDER BY 1").fetchall() == [
+        (1, "archived"), (2, "archived"), (3, "published"), (4, "published")
+    ]
+    assert conn.execute("SELECT DISTINCT run_id FROM risk_flag_history ORDER BY 1").fetchall() == [(3,), (4,)]
+    assert conn.execute("SELECT COUNT(*) FROM risk_flags").fetchone()[0] == 2
+    assert conn.execute("SELECT npi, change_type FROM flag_run_diffs WHERE run_id = 1 ORDER BY 1").fetchall() == [
+        ("M1", "NEW"), ("M2", "NEW")
+    ]
+    conn.close()
+    publish_generation()
+
+    with TestClient(app) as client:
+        assert client.get("/api/changes", params={"since_run_id": 1}).status_code == 400
+        assert client.get("/api/changes", params={"since_run_id": 3}).json() == []
@@ -0,0 +1,186 @@
+import duckdb
+
+from src.config import settings
+from src.pipeline import init_db
+from src.ingestion.hhs_mirror import load_manifest, mirror_relation
+from src.ingestion.ledger import changed_periods
+from src.ingestion.scopes import CountyScope
+from scripts import filter_hhs_data
+from scripts.filter_hhs_data import filter_hhs_spend
+
+HEADER = "BILLING_PROVIDER_NPI_NUM,SERVICING_PROVIDER_NPI_NUM,HCPCS_CODE,CLAIM_FROM_MONTH,TOTAL_UNIQUE_BENEFICIARIES,TOTAL_CLAIMS,TOTAL_PAID\n"
+
+def synthetic_csv(rows):
+    return (HEADER + "".join(",".join(map(str, r)) + "\n" for r in rows)).encode()
+
+ROWS = [
+    (1000000001, 1000000001, "T1019", "2024-01", 10, 100, 5000.0),
+    (1000000001, 1000000001, "T1019", "2024-02", 12, 110, 5500.0),
+    (1000000002, 1000000002, "99213", "2024-01", 30, 40, 3200.0),
+    (1999999999, 1999999999, "99213", "2024-02", 5, 5, 400.0),  # out of scope
+]
+
+def seed_providers(npis):
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi) VALUES (?)", [[n] for n in npis])
+    conn.close()
+
+def spend_count():
+    conn = duckdb.connect(settings.DB_PATH)
+    count = conn.execute("SELECT COUNT(*) FROM medicaid_spend").fetchone()[0]
+    conn.close()
+    return count
+
+def test_mirror_converts_once_and_revalidates(tmp_settings, http_stand_in, monkeypatch):
+    url = http_stand_in.publish("/spend.csv", synthetic_csv(ROWS), etag='"v1"')
+    monkeypatch.setattr(settings, "HHS_SOURCE_URL", url)
+    init_db()
+    seed_providers(["1000000001", "1000000002"])
+
+    filter_hhs_spend()
+    assert spend_count() == 3
+    manifest = load_manifest()
+    assert manifest["etag"] == '"v1"'
+    assert manifest["months"] == {"2024-01": 2, "2024-02": 2}
+
+    # Unchanged source: revalidated with a 304, no second download or conversion
+    filter_hhs_spend()
+    assert spend_count() == 3
+    assert http_stand_in.full_downloads("/spend.csv") == 1
+    assert load_manifest()["converted_at"] == manifest["converted_at"]
+
+    # New release behind the same URL is picked up
+    http_stand_in.publish("/spend.csv", synthetic_csv(ROWS + [(1000000002, 1000000002, "99214", "2024-03", 3, 3, 300.0)]), etag='"v2"')
+    filter_hhs_spend()
+    assert spend_count() == 4
+    assert load_manifest()["months"]["2024-03"] == 1
+
+def test_mirror_relation_prunes_partitions(tmp_settings, http_stand_in, monkeypatch):
+    url = http_stand_in.publish("/spend.csv", synthetic_csv(ROWS), etag='"v1"')
+    monkeypatch.setattr(settings, "HHS_SOURCE_URL", url)
+    init_db()
+    filter_hhs_spend()
+
+    conn = duckdb.connect()
+    rows = conn.execute(f"SELECT DISTINCT CLAIM_FROM_MONTH FROM {mirror_relation(['2024-02'])}").fetchall()
+    conn.close()
+    assert rows == [("2024-02",)]
+
+def test_multi_county_fan_out_single_pass(tmp_settings, http_stand_in, monkeypatch):
+    url = http_stand_in.publish("/spend.csv", synthetic_csv(ROWS), etag='"v1"')
+    monkeypatch.setattr(settings, "HHS_SOURCE_URL", url)
+    init_db()
+    seed_providers(["1000000001", "1000000002"])
+
+    # 1000000001 bills in both counties, so its rows are routed to each of them
+    filter_hhs_spend([
+        CountyScope("WA", "CLARK", {"1000000001", "1000000002"}),
+        CountyScope("WA", "COWLITZ", {"1000000001"}),
+    ])
+
+    conn = duckdb.connect(settings.DB_PATH)
+    counts = dict(((s, c), n) for s, c, n in conn.execute(
+        "SELECT state, county, COUNT(*) FROM medicaid_spend GROUP BY 1, 2"
+    ).fetchall())
+    conn.close()
+    assert counts == {("WA", "CLARK"): 3, ("WA", "COWLITZ"): 2}
+
+def test_incremental_refresh_rewrites_only_changed_periods(tmp_settings, http_stand_in, monkeypatch):
+    url = http_stand_in.publish("/spend.csv", synthetic_csv(ROWS), etag='"v1"')
+    monkeypatch.setattr(settings, "HHS_SOURCE_URL", url)
+    init_db()
+    seed_providers(["1000000001", "1000000002"])
+
+    first_run = filter_hhs_spend()
+    conn = duckdb.connect(settings.DB_PATH)
+    assert [str(p) for p in changed_periods(conn)] == ["2024-01-01", "2024-02-01"]
+    january_rowids = conn.execute("SELECT rowid FROM medicaid_spend WHERE period = '2024-01-01' ORDER BY 1").fetchall()
+    conn.close()
+
+    # Same release and scope: the run is a no-op
+    assert filter_hhs_spend() == first_run
+
+    # New release restates February and adds March; January is untouched
+    revised = [r for r in ROWS if r[3] != "2024-02"] + [
+        (1000000001, 1000000001, "T1019", "2024-02", 12, 110, 9900.0),
+        (1000000002, 1000000002, "99214", "2024-03", 3, 3, 300.0),
+    ]
+    http_stand_in.publish("/spend.csv", synthetic_csv(revised), etag='"v2"')
+    second_run = filter_hhs_spend()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    changes = conn.execute("""
+        SELECT CAST(period AS VARCHAR), change_type FROM hhs_ingestion_changes
+        WHERE ingest_run_id = ? ORDER BY 1
+    """, [second_run]).fetchall()
+    assert changes == [("2024-02-01", "CHANGED"), ("2024-03-01", "NEW")]
+    assert [str(p) for p in changed_periods(conn, since_run_id=first_run)] == ["2024-02-01", "2024-03-01"]
+    assert conn.execute("SELECT rowid FROM medicaid_spend WHERE period = '2024-01-01' ORDER BY 1").fetchall() == january_rowids
+    assert conn.execute("SELECT total_paid FROM medicaid_spend WHERE period = '2024-02-01'").fetchall() == [(9900.0,)]
+    conn.close()
+
+def test_requested_months_only_touch_those_periods(tmp_settings, http_stand_in, monkeypatch):
+    url = http_stand_in.publish("/spend.csv", synthetic_csv(ROWS), etag='"v1"')
+    monkeypatch.setattr(settings, "HHS_SOURCE_URL", url)
+    init_db()
+    seed_providers(["1000000001", "1000000002"])
+    filter_hhs_spend()
+
+    # The release restates February and adds March, but only March is asked for
+    revised = [r for r in ROWS if r[3] != "2024-02"] + [
+        (1000000001, 1000000001, "T1019", "2024-02", 12, 110, 9900.0),
+        (1000000002, 1000000002, "99214", "2024-03", 3, 3, 300.0),
+    ]
+    http_stand_in.publish("/spend.csv", synthetic_csv(revised), etag='"v2"')
+    run_id = filter_hhs_spend(months=["2024-03", "2024-04"])
+
+    conn = duckdb.connect(settings.DB_PATH)
+    changes = conn.execute("""
+        SELECT CAST(period AS VARCHAR), change_type FROM hhs_ingestion_changes WHERE ingest_run_id = ?
+    """, [run_id]).fetchall()
+    assert changes == [("2024-03-01", "NEW")]
+    assert conn.execute("SELECT total_paid FROM medicaid_spend WHERE period = '2024-02-01'").fetchall() == [(5500.0,)]
+    assert conn.execute("SELECT COUNT(*) FROM medicaid_spend").fetchone()[0] == 4
+    conn.close()
+
+def test_unchanged_months_are_not_rescanned(tmp_settings, http_stand_in, monkeypatch):
+    # May only has rows for providers outside the scope
+    rows = ROWS + [(1999999999, 1999999999, "99213", "2024-05", 5, 5, 400.0)]
+    url = http_stand_in.publish("/spend.csv", synthetic_csv(rows), etag='"v1"')
+    monkeypatch.setattr(settings, "HHS_SOURCE_URL", url)
+    init_db()
+    seed_providers(["1000000001", "1000000002"])
+    first_run = filter_hhs_spend()
+
+    read_months = []
+    def recording_relation(months=None, mirror_dir=None):
+        read_months.append(months)
+        return mirror_relation(months, mirror_dir)
+    monkeypatch.setattr(filter_hhs_data, "mirror_relation", recording_relation)
+
+    # Every month, including the one without rows in scope, was compared under this checksum
+    assert filter_hhs_spend() == first_run
+    assert read_months == []
+
+    # A new release that only restates February reads only February's partition
+    revised = [r for r in rows if r[3] != "2024-02"] + [(1000000001, 1000000001, "T1019", "2024-02", 12, 110, 9900.0)]
+    http_stand_in.publish("/spend.csv", synthetic_csv(revised), etag='"v2"')
+    run_id = filter_hhs_spend()
+    assert read_months == [["2024-02"]]
+
+    conn = duckdb.connect(settings.DB_PATH)
+    changes = conn.execute("""
+        SELECT CAST(period AS VARCHAR), change_type FROM hhs_ingestion_changes WHERE ingest_run_id = ?
+    """, [run_id]).fetchall()
+    assert changes == [("2024-02-01", "CHANGED")]
+    conn.close()
+
+    # A restated out-of-scope month is compared once, without an empty ingestion run
+    http_stand_in.publish("/spend.csv", synthetic_csv(revised[:-2] + revised[-1:] + [
+        (1999999999, 1999999999, "99213", "2024-05", 6, 6, 480.0)]), etag='"v3"')
+    assert filter_hhs_spend() == run_id
+    assert filter_hhs_spend() == run_id
+    assert read_months == [["2024-02"], ["2024-05"]]
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM hhs_ingestion_runs").fetchone()[0] == 2
+    conn.close()
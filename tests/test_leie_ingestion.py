@@ -0,0 +1,81 @@
+import duckdb
+
+from src.config import settings
+from src.pipeline import init_db
+from src.ingestion.ingest_leie import main as ingest_leie
+
+HEADER = "LASTNAME,FIRSTNAME,MIDNAME,BUSNAME,GENERAL,SPECIALTY,UPIN,NPI,DOB,ADDRESS,CITY,STATE,ZIP,EXCLTYPE,EXCLDATE,REINDATE,WAIVERDATE,WVRSTATE\n"
+
+def leie_csv(rows):
+    return (HEADER + "".join(",".join(r) + "\n" for r in rows)).encode()
+
+def entry(last, npi, excl_date, rein_date="00000000"):
+    return [last, "PAT", "", "", "", "", "", npi, "19700101", "1 MAIN ST", "VANCOUVER", "WA", "98661",
+            "1128a1", excl_date, rein_date, "00000000", ""]
+
+SMITH = entry("SMITH", "1000000001", "20200101")
+JONES = entry("JONES", "1000000002", "20210101")
+NO_NPI = entry("DOE", "0000000000", "20220101")
+
+def excluded(conn):
+    return [r[0] for r in conn.execute("SELECT npi FROM providers WHERE is_excluded ORDER BY npi").fetchall()]
+
+def test_conditional_refresh_keyed_upsert_and_supplements(tmp_settings, http_stand_in, monkeypatch):
+    url = http_stand_in.publish("/UPDATED.csv", leie_csv([SMITH, SMITH, NO_NPI]), etag='"v1"')
+    monkeypatch.setattr(settings, "LEIE_URL", url)
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi) VALUES (?)", [["1000000001"], ["1000000002"], ["1000000003"]])
+    conn.close()
+
+    ingest_leie()
+    conn = duckdb.connect(settings.DB_PATH)
+    # Duplicate lines collapse onto one key, placeholder NPIs become NULL
+    assert conn.execute("SELECT COUNT(*), COUNT(npi) FROM leie_exclusions").fetchone() == (2, 1)
+    assert excluded(conn) == ["1000000001"]
+    conn.close()
+
+    # Unchanged list: revalidated, not downloaded or applied again
+    ingest_leie()
+    assert http_stand_in.full_downloads("/UPDATED.csv") == 1
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM leie_exclusions").fetchone()[0] == 2
+    conn.close()
+
+    # Monthly supplements: a new exclusion and a reinstatement
+    supplements = [
+        http_stand_in.publish("/2602EXCL.csv", leie_csv([JONES]), etag='"e1"'),
+        http_stand_in.publish("/2602REIN.csv", leie_csv([entry("SMITH", "1000000001", "20200101", "20260115")]), etag='"r1"'),
+    ]
+    monkeypatch.setattr(settings, "LEIE_SUPPLEMENT_URLS", supplements)
+    ingest_leie()
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT rein_date FROM leie_exclusions WHERE npi = '1000000001'").fetchone()[0] == "20260115"
+    assert excluded(conn) == ["1000000002"]
+    conn.close()
+
+    # Next full list no longer carries the reinstated entry
+    http_stand_in.publish("/UPDATED.csv", leie_csv([JONES, NO_NPI]), etag='"v2"')
+    ingest_leie()
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM leie_exclusions").fetchone()[0] == 2
+    assert excluded(conn) == ["1000000002"]
+    sources = conn.execute("SELECT url, kind, etag, row_count FROM leie_sources ORDER BY kind, url").fetchall()
+    conn.close()
+    assert sources == [(url, "full", '"v2"', 2), (supplements[0], "supplement", '"e1"', 1), (supplements[1], "supplement", '"r1"', 1)]
+    assert http_stand_in.full_downloads("/2602EXCL.csv") == 1
+
+def test_new_providers_pick_up_existing_exclusions(tmp_settings, http_stand_in, monkeypatch):
+    monkeypatch.setattr(settings, "LEIE_URL", http_stand_in.publish("/UPDATED.csv", leie_csv([SMITH]), etag='"v1"'))
+    init_db()
+    ingest_leie()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("INSERT INTO providers (npi) VALUES ('1000000001')")
+    conn.close()
+    ingest_leie()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    assert excluded(conn) == ["1000000001"]
+    conn.close()
+    assert http_stand_in.full_downloads("/UPDATED.csv") == 1
@@ -0,0 +1,141 @@
+import json
+
+import duckdb
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.leie_matching import match_leie_exclusions, soundex
+from src.ingestion.ingest_leie import LEIE_KEY_SQL
+
+LEIE_COLUMNS = ["last_name", "first_name", "mid_name", "bus_name", "npi", "dob", "address", "city", "state", "zip",
+                "excl_type", "excl_date", "rein_date"]
+
+def test_soundex():
+    assert [soundex(n) for n in ["Robert", "Rupert", "Ashcraft", "Tymczak", "Pfister", "Lee", ""]] == [
+        "R163", "R163", "A261", "T522", "P236", "L000", None
+    ]
+
+def seed(conn):
+    conn.executemany("""
+        INSERT INTO providers (npi, name, org_type, city, state, postal_code, practice_address, auth_official_name)
+        VALUES (?, ?, ?, ?, 'WA', ?, ?, ?)
+    """, [
+        ["1000000001", "JON SMITH", "NPI-1", "VANCOUVER", "98661", "100 MAIN ST", None],
+        ["1000000002", "JANE SMITH", "NPI-1", "SPOKANE", "99201", "5 ELM ST", None],
+        ["1000000003", "BRIGHT PATH HOME CARE LLC", "NPI-2", "VANCOUVER", "986821234", "9 OAK AVE", "MARIA GONZALES"],
+        ["1000000004", "EXCLUDED BY NPI CLINIC", "NPI-2", "CAMAS", "98607", None, None],
+        ["1000000005", "ALICE JOHNSON", "NPI-1", "VANCOUVER", "98661", None, None],
+    ])
+    conn.executemany(f"""
+        INSERT INTO leie_exclusions BY NAME
+        SELECT {LEIE_KEY_SQL} AS leie_key, * FROM (SELECT {', '.join(f'?::VARCHAR AS {c}' for c in LEIE_COLUMNS)})
+    """, [
+        # Same person, slightly different spelling, same zip
+        ["SMITH", "JOHN", "A", None, "0000000000", "19700101", "100 MAIN STREET", "VANCOUVER", "WA", "98661", "1128a1", "20200115", "00000000"],
+        # Runs an organization under a new NPI
+        ["GONZALEZ", "MARIA", None, None, "0", "19800202", "1 PINE", "VANCOUVER", "WA", "98684", "1128b4", "20210301", "00000000"],
+        # Business re-enrolled under a new name suffix
+        [None, None, None, "BRIGHT PATH HOME CARE, INC.", "0", None, "9 OAK AVENUE", "VANCOUVER", "WA", "98682", "1128b7", "20190501", "00000000"],
+        # Exact NPI
+        [None, None, None, "SOME OTHER NAME", "1000000004", None, None, "CAMAS", "WA", "98607", "1128b4", "20220101", "00000000"],
+        # Reinstated: ignored
+        ["JOHNSON", "ALICE", None, None, "0", None, None, "VANCOUVER", "WA", "98661", "1128b4", "20150101", "20180101"],
+        # Different person entirely, different state
+        ["SMITH", "JANE", None, None, "0", None, None, "MIAMI", "FL", "33101", "1128a1", "20200101", "00000000"],
+    ])
+
+def test_blocked_fuzzy_matches_and_flags(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    seed(conn)
+    conn.close()
+    calculate_benchmarks()
+
+    assert match_leie_exclusions() == 3
+
+    conn = duckdb.connect(settings.DB_PATH)
+    best = conn.execute("SELECT npi, match_type, score FROM leie_matches WHERE match_rank = 1 ORDER BY npi").fetchall()
+    assert [(npi, t) for npi, t, _ in best] == [
+        ("1000000001", "INDIVIDUAL"), ("1000000002", "INDIVIDUAL"), ("1000000003", "BUSINESS"), ("1000000004", "NPI")
+    ]
+    # Same surname and first-name sound in the same state, but a different first name and city: kept for review, not flagged
+    assert best[1][2] < settings.LEIE_MATCH_FLAG_SCORE
+    # Both the organization's name and its official match, as separate candidates
+    assert sorted(r[0] for r in conn.execute("SELECT match_type FROM leie_matches WHERE npi = '1000000003'").fetchall()) == [
+        "AUTH_OFFICIAL", "BUSINESS"
+    ]
+    evidence = json.loads(conn.execute("SELECT evidence FROM leie_matches WHERE npi = '1000000001'").fetchone()[0])
+    assert evidence["leie_name"] == "JOHN A SMITH" and "surname_zip3" in evidence["blocks"]
+    assert evidence["leie_dob"] == "19700101"
+    # Reinstated entries never match
+    assert conn.execute("SELECT COUNT(*) FROM leie_matches WHERE npi = '1000000005'").fetchone()[0] == 0
+
+    flags = conn.execute("SELECT npi, reason FROM risk_flags WHERE flag_type = 'LEIE_MATCH' ORDER BY npi").fetchall()
+    conn.close()
+    assert [npi for npi, _ in flags] == ["1000000001", "1000000003", "1000000004"]
+    assert flags[2][1].startswith("NPI listed on the OIG exclusion list")
+
+def test_suffixes_and_credentials_do_not_break_surname_blocking(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("""
+        INSERT INTO providers (npi, name, org_type, city, state, postal_code, practice_address, mailing_address, auth_official_name)
+        VALUES (?, ?, ?, 'VANCOUVER', 'WA', '98661', '100 MAIN ST', '100 MAIN ST', ?)
+    """, [
+        ["1000000011", "JOHN SMITH JR", "NPI-1", None],
+        ["1000000012", "DR JANE DOE, M.D.", "NPI-1", None],
+        ["1000000013", "ANH DO", "NPI-1", None],
+        ["1000000014", "RIVER CLINIC LLC", "NPI-2", "ROBERT BROWN III, PHD"],
+    ])
+    conn.executemany(f"""
+        INSERT INTO leie_exclusions BY NAME
+        SELECT {LEIE_KEY_SQL} AS leie_key, * FROM (SELECT {', '.join(f'?::VARCHAR AS {c}' for c in LEIE_COLUMNS)})
+    """, [
+        [last, first, None, None, "0", None, "100 MAIN ST", "VANCOUVER", "WA", "98661", "1128a1", "20200115", "00000000"]
+        for last, first in [("SMITH", "JOHN"), ("DOE", "JANE"), ("DO", "ANH"), ("BROWN", "ROBERT")]
+    ])
+    conn.close()
+    calculate_benchmarks()
+
+    match_leie_exclusions()
+    conn = duckdb.connect(settings.DB_PATH)
+    best = conn.execute("SELECT npi, match_type, score FROM leie_matches WHERE match_rank = 1 ORDER BY npi").fetchall()
+    conn.close()
+    assert [(npi, t) for npi, t, _ in best] == [
+        ("1000000011", "INDIVIDUAL"), ("1000000012", "INDIVIDUAL"), ("1000000013", "INDIVIDUAL"), ("1000000014", "AUTH_OFFICIAL")
+    ]
+    assert all(score >= settings.LEIE_MATCH_FLAG_SCORE for _, _, score in best)
+
+def test_namesakes_need_a_second_signal_to_be_flagged(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("""
+        INSERT INTO providers (npi, name, org_type, city, state, postal_code, practice_address)
+        VALUES (?, ?, 'NPI-1', 'VANCOUVER', 'WA', ?, ?)
+    """, [
+        ["1000000021", "MARY JONES", "98661", "1 ELM ST"],
+        ["1000000022", "DAVID R LEE", "98662", None],
+    ])
+    conn.executemany(f"""
+        INSERT INTO leie_exclusions BY NAME
+        SELECT {LEIE_KEY_SQL} AS leie_key, * FROM (SELECT {', '.join(f'?::VARCHAR AS {c}' for c in LEIE_COLUMNS)})
+    """, [
+        # Same name in the same zip3, nothing else agrees
+        ["JONES", "MARY", None, None, "0", "19650303", "77 PARK AVE", "VANCOUVER", "WA", "98664", "1128a1", "20200115", "00000000"],
+        # Same name and middle initial
+        ["LEE", "DAVID", "ROY", None, "0", None, None, "VANCOUVER", "WA", "98664", "1128a1", "20200115", "00000000"],
+    ])
+    conn.close()
+    calculate_benchmarks()
+
+    assert match_leie_exclusions() == 1
+    conn = duckdb.connect(settings.DB_PATH)
+    best = dict(conn.execute("SELECT npi, score FROM leie_matches WHERE match_rank = 1").fetchall())
+    evidence = json.loads(conn.execute("SELECT evidence FROM leie_matches WHERE npi = '1000000021'").fetchone()[0])
+    flags = conn.execute("SELECT npi FROM risk_flags WHERE flag_type = 'LEIE_MATCH'").fetchall()
+    conn.close()
+    # Kept for review just under the threshold
+    assert settings.LEIE_MATCH_MIN_SCORE <= best["1000000021"] < settings.LEIE_MATCH_FLAG_SCORE
+    assert evidence["corroborated"] is False
+    assert flags == [("1000000022",)]
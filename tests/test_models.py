@@ -0,0 +1,106 @@
+import random
+
+import duckdb
+import pytest
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.features import refresh_provider_features
+from src.analysis.models import run_ml_analysis
+
+def seed_providers(count=60):
+    rng = random.Random(3)
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, taxonomy_desc) VALUES (?, 'Home Health')",
+                     [[f"N{i:03d}"] for i in range(count)])
+    for i in range(count):
+        for month in (1, 2, 3):
+            claims = rng.randint(20, 60)
+            conn.execute("""
+                INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+                VALUES (?, 'T1019', ?, ?, ?, ?)
+            """, [f"N{i:03d}", f"2024-0{month}-01", claims * rng.uniform(80, 120), claims, rng.randint(5, 15)])
+    conn.close()
+
+def test_score_mode_reuses_registered_model(tmp_settings, capsys):
+    init_db()
+    seed_providers()
+    calculate_benchmarks()
+    refresh_provider_features()
+
+    with pytest.raises(RuntimeError):
+        run_ml_analysis(mode="score")
+
+    run_ml_analysis()
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT model_name, version, training_rows FROM model_registry").fetchall() == [("isolation_forest", 1, 60)]
+    assert conn.execute("SELECT COUNT(*) FROM ml_scores").fetchone()[0] == 60
+    scores = conn.execute("SELECT flag_score FROM risk_flags WHERE flag_type = 'ML_ISOLATION_FOREST'").fetchall()
+    assert 0 < len(scores) <= 3
+    assert all(0 < s < 1 for (s,) in scores)
+
+    # One provider's history changes: only that provider is rescored, by the same model
+    conn.execute("UPDATE medicaid_spend SET total_paid = total_paid * 50 WHERE billing_npi = 'N007'")
+    conn.close()
+    refresh_provider_features(full=True)
+    capsys.readouterr()
+    run_ml_analysis(mode="score")
+    assert "Scoring 1 new or changed providers with isolation_forest v1" in capsys.readouterr().out
+
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM model_registry").fetchone()[0] == 1
+    assert conn.execute("SELECT is_outlier FROM ml_scores WHERE npi = 'N007'").fetchone()[0]
+    conn.close()
+
+    # A retrain registers a new version and rescores everyone
+    run_ml_analysis(mode="train")
+    assert "Scoring 60 new or changed providers with isolation_forest v2" in capsys.readouterr().out
+
+def test_auto_mode_retrains_on_params_drift_and_age(tmp_settings, monkeypatch, capsys):
+    init_db()
+    seed_providers()
+    calculate_benchmarks()
+    refresh_provider_features()
+    run_ml_analysis(mode="auto")
+
+    # Same features as the registered model was trained on: nothing to refit or rescore
+    capsys.readouterr()
+    run_ml_analysis(mode="auto")
+    assert "Scoring 0 new or changed providers with isolation_forest v1" in capsys.readouterr().out
+
+    # One provider changes: rescored by the same model, no refit
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("UPDATE medicaid_spend SET total_paid = total_paid * 50 WHERE billing_npi = 'N007'")
+    conn.close()
+    refresh_provider_features(full=True)
+    run_ml_analysis(mode="auto")
+    assert "Scoring 1 new or changed providers with isolation_forest v1" in capsys.readouterr().out
+
+    # A different contamination refits and rescores everyone
+    monkeypatch.setattr(settings, "ML_CONTAMINATION", 0.10)
+    run_ml_analysis(mode="auto")
+    out = capsys.readouterr().out
+    assert "isolation_forest v1 was trained with different parameters" in out
+    assert "Scoring 60 new or changed providers with isolation_forest v2" in out
+
+    # Drift past ML_RETRAIN_DRIFT (a third of the providers) refits
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("UPDATE medicaid_spend SET total_paid = total_paid * 2 WHERE billing_npi < 'N020'")
+    conn.close()
+    refresh_provider_features(full=True)
+    run_ml_analysis(mode="auto")
+    out = capsys.readouterr().out
+    assert "isolation_forest v2 was trained before 33% of providers' features changed" in out
+    assert "Scoring 60 new or changed providers with isolation_forest v3" in out
+
+    # So does a model past ML_MAX_MODEL_AGE_DAYS
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("UPDATE model_registry SET trained_at = trained_at - INTERVAL 120 DAY WHERE version = 3")
+    conn.close()
+    run_ml_analysis(mode="auto")
+    assert "isolation_forest v3 is 120 days old" in capsys.readouterr().out
+
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT MAX(version) FROM model_registry").fetchone()[0] == 4
+    conn.close()
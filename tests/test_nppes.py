@@ -0,0 +1,183 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import duckdb
+import pytest
+
+from src.config import settings
+from src.pipeline import init_db
+from src.ingestion.nppes import NPPESCache, NPPESClient, TokenBucket
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.flag_runs import claim_flag_types, publish_flag_run, start_flag_run
+from scripts.enrich_providers_batch import main as enrich_batch
+
+def nppes_result(npi):
+    return {
+        "number": npi,
+        "enumeration_type": "NPI-2",
+        "basic": {
+            "organization_name": f"PROVIDER {npi}",
+            "authorized_official_first_name": "JANE",
+            "authorized_official_last_name": "DOE",
+            "authorized_official_title_or_position": "CEO",
+        },
+        "taxonomies": [{"desc": "Home Health", "primary": True}],
+        "addresses": [
+            {"address_purpose": "LOCATION", "city": "VANCOUVER", "state": "WA", "postal_code": "98660"},
+            {"address_purpose": "MAILING", "address_1": "1 MAIN ST", "city": "VANCOUVER", "state": "WA", "postal_code": "98660"},
+        ],
+    }
+
+class FakeNPPES:
+    """Local stand-in for the NPPES API; answers ?number= lookups and can throttle."""
+
+    def __init__(self, throttle_once=()):
+        self.hits = []
+        self.throttle = set(throttle_once)
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                params = parse_qs(urlparse(self.path).query)
+                npi = params.get("number", [""])[0]
+                fake.hits.append((time.monotonic(), npi))
+                if npi in fake.throttle:
+                    fake.throttle.discard(npi)
+                    self.send_response(429)
+                    self.send_header("Retry-After", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps({"results": [nppes_result(npi)]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/api/"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def fake_nppes():
+    server = FakeNPPES(throttle_once={"1000000003"})
+    yield server
+    server.close()
+
+def test_token_bucket_holds_rate():
+    bucket = TokenBucket(rate=100)
+    start = time.monotonic()
+    for _ in range(21):
+        bucket.acquire()
+    # first token is free, the next 20 arrive at 100/s
+    assert time.monotonic() - start >= 0.19
+
+def test_concurrent_enrichment_retries_and_bulk_writes(tmp_settings, fake_nppes):
+    init_db()
+    npis = [str(1000000000 + i) for i in range(40)]
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi) VALUES (?)", [[n] for n in npis])
+    conn.close()
+
+    rate = 100.0
+    client = NPPESClient(base_url=fake_nppes.url, rate=rate, concurrency=8, backoff=0.01)
+    start = time.monotonic()
+    enrich_batch(batch_size=len(npis), client=client)
+    elapsed = time.monotonic() - start
+    client.close()
+
+    # 40 lookups + 1 throttled retry, paced by the bucket but close to the allowed rate
+    assert len(fake_nppes.hits) == 41
+    assert elapsed >= 40 / rate * 0.9
+    assert elapsed < 40 / rate * 3
+
+    conn = duckdb.connect(settings.DB_PATH)
+    enriched = conn.execute("""
+        SELECT COUNT(*) FROM providers
+        WHERE auth_official_name = 'JANE DOE' AND taxonomy_desc = 'Home Health' AND mailing_address = '1 MAIN ST'
+    """).fetchone()[0]
+    conn.close()
+    assert enriched == 40
+
+def test_cache_serves_fresh_entries_without_network(tmp_settings, fake_nppes):
+    npis = [str(1000000100 + i) for i in range(5)]
+    client = NPPESClient(base_url=fake_nppes.url, rate=1000)
+    assert all(d for _, d in client.lookup_many(npis))
+    client.close()
+    assert len(fake_nppes.hits) == 5
+
+    # A new client (e.g. a different script) shares the on-disk cache
+    client = NPPESClient(base_url=fake_nppes.url, rate=1000)
+    details = dict(client.lookup_many(npis))
+    client.close()
+    assert len(fake_nppes.hits) == 5
+    assert client.stats["hits"] == 5 and client.stats["requests"] == 0
+    assert details[npis[0]]["name"] == f"PROVIDER {npis[0]}"
+
+def test_cache_serves_stale_and_revalidates(tmp_settings, fake_nppes):
+    warm = NPPESClient(base_url=fake_nppes.url, rate=1000)
+    warm.lookup_npi("1000000200")
+    warm.close()
+
+    # Past the TTL but inside the stale window: answer immediately, refresh behind the scenes
+    client = NPPESClient(base_url=fake_nppes.url, rate=1000, cache=NPPESCache(ttl_days=0, stale_days=1))
+    assert client.lookup_npi("1000000200")["npi"] == "1000000200"
+    client.close()
+    assert client.stats["stale_hits"] == 1
+    assert client.stats["revalidated"] == 1
+    assert len(fake_nppes.hits) == 2
+
+def test_batch_enrichment_refetches_stale_entries(tmp_settings, fake_nppes):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("INSERT INTO providers (npi) VALUES ('1000000300')")
+    conn.close()
+    warm = NPPESClient(base_url=fake_nppes.url, rate=1000)
+    warm.lookup_npi("1000000300")
+    warm.close()
+
+    # The batch stamps rows as just updated, so it must not write a stale payload
+    client = NPPESClient(base_url=fake_nppes.url, rate=1000, cache=NPPESCache(ttl_days=0, stale_days=1))
+    enrich_batch(batch_size=10, client=client)
+    assert client.stats["stale_hits"] == 0
+    assert client.stats["revalidated"] == 1
+    assert len(fake_nppes.hits) == 2
+
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT name FROM providers WHERE npi = '1000000300'").fetchone()[0] == "PROVIDER 1000000300"
+    conn.close()
+
+def test_enrichment_refreshes_rollup_and_dossiers(tmp_settings, fake_nppes):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi) VALUES (?)", [["1000000400"], ["1000000401"]])
+    conn.close()
+    calculate_benchmarks()
+    conn = duckdb.connect(settings.DB_PATH)
+    run_id = start_flag_run(conn)
+    conn.execute("INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason) VALUES (?, '1000000400', 'LEIE_MATCH', 1.0, 'Excluded')", [run_id])
+    claim_flag_types(conn, run_id, ["LEIE_MATCH"])
+    publish_flag_run(conn, run_id)
+    conn.close()
+
+    client = NPPESClient(base_url=fake_nppes.url, rate=1000)
+    enrich_batch(batch_size=10, client=client)
+    client.close()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT npi, name FROM provider_rollup ORDER BY dashboard_rank").fetchall() == [
+        ("1000000400", "PROVIDER 1000000400"), ("1000000401", "PROVIDER 1000000401")
+    ]
+    dossier = json.loads(conn.execute("SELECT dossier FROM provider_dossiers WHERE npi = '1000000400'").fetchone()[0])
+    conn.close()
+    assert dossier["details"]["auth_official_name"] == "JANE DOE"
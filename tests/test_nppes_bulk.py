@@ -0,0 +1,90 @@
+import csv
+
+import duckdb
+
+from src.config import settings
+from src.pipeline import init_db
+from src.ingestion.nppes_bulk import load_bulk_roster
+from src.ingestion.scopes import scope_npi_path
+
+BULK_COLUMNS = [
+    "NPI", "Entity Type Code", "Provider Organization Name (Legal Business Name)",
+    "Provider Last Name (Legal Name)", "Provider First Name",
+    "Provider First Line Business Mailing Address", "Provider Business Mailing Address City Name",
+    "Provider Business Mailing Address State Name", "Provider Business Mailing Address Postal Code",
+    "Provider First Line Business Practice Location Address", "Provider Business Practice Location Address City Name",
+    "Provider Business Practice Location Address State Name", "Provider Business Practice Location Address Postal Code",
+    "NPI Deactivation Date", "NPI Reactivation Date",
+    "Authorized Official Last Name", "Authorized Official First Name",
+    "Authorized Official Title or Position", "Authorized Official Telephone Number",
+] + [c for i in range(1, 16) for c in (f"Healthcare Provider Taxonomy Code_{i}", f"Healthcare Provider Primary Taxonomy Switch_{i}")]
+
+def bulk_row(npi, zip_code, state="WA", org=None, first=None, last=None, taxonomies=(), deactivated=False):
+    row = dict.fromkeys(BULK_COLUMNS, "")
+    row.update({
+        "NPI": npi, "Entity Type Code": "2" if org else "1",
+        "Provider Organization Name (Legal Business Name)": org or "",
+        "Provider First Name": first or "", "Provider Last Name (Legal Name)": last or "",
+        "Provider First Line Business Practice Location Address": "100 MAIN ST",
+        "Provider Business Practice Location Address City Name": "VANCOUVER",
+        "Provider Business Practice Location Address State Name": state,
+        "Provider Business Practice Location Address Postal Code": zip_code + "1234",
+        "Provider First Line Business Mailing Address": "PO BOX 1",
+        "Provider Business Mailing Address City Name": "PORTLAND",
+        "Provider Business Mailing Address State Name": "OR",
+        "Provider Business Mailing Address Postal Code": "97201",
+        "NPI Deactivation Date": "01/01/2020" if deactivated else "",
+    })
+    if org:
+        row.update({"Authorized Official First Name": "JANE", "Authorized Official Last Name": "DOE",
+                    "Authorized Official Title or Position": "CEO"})
+    for i, (code, primary) in enumerate(taxonomies, start=1):
+        row[f"Healthcare Provider Taxonomy Code_{i}"] = code
+        row[f"Healthcare Provider Primary Taxonomy Switch_{i}"] = "Y" if primary else "N"
+    return row
+
+def test_bulk_roster_loads_scoped_providers(tmp_settings, tmp_path):
+    bulk_path = tmp_path / "npidata.csv"
+    with open(bulk_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=BULK_COLUMNS)
+        writer.writeheader()
+        writer.writerow(bulk_row("1000000001", "98660", org="ACME HOME CARE", taxonomies=[("261QM0801X", False), ("251E00000X", True)]))
+        writer.writerow(bulk_row("1000000002", "98661", first="ANNA", last="SMITH", taxonomies=[("207Q00000X", True)]))
+        writer.writerow(bulk_row("1000000003", "98501", first="OUT", last="OFZIP"))
+        writer.writerow(bulk_row("1000000004", "98660", state="OR", first="OUT", last="OFSTATE"))
+        writer.writerow(bulk_row("1000000005", "98660", first="GONE", last="AWAY", deactivated=True))
+    taxonomy_path = tmp_path / "nucc.csv"
+    taxonomy_path.write_text(
+        "Code,Grouping,Classification,Specialization\n"
+        "251E00000X,Agencies,Home Health,\n"
+        "207Q00000X,Allopathic,Family Medicine,\n"
+        "261QM0801X,Ambulatory,Clinic/Center,Mental Health\n"
+    )
+
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("INSERT INTO providers (npi, name) VALUES ('1000000002', 'OLD NAME')")
+    conn.close()
+
+    written = load_bulk_roster(zips=["98660", "98661"], state="WA", csv_path=str(bulk_path),
+                               taxonomy_path=str(taxonomy_path), scope_county="CLARK")
+    assert written == 2
+
+    conn = duckdb.connect(settings.DB_PATH)
+    rows = conn.execute("""
+        SELECT npi, name, taxonomy_desc, org_type, practice_address, mailing_city, auth_official_name
+        FROM providers ORDER BY npi
+    """).fetchall()
+    conn.close()
+    assert rows == [
+        ("1000000001", "ACME HOME CARE", "Home Health", "NPI-2", "100 MAIN ST", "PORTLAND", "JANE DOE"),
+        ("1000000002", "ANNA SMITH", "Family Medicine", "NPI-1", "100 MAIN ST", "PORTLAND", None),
+    ]
+    assert open(scope_npi_path("CLARK")).read() == '["1000000001", "1000000002"]'
+
+    # The dashboard rollup picks up the new names
+    conn = duckdb.connect(settings.DB_PATH)
+    assert conn.execute("SELECT npi, name FROM provider_rollup ORDER BY npi").fetchall() == [
+        ("1000000001", "ACME HOME CARE"), ("1000000002", "ANNA SMITH")
+    ]
+    conn.close()
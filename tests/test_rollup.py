@@ -0,0 +1,45 @@
+import duckdb
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.features import refresh_provider_features
+from src.analysis.flag_runs import claim_flag_types, publish_flag_run, start_flag_run
+
+def test_rollup_in_dashboard_order(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, name, taxonomy_desc, is_excluded) VALUES (?, ?, 'Clinic', ?)",
+                     [["A", "ALPHA", False], ["B", "BETA", True], ["C", "GAMMA", False], ["D", "DELTA", False]])
+    conn.executemany("""
+        INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+        VALUES (?, ?, ?, ?, 10, 5)
+    """, [["A", "99213", "2024-01-01", 100.0], ["A", "99214", "2024-03-01", 50.0],
+          ["B", "99213", "2024-01-01", 900.0], ["C", "99213", "2024-02-01", 5000.0]])
+    conn.close()
+    calculate_benchmarks()
+    refresh_provider_features()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    run_id = start_flag_run(conn)
+    conn.executemany("INSERT INTO risk_flag_history (run_id, npi, flag_type, flag_score, reason) VALUES (?, ?, ?, ?, 'x')", [
+        [run_id, "A", "PRICE_OUTLIER", 6.0], [run_id, "A", "PRICE_OUTLIER", 8.0],
+        [run_id, "B", "LEIE_MATCH", 1.0], [run_id, "B", "CLAIM_MILL_RATIO", 50.0],
+        [run_id, "C", "PRICE_OUTLIER", 7.0],
+    ])
+    claim_flag_types(conn, run_id, ["PRICE_OUTLIER", "LEIE_MATCH", "CLAIM_MILL_RATIO"])
+    publish_flag_run(conn, run_id)
+
+    rows = conn.execute("""
+        SELECT dashboard_rank, npi, flag_count, flag_type_counts, max_flag_score, total_spend,
+               first_period::VARCHAR, last_period::VARCHAR, is_excluded, flag_run_id
+        FROM provider_rollup ORDER BY dashboard_rank
+    """).fetchall()
+    conn.close()
+    # Same flag count: higher spend first. Unflagged providers come last.
+    assert rows == [
+        (1, "B", 2, {"CLAIM_MILL_RATIO": 1, "LEIE_MATCH": 1}, 50.0, 900.0, "2024-01-01", "2024-01-01", True, run_id),
+        (2, "A", 2, {"PRICE_OUTLIER": 2}, 8.0, 150.0, "2024-01-01", "2024-03-01", False, run_id),
+        (3, "C", 1, {"PRICE_OUTLIER": 1}, 7.0, 5000.0, "2024-02-01", "2024-02-01", False, run_id),
+        (4, "D", 0, None, None, None, None, None, False, run_id),
+    ]
@@ -0,0 +1,97 @@
+import duckdb
+
+from src.config import settings
+from src.pipeline import init_db
+from src.analysis.benchmarks import calculate_benchmarks
+from src.analysis.features import refresh_provider_features
+from src.analysis.flag_runs import start_flag_run
+from src.analysis.rules import RULES, evaluate_rules, screen_providers
+from src.analysis.sketches import QuantileSketch, register_sketch_functions
+
+def seed(rows, providers):
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, name, taxonomy_desc) VALUES (?, ?, ?)", providers)
+    conn.executemany("""
+        INSERT INTO medicaid_spend (billing_npi, hcpcs_code, period, total_paid, total_claims, unique_beneficiaries)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.close()
+
+def test_fused_rules_flag_each_screen(tmp_settings, monkeypatch):
+    # Small peer groups: loosen thresholds so a single outlier can clear them
+    monkeypatch.setattr(settings, "Z_SCORE_THRESHOLD", 2.5)
+    monkeypatch.setattr(settings, "VOLUME_OUTLIER_MULTIPLIER", 3.0)
+    init_db()
+
+    peers = [f"P0{i}" for i in range(1, 10)]
+    providers = [[n, f"PEER {n}", "Home Health"] for n in peers] + [
+        ["P99", "PRICEY HOME CARE", "Home Health"],
+        ["V1", "BUSY HOME CARE", "Home Health"],
+        ["M1", "MILL CLINIC", "Clinic"],
+        ["S1", "NEW CLINIC", "Clinic"],
+        ["T1", "RIDES LLC", "Non-emergency Medical Transport (NEMT)"],
+    ]
+    rows = []
+    for n in peers:
+        rows.append([n, "T1019", "2024-01-01", 100 * (95.0 + int(n[1:])), 100, 10])
+        rows.append([n, "T1020", "2024-01-01", 50 * 100.0, 50, 10])
+    rows += [
+        ["P99", "T1019", "2024-01-01", 100 * 2000.0, 100, 50],
+        ["V1", "T1020", "2024-01-01", 2000 * 100.0, 2000, 200],
+        ["M1", "99213", "2024-01-01", 20000.0, 1000, 10],
+        ["S1", "H2019", "2024-01-01", 2_000_000.0, 100, 100],
+        ["T1", "A0130", "2024-01-01", 2_000_000.0, 100, 100],
+    ]
+    seed(rows, providers)
+
+    calculate_benchmarks()
+
+    refresh_provider_features()
+    screen_providers()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    flags = conn.execute("SELECT npi, flag_type, flag_score, reason FROM risk_flags").fetchall()
+    conn.close()
+
+    found = {(npi, flag_type) for npi, flag_type, _, _ in flags}
+    assert found == {
+        ("P99", "PRICE_Z_SCORE_OUTLIER"), ("P99", "PERCENTILE_OUTLIER"), ("P99", "ROBUST_Z_OUTLIER"),
+        ("V1", "VOLUME_OUTLIER"), ("V1", "PERCENTILE_OUTLIER"),
+        ("M1", "CLAIM_MILL_RATIO"),
+        ("S1", "SUDDEN_UTILIZATION"), ("S1", "EXTREME_CONCENTRATION"),
+        ("T1", "SUDDEN_UTILIZATION"),
+    }
+    assert {r.flag_type for r in RULES} == {flag_type for _, flag_type in found}
+
+    by_key = {(npi, flag_type): (score, reason) for npi, flag_type, score, reason in flags}
+    score, reason = by_key[("M1", "CLAIM_MILL_RATIO")]
+    assert score == 100.0
+    assert reason == "Patient Density Risk: Billed 1000 claims to only 10 patients for code 99213 (100.0 claims/patient)"
+    assert by_key[("S1", "EXTREME_CONCENTRATION")][0] == 1.0
+    # Top of a 10-row peer group, as PERCENT_RANK would rank it
+    score, reason = by_key[("P99", "PERCENTILE_OUTLIER")]
+    assert score == 1.0
+    assert reason == "Statistical Persistence: This provider is in the top 0.0% of all Home Health providers for code T1019 by total spend."
+
+def test_percentile_outlier_confirms_rank_near_the_floor(tmp_settings):
+    init_db()
+    values = [float(v) for v in range(60000, 60200)]
+    blob = QuantileSketch().update(values).to_bytes()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("INSERT INTO providers (npi, name) VALUES ('BELOW', 'BELOW HOME CARE'), ('TOP', 'TOP HOME CARE')")
+    register_sketch_functions(conn)
+    run_id = start_flag_run(conn)
+    # An interpolated floor can sit a little under the true 99th percentile
+    conn.execute("""
+        CREATE TEMP TABLE near_floor AS
+        SELECT npi AS billing_npi, total_paid, 60150.0 AS paid_rank_floor, ?::BLOB AS paid_sketch,
+               'Home Health' AS taxonomy_desc, 'T1019' AS hcpcs_code
+        FROM (VALUES ('BELOW', 60190.0), ('TOP', 60199.0)) t(npi, total_paid)
+    """, [blob])
+    rule = next(r for r in RULES if r.flag_type == "PERCENTILE_OUTLIER")
+    evaluate_rules(conn, [rule], "near_floor", run_id)
+    flagged = conn.execute("SELECT npi FROM risk_flag_history WHERE run_id = ?", [run_id]).fetchall()
+    conn.close()
+
+    assert flagged == [("TOP",)]
@@ -0,0 +1,64 @@
+import duckdb
+import pandas as pd
+import pytest
+
+from src.config import settings
+from src.dag import Dag, Stage, StageFailed
+from src.instrumentation import ProfiledConnection, StageProfile, connect
+from src.pipeline import init_db
+from src.run_ledger import compare_queries, compare_stages, main
+
+def copy_source():
+    conn = connect(settings.DB_PATH)
+    frame = pd.DataFrame({"id": [3, 4, 5]})
+    conn.execute("CREATE OR REPLACE TABLE copied AS SELECT * FROM source UNION ALL SELECT id, id * 10 FROM frame")
+    conn.execute("SELECT COUNT(*) FROM copied").fetchone()
+    conn.close()
+
+def broken():
+    raise RuntimeError("broken")
+
+@pytest.fixture
+def ledger_db(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.execute("CREATE TABLE source (id INTEGER, value INTEGER)")
+    conn.execute("INSERT INTO source VALUES (1, 10), (2, 20)")
+    conn.close()
+
+def test_stage_profile_collects_query_profiles(ledger_db):
+    assert not isinstance(connect(settings.DB_PATH), ProfiledConnection)
+
+    profile = StageProfile("copy")
+    with profile.measure():
+        copy_source()
+    assert [q["query"].split()[0] for q in profile.queries] == ["CREATE", "SELECT"]
+    create = profile.queries[0]
+    assert create["rows_written"] == 5 and create["rows_read"] >= 2
+    assert '"children"' in create["profile"]
+    assert profile.wall_seconds > 0 and profile.peak_rss_bytes > 0
+
+def test_runs_are_recorded_and_compared(ledger_db, capsys):
+    dag = Dag([Stage("copy", copy_source, tables=["source"]), Stage("after", print, deps=["copy"], volatile=True)])
+    dag.run()
+    dag.run()
+    with pytest.raises(StageFailed):
+        Dag([Stage("copy", broken, volatile=True)]).run()
+
+    conn = duckdb.connect(settings.DB_PATH)
+    runs = conn.execute("SELECT run_id, status, args FROM pipeline_runs ORDER BY run_id").fetchall()
+    assert [r[:2] for r in runs] == [(1, "succeeded"), (2, "succeeded"), (3, "failed")]
+    stages = conn.execute("SELECT run_id, stage, status, rows_written, queries FROM pipeline_run_stages ORDER BY run_id, stage").fetchall()
+    assert (1, "copy", "ran", 5, 2) in stages and (2, "copy", "skipped", 0, 0) in stages and (3, "copy", "failed", 0, 0) in stages
+
+    compared = compare_stages(conn, 1, 2).set_index("stage")
+    assert compared.loc["copy", "status_a"] == "ran" and compared.loc["copy", "status_b"] == "skipped"
+    changed = compare_queries(conn, 1, 2)
+    assert changed["query"].str.startswith("CREATE OR REPLACE TABLE copied").any()
+    conn.close()
+
+    main(["compare"])
+    out = capsys.readouterr().out
+    assert "Run 2 (a) vs run 3 (b)" in out and "failed" in out
+    main(["queries", "1", "--stage", "copy", "--profile", "1"])
+    assert '"operator_type"' in capsys.readouterr().out
@@ -0,0 +1,38 @@
+import duckdb
+
+from src.config import settings
+from src.pipeline import init_db
+from src.ingestion.crosswalk import load_crosswalk, zips_for_county
+from src.ingestion.scopes import load_county_scopes
+
+def test_crosswalk_resolves_every_county_to_npis(tmp_settings, tmp_path, monkeypatch):
+    crosswalk = tmp_path / "zip_county.csv"
+    crosswalk.write_text(
+        "ZIP,STATE,COUNTY,RATIO\n"
+        "98660,WA,Clark County,1.0\n"
+        "98629,WA,Clark County,0.8\n"
+        "98629,WA,Cowlitz County,0.2\n"  # straddling zip goes to its majority county
+        "98632,WA,Cowlitz County,1.0\n"
+        "98501,WA,Thurston County,1.0\n"
+    )
+    init_db()
+    assert load_crosswalk(str(crosswalk)) == 5
+
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, state, postal_code) VALUES (?, 'WA', ?)", [
+        ["1000000001", "986601234"],
+        ["1000000002", "98629"],
+        ["1000000003", "986320000"],
+        ["1000000004", None],
+    ])
+    assert zips_for_county(conn, "WA", "COWLITZ") == ["98632"]
+
+    monkeypatch.setattr(settings, "MONITORED_COUNTIES", ["WA:*"])
+    scopes = {(s.state, s.county): s.npis for s in load_county_scopes(conn)}
+    conn.close()
+
+    # Thurston has no providers yet and no saved NPI list, so it is skipped
+    assert scopes == {
+        ("WA", "CLARK"): {"1000000001", "1000000002"},
+        ("WA", "COWLITZ"): {"1000000003"},
+    }
@@ -0,0 +1,65 @@
+import duckdb
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.pipeline import init_db
+from src.api.cache import publish_generation
+from src.api.main import app
+from src.api.search import SearchIndex
+
+PROVIDERS = [
+    ["1234567890", "VANCOUVER FAMILY MEDICINE", "VANCOUVER", "JANE DOE"],
+    ["1234500000", "CAMAS PEDIATRICS", "CAMAS", "JOHN SMITH"],
+    ["1999999999", "SMITHSON HOME HEALTH LLC", "BATTLE GROUND", "ANA LOPEZ"],
+    ["1888888888", "RIVERVIEW BEHAVIORAL HEALTH", "VANCOUVER", "MARK SMITH"],
+]
+
+def seed(conn):
+    conn.execute("CREATE TABLE providers (npi VARCHAR PRIMARY KEY, name VARCHAR, taxonomy_desc VARCHAR, city VARCHAR, state VARCHAR, auth_official_name VARCHAR, last_updated TIMESTAMP DEFAULT now())")
+    conn.executemany("INSERT INTO providers (npi, name, city, auth_official_name) VALUES (?, ?, ?, ?)", PROVIDERS)
+
+def npis(results):
+    return [r["npi"] for r in results]
+
+def test_npi_prefix_and_fuzzy_names():
+    conn = duckdb.connect()
+    seed(conn)
+    index = SearchIndex()
+    assert index.refresh(conn) == 4
+
+    assert npis(index.search("12345")) == ["1234500000", "1234567890"]
+    assert npis(index.search("1234 567")) == ["1234567890"]
+    # Typeahead prefix, typo, official and city matches
+    assert npis(index.search("camas ped"))[0] == "1234500000"
+    assert npis(index.search("riverveiw behavoral"))[0] == "1888888888"
+    assert index.search("vancover family")[0]["match"] == "name"
+    smith = index.search("smith")
+    assert npis(smith)[:1] == ["1999999999"] and {"1234500000", "1888888888"} <= set(npis(smith))
+    assert npis(index.search("ba")) == ["1999999999"]
+    assert index.search("zzzzzz") == []
+
+def test_incremental_refresh():
+    conn = duckdb.connect()
+    seed(conn)
+    index = SearchIndex()
+    index.refresh(conn)
+    conn.execute("UPDATE providers SET name = 'NORTHWEST PEDIATRIC CLINIC', last_updated = now() + INTERVAL 1 MINUTE WHERE npi = '1234500000'")
+    # Only rows updated since the last refresh are reindexed
+    assert index.refresh(conn) < 4
+    assert index.search("northwest")[0]["name"] == "NORTHWEST PEDIATRIC CLINIC"
+    assert "pediatrics" not in index.postings
+
+    conn.execute("DELETE FROM providers WHERE npi = '1999999999'")
+    index.refresh(conn)
+    assert "1999999999" not in npis(index.search("smithson"))
+
+def test_search_endpoint(tmp_settings):
+    init_db()
+    conn = duckdb.connect(settings.DB_PATH)
+    conn.executemany("INSERT INTO providers (npi, name, city, auth_official_name) VALUES (?, ?, ?, ?)", PROVIDERS)
+    conn.close()
+    publish_generation()
+    with TestClient(app) as client:
+        assert npis(client.get("/api/search", params={"q": "behavioral"}).json()) == ["1888888888"]
+        assert client.get("/api/search", params={"q": "1888"}).json()[0]["name"] == "RIVERVIEW BEHAVIORAL HEALTH"
+        assert client.get("/api/search", params={"q": ""}).status_code == 422
@@ -0,0 +1,38 @@
+import random
+
+import duckdb
+import pytest
+
+from src.analysis.sketches import QuantileSketch
+
+def test_small_groups_are_exact():
+    rng = random.Random(7)
+    values = [round(rng.lognormvariate(8, 1), 2) for _ in range(120)] + [5000.0] * 10
+    sketch = QuantileSketch().update(values)
+
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE t AS SELECT UNNEST(?) AS v", [values])
+    median, mad = conn.execute("SELECT MEDIAN(v), MAD(v) FROM t").fetchone()
+    ranks = conn.execute("SELECT v, PERCENT_RANK() OVER (ORDER BY v) FROM t").fetchall()
+
+    assert sketch.median() == median
+    assert sketch.mad() == pytest.approx(mad)
+    assert all(sketch.percent_rank(v) == pytest.approx(p) for v, p in ranks)
+    floor = sketch.rank_floor(0.99)
+    assert all((p >= 0.99) == (v > floor) for v, p in ranks)
+
+def test_large_groups_merge_across_periods():
+    rng = random.Random(11)
+    months = [[rng.lognormvariate(5, 1) for _ in range(20000)] for _ in range(3)]
+    merged = QuantileSketch()
+    for month in months:
+        blob = QuantileSketch().update(month).to_bytes()
+        merged.merge(QuantileSketch.from_bytes(blob))
+
+    everything = sorted(v for month in months for v in month)
+    assert not merged.exact
+    assert merged.count == len(everything)
+    assert len(merged.to_bytes()) < 8 * 1024
+    assert merged.median() == pytest.approx(everything[len(everything) // 2], rel=0.01)
+    p99 = everything[int(0.99 * len(everything))]
+    assert merged.percent_rank(p99) == pytest.approx(0.99, abs=0.002)
@@ -1,13 +1,62 @@
 const API_BASE = "/api";
+// Always revalidate: the API answers 304 via ETag until the pipeline refreshes the data
+const FETCH_OPTIONS = { cache: 'no-cache' };
 
 async function init() {
+    document.getElementById('provider-search').addEventListener('input', onSearchInput);
     await loadStats();
     await loadFlaggedProviders();
 }
 
+let searchTimer = null;
+// Bumped on every keystroke: responses to older searches are dropped
+let searchSeq = 0;
+
+function onSearchInput(event) {
+    clearTimeout(searchTimer);
+    const q = event.target.value.trim();
+    const seq = ++searchSeq;
+    searchTimer = setTimeout(() => q ? searchProviders(q, seq) : loadFlaggedProviders(), 150);
+}
+
+// Search results hold user input and registry text, so they are built as text nodes
+function textElement(tag, className, text) {
+    const el = document.createElement(tag);
+    el.className = className;
+    el.textContent = text;
+    return el;
+}
+
+function searchResultRow(p) {
+    const row = document.createElement('div');
+    row.className = 'p-4 hover:bg-indigo-50 cursor-pointer transition-colors';
+    row.addEventListener('click', () => showProvider(p.npi));
+    row.append(
+        textElement('div', 'font-bold text-slate-800 line-clamp-1', p.name || 'Unknown Provider'),
+        textElement('div', 'text-xs text-slate-500 truncate', `${p.taxonomy_desc || 'No Specialty'} · ${p.city || ''}`),
+        textElement('span', 'text-[10px] text-slate-400 font-mono', `NPI: ${p.npi}`),
+    );
+    return row;
+}
+
+async function searchProviders(q, seq) {
+    const list = document.getElementById('provider-list');
+    try {
+        const res = await fetch(`${API_BASE}/search?q=${encodeURIComponent(q)}`);
+        const matches = await res.json();
+        if (seq !== searchSeq) return;
+        list.replaceChildren(...(matches.length
+            ? matches.map(searchResultRow)
+            : [textElement('div', 'p-4 text-slate-400', `No providers match "${q}"`)]));
+    } catch (err) {
+        if (seq !== searchSeq) return;
+        list.replaceChildren(textElement('div', 'p-4 text-rose-500', 'Search failed'));
+    }
+}
+
 async function loadStats() {
     try {
-        const res = await fetch(`${API_BASE}/summary`);
+        const res = await fetch(`${API_BASE}/summary`, FETCH_OPTIONS);
         const data = await res.json();
         document.getElementById('total-spend').textContent = new Intl.NumberFormat('en-US', { style: 'currency', currency: 'USD' }).format(data.total_spend);
         document.getElementById('total-providers').textContent = data.total_providers.toLocaleString();
@@ -20,7 +69,7 @@ async function loadStats() {
 async function loadFlaggedProviders() {
     const list = document.getElementById('provider-list');
     try {
-        const res = await fetch(`${API_BASE}/flagged-providers`);
+        const res = await fetch(`${API_BASE}/flagged-providers`, FETCH_OPTIONS);
         const providers = await res.json();
 
         list.innerHTML = providers.map(p => `
@@ -46,7 +95,7 @@ async function showProvider(npi) {
     detail.innerHTML = `<div class="p-8 text-center">Loading details...</div>`;
 
     try {
-        const res = await fetch(`${API_BASE}/provider/${npi}`);
+        const res = await fetch(`${API_BASE}/provider/${npi}`, FETCH_OPTIONS);
         const data = await res.json();
         const p = data.details;
 